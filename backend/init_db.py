@@ -61,6 +61,18 @@ async def init_db():
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='聊天记录表';
         """)
         
+        # 创建会话摘要表
+        await cur.execute("""
+            CREATE TABLE IF NOT EXISTS robot_session_summaries (
+                session_id INT PRIMARY KEY COMMENT '会话ID，关联robot_sessions表',
+                summary TEXT COMMENT '截至last_record_id的对话摘要',
+                last_record_id INT NOT NULL DEFAULT 0 COMMENT '已并入摘要的最后一条聊天记录ID',
+                summarized_turns INT NOT NULL DEFAULT 0 COMMENT '已并入摘要的对话轮数',
+                updated_at TIMESTAMP COMMENT '更新时间',
+                FOREIGN KEY (session_id) REFERENCES robot_sessions(session_id) ON DELETE CASCADE
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='机器人会话摘要表';
+        """)
+        
         # 创建验证码表
         await cur.execute("""
             CREATE TABLE IF NOT EXISTS verification_codes (
@@ -1725,7 +1725,7 @@ async def update_dietary_record(id: int, record: DietaryRecord, current_user: di
         async with conn.cursor() as cur:
             await cur.execute(
                 """
-                UPDATE dietary_records SET meal_type = %s, food_items = %s, calories = %s, protein = %s, carbs = %s, fat = %s, satisfaction = %s, notes = %s, recorded_at = %s
+                UPDATE dietary_records SET meal_type = %s, food_items = %s, calories = %s, protein = %s, carbs = %s, fat = %s, satisfaction = %s, notes = %s, recorded_at = %s, updated_at = NOW()
                 WHERE id = %s AND user_id = %s
                 """,
                 (record.meal_type, record.food_items, record.calories, record.protein, record.carbs, record.fat, record.satisfaction, record.notes, record.recorded_at, id, current_user['user_id'])
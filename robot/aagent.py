@@ -1,13 +1,18 @@
-from typing import Annotated, Dict, Any, List, Optional
+from typing import Annotated, Any, Awaitable, Callable, Dict, List, Optional, Tuple
 from typing_extensions import TypedDict
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
+from langgraph.types import StreamWriter
 from langchain_core.messages import ToolMessage, AIMessage, HumanMessage, BaseMessage
+from langchain_core.runnables import RunnableConfig
 from langchain.tools import Tool
 import sys
 from pathlib import Path
 import asyncio
 import json
+import os
+import time
+from collections import Counter
 
 # 添加项目根目录到Python路径
 ROOT_DIR = Path(__file__).resolve().parent.parent
@@ -15,6 +20,8 @@ if str(ROOT_DIR) not in sys.path:
     sys.path.append(str(ROOT_DIR))
 
 from robot.tools import tools
+from robot.tools.tool_cache import ainvoke_cached
+from robot.retrieval import Histogram
 from robot import globals
 import logging
 import traceback
@@ -26,10 +33,34 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 按模型名称缓存的 (模型实例, 绑定了工具的模型)
+_bound_models: Dict[str, Tuple[Any, Any]] = {}
+
+# 编译后的对话图，不含检查点等会话状态，可在并发的对话之间共享
+_compiled_graph = None
+
 # 绑定工具到模型
 def get_model_with_tools():
-    """获取绑定了工具的模型实例"""
-    return globals.current_model.bind_tools(tools)
+    """
+    获取绑定了工具的模型实例
+
+    bind_tools 需要把全部工具转换为JSON Schema，按模型名称缓存后每个模型只转换一次；
+    全局模型实例被替换（切换模型）后自动重新绑定。
+    """
+    name = globals.current_model_name
+    cached = _bound_models.get(name)
+    if cached is None or cached[0] is not globals.current_model:
+        cached = (globals.current_model, globals.current_model.bind_tools(tools))
+        _bound_models[name] = cached
+        logger.info(f"已为模型 {name} 绑定 {len(tools)} 个工具")
+    return cached[1]
+
+def invalidate_model_cache(model_name: Optional[str] = None):
+    """清除绑定了工具的模型缓存，model_name 为None时清除全部"""
+    if model_name is None:
+        _bound_models.clear()
+    else:
+        _bound_models.pop(model_name, None)
 
 class State(TypedDict):
     """对话状态"""
@@ -103,33 +134,214 @@ class ToolResultManager:
         """获取所有工具执行结果"""
         return self.results
 
+# 未在 ToolTimeout 中声明的工具的默认超时（秒）
+TOOL_TIMEOUT = float(os.getenv("ROBOT_TOOL_TIMEOUT", 20))
+
+# 每轮对话的端到端时间预算（秒），从收到消息开始计算
+TURN_DEADLINE = float(os.getenv("ROBOT_TURN_DEADLINE", 60))
+
+# 为最终回答预留的时间（秒）：剩余时间不足时不再调用工具，直接根据已有结果生成最终回答
+FINAL_ANSWER_RESERVE = float(os.getenv("ROBOT_FINAL_ANSWER_RESERVE", 15))
+
+# 每轮对话中 chatbot→tools 循环的最大次数，达到后强制生成最终回答
+MAX_TOOL_ROUNDS = int(os.getenv("ROBOT_MAX_TOOL_ROUNDS", 5))
+
+# 强制生成最终回答时追加的系统提示
+FORCE_FINAL_PROMPT = "本轮对话的处理时间或工具调用次数已达上限，请不要再调用任何工具，直接根据上面已有的工具结果给出最终回答。"
+
+class ToolTimeout:
+    """工具超时定义（秒）"""
+    TIMEOUTS = {
+        "chat_history": 10,
+        "generate_personalized_advice": 10,
+        "query_food_relations": 10,  # Neo4j查询
+        "query_seasonal_foods": 10,
+        "query_therapeutic_foods": 10,
+        "retrieve": 20,  # 首次调用可能需要等待嵌入模型和索引加载
+        "search": 15,  # Tavily外部搜索
+        "image_parser": 30,
+        "save_health_advice": 10
+    }
+
+    @staticmethod
+    def get_timeout(tool_name: str) -> float:
+        return ToolTimeout.TIMEOUTS.get(tool_name, TOOL_TIMEOUT)
+
+class AgentMetrics:
+    """智能体的超时与强制结束统计，用于对照p99延迟调整时间预算"""
+    def __init__(self):
+        self.tool_timeouts: Counter = Counter()  # 按工具统计的超时次数
+        self.tool_deadline_skips = 0  # 因剩余时间不足未执行的工具调用数
+        self.llm_timeouts = 0  # 模型调用超时次数
+        self.forced_completions: Counter = Counter()  # 按原因统计的强制生成最终回答次数
+        self.turn_latency = Histogram([0.5, 1, 2, 5, 10, 15, 20, 30, 45, 60, 90, 120])  # 每轮耗时（秒）
+        self.time_to_first_token = Histogram([0.25, 0.5, 1, 2, 3, 5, 10, 20, 30, 60])  # 流式接口的首字延迟（秒）
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "tool_timeouts": dict(self.tool_timeouts),
+            "tool_deadline_skips": self.tool_deadline_skips,
+            "llm_timeouts": self.llm_timeouts,
+            "forced_completions": dict(self.forced_completions),
+            "turn_latency_s": self.turn_latency.snapshot(),
+            "time_to_first_token_s": self.time_to_first_token.snapshot()
+        }
+
+agent_metrics = AgentMetrics()
+
+def get_agent_stats() -> Dict[str, Any]:
+    """返回超时、强制结束次数、每轮耗时与首字延迟分布"""
+    return agent_metrics.snapshot()
+
+def remaining_time(config: Optional[Dict[str, Any]]) -> Optional[float]:
+    """本轮对话剩余的时间（秒），配置中没有截止时间时返回None"""
+    deadline = ((config or {}).get("configurable") or {}).get("deadline")
+    return None if deadline is None else deadline - time.monotonic()
+
+# 工具调度的并发上限（同一波内同时执行的工具调用数）
+TOOL_CONCURRENCY = int(os.getenv("ROBOT_TOOL_CONCURRENCY", 4))
+
+class ToolSkipped(Exception):
+    """工具调用因依赖未满足而未执行"""
+
+class ToolScheduler:
+    """
+    按 ToolDependency 构建依赖图，分波并发执行一批工具调用
+
+    依赖工具在同一批中时，等待它执行完成（不论成功与否）后再执行；不在本批中时要求
+    之前已执行过（completed_tools），否则该调用及依赖它的调用被跳过。没有依赖关系的
+    调用位于同一波，用 asyncio.gather 并发执行，信号量限制同时执行的数量，波内按
+    ToolPriority 依次启动。结果按调用的原始顺序返回。
+    """
+
+    def __init__(
+        self,
+        concurrency: int = TOOL_CONCURRENCY,
+        get_dependencies: Callable[[str], List[str]] = ToolDependency.get_dependencies
+    ):
+        self.concurrency = max(1, concurrency)
+        self.get_dependencies = get_dependencies
+
+    def plan(self, names: List[str], completed_tools: set) -> Tuple[List[List[int]], Dict[int, str]]:
+        """
+        将工具调用划分为依次执行的波
+
+        Args:
+            names: 各调用的工具名称
+            completed_tools: 之前已执行过的工具
+
+        Returns:
+            (waves, skipped) - 每一波的调用下标（按优先级排序），以及被跳过的调用下标与原因
+        """
+        positions: Dict[str, List[int]] = {}
+        for i, name in enumerate(names):
+            positions.setdefault(name, []).append(i)
+
+        upstream: Dict[int, List[int]] = {}
+        skipped: Dict[int, str] = {}
+        for i, name in enumerate(names):
+            upstream[i] = []
+            for dep in self.get_dependencies(name):
+                if dep in positions:
+                    upstream[i].extend(j for j in positions[dep] if j != i)
+                elif dep not in completed_tools:
+                    skipped[i] = f"依赖的工具 {dep} 尚未执行"
+
+        # 依赖的调用被跳过时，依赖它的调用同样跳过
+        changed = True
+        while changed:
+            changed = False
+            for i in upstream:
+                if i not in skipped and any(j in skipped for j in upstream[i]):
+                    skipped[i] = "依赖的工具调用被跳过"
+                    changed = True
+
+        # 按拓扑顺序分层：每一波只包含依赖已在之前各波中执行的调用
+        waves: List[List[int]] = []
+        placed = set()
+        remaining = [i for i in range(len(names)) if i not in skipped]
+        while remaining:
+            wave = [i for i in remaining if all(j in placed for j in upstream[i])]
+            if not wave:
+                for i in remaining:
+                    skipped[i] = "工具之间存在循环依赖"
+                break
+            waves.append(sorted(wave, key=lambda i: ToolPriority.get_priority(names[i])))
+            placed.update(wave)
+            remaining = [i for i in remaining if i not in placed]
+        return waves, skipped
+
+    async def run(
+        self,
+        names: List[str],
+        invoke: Callable[[int], Awaitable[Any]],
+        completed_tools: Optional[set] = None
+    ) -> List[Any]:
+        """
+        执行一批工具调用
+
+        Args:
+            names: 各调用的工具名称
+            invoke: 按调用下标执行一次工具调用的协程函数
+            completed_tools: 之前已执行过的工具，本批成功执行的工具会加入其中
+
+        Returns:
+            与 names 顺序一致的结果；执行失败的调用对应其异常，被跳过的调用对应 ToolSkipped
+        """
+        completed_tools = set() if completed_tools is None else completed_tools
+        waves, skipped = self.plan(names, completed_tools)
+        results: List[Any] = [None] * len(names)
+        for i, reason in skipped.items():
+            logger.warning(f"Tool {names[i]} skipped: {reason}")
+            results[i] = ToolSkipped(reason)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_one(i: int):
+            async with semaphore:
+                try:
+                    results[i] = await invoke(i)
+                    completed_tools.add(names[i])
+                except Exception as e:
+                    results[i] = e
+
+        for number, wave in enumerate(waves, 1):
+            logger.info(f"Tools: wave {number}/{len(waves)} - {[names[i] for i in wave]}")
+            await asyncio.gather(*(run_one(i) for i in wave))
+        return results
+
 async def execute_tools(tools: List[Tool], query: str) -> str:
-    """执行工具链"""
+    """
+    执行工具链
+
+    各工具以查询文本为参数，由 ToolScheduler 按依赖关系分波并发执行；
+    save_health_advice 依赖其他全部工具，在最后一波执行并取用检索结果。
+    """
     result_manager = ToolResultManager()
-    
-    # 按优先级排序工具
-    sorted_tools = sorted(tools, key=lambda x: ToolPriority.get_priority(x.name))
-    
-    for tool in sorted_tools:
-        # 检查依赖是否满足
-        dependencies = ToolDependency.get_dependencies(tool.name)
-        if not all(result_manager.get_result(dep) for dep in dependencies):
-            continue
-            
-        # 执行工具
-        print(f"正在执行工具: {tool.name}")  # 添加日志记录
+    names = [tool.name for tool in tools]
+
+    def get_dependencies(tool_name: str) -> List[str]:
+        if tool_name == "save_health_advice":
+            return [name for name in names if name != tool_name]
+        return ToolDependency.get_dependencies(tool_name)
+
+    async def invoke(i: int):
+        tool = tools[i]
+        logger.info(f"正在执行工具: {tool.name}")
         if tool.name == "save_health_advice":
             # 特殊处理save_health_advice，传入其他工具的结果
-            result = await tool(
-                content=query,
-                personalized_advice=result_manager.get_result("get_personalized_advice"),
-                retrieve_results=result_manager.get_result("retrieve")
-            )
+            retrieve_results = result_manager.get_result("retrieve")
+            result = await tool.ainvoke({
+                "content": query,
+                "recommended_foods": None if retrieve_results is None else str(retrieve_results)
+            })
         else:
-            result = await tool(query)
-            
+            result = await tool.ainvoke(query)
         result_manager.add_result(tool.name, result)
-    
+        return result
+
+    await ToolScheduler(get_dependencies=get_dependencies).run(names, invoke)
+
     # 返回最终结果
     return result_manager.get_result("save_health_advice")
 
@@ -173,7 +385,29 @@ def get_next_step(state: State) -> str:
         logger.error(f"Router error: {str(e)}\n{traceback.format_exc()}")
         return "error_handler"
 
-async def chatbot_node(state: State, config: Dict[str, Any]):
+def count_tool_rounds(messages: List[BaseMessage]) -> int:
+    """最后一条用户消息之后模型发起工具调用的次数"""
+    rounds = 0
+    for msg in reversed(messages):
+        if isinstance(msg, HumanMessage):
+            break
+        if isinstance(msg, AIMessage) and msg.tool_calls:
+            rounds += 1
+    return rounds
+
+def fallback_answer(messages: List[BaseMessage]) -> AIMessage:
+    """时间预算用尽、模型无法再生成回答时，直接返回本轮已有的工具结果"""
+    results = []
+    for msg in reversed(messages):
+        if isinstance(msg, HumanMessage):
+            break
+        if isinstance(msg, ToolMessage) and msg.status != "error" and msg.content:
+            results.append(msg.content)
+    if not results:
+        return AIMessage(content="抱歉，本轮处理超时，请稍后重试或简化问题。")
+    return AIMessage(content="抱歉，本轮处理超时，以下是已查询到的相关信息：\n\n" + "\n\n".join(reversed(results)))
+
+async def chatbot_node(state: State, config: RunnableConfig):
     """对话节点：处理用户输入并生成回复"""
     try:
         logger.info("Chatbot: Processing input")
@@ -200,9 +434,36 @@ async def chatbot_node(state: State, config: Dict[str, Any]):
             None
         )
         
-        # 获取当前绑定了工具的模型实例
-        model_with_tools = get_model_with_tools()
-        response = await model_with_tools.ainvoke(messages)
+        # 剩余时间不足或工具循环次数达到上限时，不再绑定工具，强制根据已有结果生成最终回答
+        remaining = remaining_time(config)
+        force_reason = None
+        if remaining is not None and remaining <= FINAL_ANSWER_RESERVE:
+            force_reason = "deadline"
+        elif count_tool_rounds(messages) >= MAX_TOOL_ROUNDS:
+            force_reason = "max_tool_rounds"
+
+        if force_reason:
+            agent_metrics.forced_completions[force_reason] += 1
+            logger.warning(f"Chatbot: forcing final answer ({force_reason}), remaining time: {remaining}")
+            model = globals.current_model
+            # 以追加的用户消息给出指示：GLM等接口不接受（或忽略）不在开头的系统消息；
+            # 该消息只用于本次调用，不写入对话状态
+            model_input = messages + [HumanMessage(content=FORCE_FINAL_PROMPT)]
+        else:
+            # 获取当前绑定了工具的模型实例
+            model = get_model_with_tools()
+            model_input = messages
+
+        if remaining is not None and remaining <= 0:
+            response = fallback_answer(messages)
+        else:
+            try:
+                response = await asyncio.wait_for(model.ainvoke(model_input), timeout=remaining)
+            except asyncio.TimeoutError:
+                agent_metrics.llm_timeouts += 1
+                agent_metrics.forced_completions["llm_timeout"] += 1
+                logger.warning("Chatbot: model call exceeded the turn deadline")
+                response = fallback_answer(messages)
             
         logger.info(f"Chatbot: Generated response - {response}")
         
@@ -225,8 +486,14 @@ async def chatbot_node(state: State, config: Dict[str, Any]):
             "completed_tools": state.get("completed_tools", set())
         }
 
-async def tools_node(state: State):
-    """工具节点：处理工具调用"""
+async def tools_node(state: State, config: RunnableConfig, writer: StreamWriter):
+    """
+    工具节点：处理工具调用
+
+    每个工具调用的超时取 ToolTimeout 与本轮剩余时间（扣除为最终回答预留的时间）中较小者，
+    超时的调用被取消并返回超时信息；剩余时间已不足时不再执行工具。
+    以 stream_mode="custom" 流式执行时，每个调用开始和结束时各发出一个进度事件。
+    """
     try:
         logger.info("Tools: Processing tool calls")
         new_messages = []
@@ -237,62 +504,72 @@ async def tools_node(state: State):
             state["completed_tools"] = set()
         
         if hasattr(last_message, "tool_calls"):
-            # 按优先级排序工具调用
-            sorted_tool_calls = sorted(
-                last_message.tool_calls,
-                key=lambda x: ToolPriority.get_priority(x["name"])
-            )
-            
-            for tool_call in sorted_tool_calls:
+            tool_calls = last_message.tool_calls
+            names = [tool_call["name"] for tool_call in tool_calls]
+
+            async def invoke(i: int):
+                tool_call = tool_calls[i]
+                # 获取参数
+                if "args" in tool_call:
+                    arguments = tool_call["args"]
+                else:
+                    arguments = json.loads(tool_call["function"]["arguments"])
+
+                logger.info(f"Tools: Processing {names[i]} with args {arguments}")
+
+                tool = next((t for t in tools if t.name == names[i]), None)
+                if not tool:
+                    raise ValueError(f"未找到工具: {names[i]}")
+                timeout = ToolTimeout.get_timeout(names[i])
+                remaining = remaining_time(config)
+                if remaining is not None:
+                    timeout = min(timeout, remaining - FINAL_ANSWER_RESERVE)
+                if timeout <= 0:
+                    agent_metrics.tool_deadline_skips += 1
+                    writer({"type": "tool_end", "tool": names[i], "status": "skipped", "elapsed_ms": 0})
+                    raise ToolSkipped("本轮剩余时间不足")
+                writer({"type": "tool_start", "tool": names[i]})
+                started_at = time.monotonic()
+                status = "error"
                 try:
-                    tool_name = tool_call["name"]
-                    
-                    # 检查依赖是否满足
-                    dependencies = ToolDependency.get_dependencies(tool_name)
-                    if dependencies:
-                        # 检查是否所有依赖工具都已执行（不论结果如何）
-                        deps_met = all(dep in state["completed_tools"] for dep in dependencies)
-                        if not deps_met:
-                            logger.warning(f"Tool {tool_name} dependencies not met, skipping")
-                            continue
-                    
-                    # 获取参数
-                    if "args" in tool_call:
-                        arguments = tool_call["args"]
-                    else:
-                        arguments = json.loads(tool_call["function"]["arguments"])
-                        
-                    logger.info(f"Tools: Processing {tool_name} with args {arguments}")
-                    
-                    tool = next((t for t in tools if t.name == tool_name), None)
-                    if not tool:
-                        raise ValueError(f"未找到工具: {tool_name}")
-                        
-                    tool_response = await tool.ainvoke(arguments)
-                    
-                    # 记录工具执行完成
-                    state["completed_tools"].add(tool_name)
-                    logger.info(f"Tool {tool_name} completed. Current completed tools: {state['completed_tools']}")
-                    
-                    new_messages.append(
-                        ToolMessage(
-                            tool_call_id=tool_call.get("id", ""),
-                            content=str(tool_response),
-                            tool_name=tool_name,
-                        )
-                    )
-                                
-                except Exception as e:
-                    error_msg = f"工具 {tool_name} 执行失败: {str(e)}"
-                    logger.error(error_msg)
-                    new_messages.append(
-                        ToolMessage(
-                            tool_call_id=tool_call.get("id", ""),
-                            content=error_msg,
-                            tool_name=tool_name,
-                        )
+                    # 声明了缓存策略的工具先查跨轮次的结果缓存；按用户区分的工具从本轮配置中取用户ID
+                    result = await asyncio.wait_for(ainvoke_cached(tool, arguments, config), timeout=timeout)
+                    status = "success"
+                    return result
+                except asyncio.TimeoutError:
+                    agent_metrics.tool_timeouts[names[i]] += 1
+                    status = "timeout"
+                    raise TimeoutError(f"超过 {timeout:.1f} 秒未返回，已取消")
+                finally:
+                    writer({
+                        "type": "tool_end",
+                        "tool": names[i],
+                        "status": status,
+                        "elapsed_ms": round((time.monotonic() - started_at) * 1000)
+                    })
+
+            # 按依赖关系分波并发执行，结果与调用顺序一致
+            results = await ToolScheduler().run(names, invoke, state["completed_tools"])
+            logger.info(f"Tools completed. Current completed tools: {state['completed_tools']}")
+
+            for tool_call, tool_name, result in zip(tool_calls, names, results):
+                status = "error"
+                if isinstance(result, ToolSkipped):
+                    content = f"工具 {tool_name} 未执行: {str(result)}"
+                elif isinstance(result, Exception):
+                    content = f"工具 {tool_name} 执行失败: {str(result)}"
+                    logger.error(content)
+                else:
+                    content, status = str(result), "success"
+                new_messages.append(
+                    ToolMessage(
+                        tool_call_id=tool_call.get("id", ""),
+                        content=content,
+                        tool_name=tool_name,
+                        status=status,
                     )
-            
+                )
+
             return {
                 "messages": state["messages"] + new_messages,
                 "next_step": "chatbot",
@@ -375,6 +652,13 @@ def build_graph():
     logger.info("Compiling graph")
     return graph_builder.compile()
 
+def get_graph():
+    """获取编译后的对话图，首次调用时构建，之后各轮对话复用同一实例"""
+    global _compiled_graph
+    if _compiled_graph is None:
+        _compiled_graph = build_graph()
+    return _compiled_graph
+
 
 
 if __name__ == '__main__':
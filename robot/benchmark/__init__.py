@@ -0,0 +1,4 @@
+"""
+基准测试模块
+提供检索相关组件的性能与质量基准测试脚本
+"""
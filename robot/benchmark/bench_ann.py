@@ -0,0 +1,135 @@
+"""
+IVF近似最近邻索引的召回率/延迟扫描
+
+在不同语料规模下构建 IVFFlatIndex，写入磁盘后以内存映射方式重新加载，再对一组 n_probe 取值报告：
+- recall@k：以精确检索（MatrixVectorStore 的矩阵-向量乘法）的 top-k 为准
+- 单条查询延迟 p50/p99，以及相对精确检索的加速比
+同时报告构建耗时和从磁盘加载的耗时。
+
+向量为合成的聚类数据：在低维隐空间（--latent-dim）中做高斯混合，再随机投影到 --dim 维并L2归一化。
+真实文本嵌入的内在维度远低于名义维度，这样的数据比各向同性的随机向量更接近其分布；
+查询从同一分布中另行采样。1M×768 的float32矩阵约占3GB内存，内存不足时可用 --dim 降低维度。
+
+用法（在项目根目录执行）：
+    python -m robot.benchmark.bench_ann
+    python -m robot.benchmark.bench_ann --sizes 10000 100000 1000000 --probes 1 4 16 64 --k 10
+    python -m robot.benchmark.bench_ann --sizes 1000000 --dim 256 --lists 2000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from robot.retrieval import IVFFlatIndex, normalize_rows, top_k_indices
+
+
+def clustered_vectors(
+    n: int,
+    centers: np.ndarray,
+    projection: np.ndarray,
+    noise: float,
+    rng: np.random.Generator
+) -> np.ndarray:
+    """在隐空间中从以 centers 为中心的高斯混合采样n个点，投影后归一化，分块生成以限制峰值内存"""
+    latent_dim, dim = projection.shape
+    vectors = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, 100000):
+        size = min(100000, n - start)
+        latent = centers[rng.integers(len(centers), size=size)]
+        latent += rng.standard_normal((size, latent_dim), dtype=np.float32) * (noise / np.sqrt(latent_dim))
+        vectors[start:start + size] = normalize_rows(latent @ projection)
+    return vectors
+
+
+def measure(search: Callable[[np.ndarray], List[int]], queries: np.ndarray) -> Tuple[List[List[int]], List[float]]:
+    """逐条执行查询，返回结果行号与耗时（秒）"""
+    search(queries[0])  # 预热
+    results, samples = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(search(query))
+        samples.append(time.perf_counter() - start)
+    return results, samples
+
+
+def percentile_ms(samples: List[float], q: float) -> float:
+    """计算延迟分位数（毫秒）"""
+    return float(np.percentile(samples, q) * 1000)
+
+
+def sweep(size: int, args, rng: np.random.Generator):
+    """对一个语料规模构建、保存并重新加载索引，扫描 n_probe"""
+    centers = normalize_rows(rng.standard_normal((args.clusters, args.latent_dim), dtype=np.float32))
+    projection = rng.standard_normal((args.latent_dim, args.dim), dtype=np.float32)
+    vectors = clustered_vectors(size, centers, projection, args.noise, rng)
+    queries = clustered_vectors(args.queries, centers, projection, args.noise, rng)
+
+    start = time.perf_counter()
+    index = IVFFlatIndex.build(vectors, n_lists=args.lists or None, n_iter=args.iterations)
+    build_time = time.perf_counter() - start
+
+    # 写入磁盘后以内存映射方式重新加载，与服务从快照加载的方式一致
+    with tempfile.TemporaryDirectory(prefix="ivf_bench_") as tmp_dir:
+        np.save(os.path.join(tmp_dir, "embeddings.npy"), vectors)
+        for name, array in index.to_arrays().items():
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+        del index, vectors
+        start = time.perf_counter()
+        vectors = np.load(os.path.join(tmp_dir, "embeddings.npy"), mmap_mode='r')
+        arrays = {name[:-4]: np.load(os.path.join(tmp_dir, name), mmap_mode='r')
+                  for name in os.listdir(tmp_dir) if name.startswith("ivf_")}
+        index = IVFFlatIndex.from_arrays(arrays)
+        load_time = time.perf_counter() - start
+        np.asarray(vectors).sum()  # 读入页缓存，避免首轮查询计入磁盘IO
+        np.asarray(index.list_vectors).sum()
+
+        exact, exact_samples = measure(lambda q: top_k_indices(vectors @ q, args.k).tolist(), queries)
+        exact_p50 = percentile_ms(exact_samples, 50)
+        print(f"\n规模 {size}：{index.n_lists} 个聚类，构建 {build_time:.2f}s，加载 {load_time * 1000:.1f}ms，"
+              f"精确检索 p50 {exact_p50:.3f}ms")
+        print(f"{'n_probe':>8}{f'recall@{args.k}':>12}{'p50(ms)':>10}{'p99(ms)':>10}{'加速比':>8}")
+
+        for n_probe in args.probes:
+            if n_probe > index.n_lists:
+                continue
+            approx, samples = measure(
+                lambda q: [row for row, _ in index.search(q, args.k, n_probe=n_probe)], queries
+            )
+            recall = float(np.mean([len(set(a) & set(e)) / len(e) for a, e in zip(approx, exact)]))
+            p50, p99 = percentile_ms(samples, 50), percentile_ms(samples, 99)
+            print(f"{n_probe:>8}{recall:>12.3f}{p50:>10.3f}{p99:>10.3f}{exact_p50 / p50:>8.1f}x")
+        del index, vectors, arrays
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IVF近似最近邻索引的召回率/延迟扫描")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000], help="语料规模")
+    parser.add_argument("--dim", type=int, default=768, help="向量维度")
+    parser.add_argument("--latent-dim", type=int, default=32, help="合成数据的隐空间维度")
+    parser.add_argument("--clusters", type=int, default=1000, help="合成数据的高斯混合分量数")
+    parser.add_argument("--noise", type=float, default=1.0, help="合成数据的噪声强度（相对于中心向量的模长）")
+    parser.add_argument("--lists", type=int, default=0, help="IVF聚类数，0表示取约 sqrt(规模)")
+    parser.add_argument("--iterations", type=int, default=10, help="k-means迭代轮数")
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64], help="扫描的聚类数")
+    parser.add_argument("--queries", type=int, default=200, help="查询数量")
+    parser.add_argument("--k", type=int, default=10, help="recall@k 的k")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"维度: {args.dim}，查询数: {args.queries}，k={args.k}")
+    for size in args.sizes:
+        sweep(size, args, rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+嵌入后端一致性检查与吞吐基准测试
+
+用基准后端（默认torch）和候选后端（默认onnx）分别嵌入RAG语料分块和 rag.TEST_CASES 中的查询，报告：
+- 一致性：同一文本两种后端向量的余弦相似度（均值/最小值），以及以基准后端的 top-5 为准，
+  候选后端检索结果的 recall@5
+- 吞吐：语料批量嵌入的分块/秒，以及单条查询嵌入延迟（p50/p99）
+
+候选后端的配置沿用环境变量，例如检查int8量化模型：
+    RAG_ONNX_QUANTIZED=true python -m robot.benchmark.bench_embedding_backends
+
+用法（在项目根目录执行，需先运行 python -m robot.retrieval.export_onnx）：
+    python -m robot.benchmark.bench_embedding_backends
+    python -m robot.benchmark.bench_embedding_backends --baseline torch --candidate onnx --k 5
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from robot.retrieval import MatrixVectorStore, normalize_rows
+from robot.tools import rag
+
+
+def test_queries() -> List[str]:
+    """展开 rag.TEST_CASES 中的全部查询文本"""
+    queries = []
+    for cases in rag.TEST_CASES.values():
+        for case in cases:
+            queries.append(case['query'] if isinstance(case, dict) else case)
+    return queries
+
+
+def embed_backend(name: str, texts: List[str], queries: List[str]) -> Dict[str, object]:
+    """加载后端并嵌入语料与查询，记录耗时"""
+    start = time.perf_counter()
+    embeddings = rag.load_embedding_backend(name)
+    load_time = time.perf_counter() - start
+
+    embeddings.embed_documents(texts[:8])  # 预热
+    start = time.perf_counter()
+    corpus = normalize_rows(embeddings.embed_documents(texts))
+    corpus_time = time.perf_counter() - start
+
+    query_vectors, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        query_vectors.append(embeddings.embed_query(query))
+        latencies.append(time.perf_counter() - start)
+
+    return {
+        "embeddings": embeddings,
+        "corpus": corpus,
+        "queries": normalize_rows(query_vectors),
+        "load_s": load_time,
+        "docs_per_s": len(texts) / corpus_time,
+        "query_p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "query_p99_ms": float(np.percentile(latencies, 99) * 1000),
+    }
+
+
+def recall_at_k(baseline: Dict[str, object], candidate: Dict[str, object], documents, k: int) -> float:
+    """以基准后端的 top-k 为准，计算候选后端检索结果的平均召回率"""
+    baseline_store = MatrixVectorStore(baseline["embeddings"], documents, baseline["corpus"], normalized=True)
+    candidate_store = MatrixVectorStore(candidate["embeddings"], documents, candidate["corpus"], normalized=True)
+    recalls = []
+    for baseline_query, candidate_query in zip(baseline["queries"], candidate["queries"]):
+        expected = {row for row, _ in baseline_store.search_rows_by_vector(baseline_query, k)}
+        actual = {row for row, _ in candidate_store.search_rows_by_vector(candidate_query, k)}
+        recalls.append(len(expected & actual) / len(expected))
+    return float(np.mean(recalls))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="嵌入后端一致性检查与吞吐基准测试")
+    parser.add_argument("--baseline", default="torch", help="基准后端")
+    parser.add_argument("--candidate", default="onnx", help="候选后端")
+    parser.add_argument("--k", type=int, default=5, help="recall@k 的k")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="查询向量余弦相似度均值下限")
+    parser.add_argument("--min-recall", type=float, default=0.9, help="recall@k 下限")
+    args = parser.parse_args()
+
+    documents = rag.split_corpus()
+    texts = [doc.page_content for doc in documents]
+    queries = test_queries()
+    print(f"语料分块数: {len(texts)}，查询数: {len(queries)}")
+
+    results = {name: embed_backend(name, texts, queries) for name in (args.baseline, args.candidate)}
+    baseline, candidate = results[args.baseline], results[args.candidate]
+
+    print(f"\n{'后端':<10}{'加载(s)':>10}{'分块/秒':>12}{'查询p50(ms)':>14}{'查询p99(ms)':>14}")
+    for name, result in results.items():
+        print(f"{name:<10}{result['load_s']:>10.2f}{result['docs_per_s']:>12.1f}"
+              f"{result['query_p50_ms']:>14.2f}{result['query_p99_ms']:>14.2f}")
+    print(f"语料嵌入加速比: {candidate['docs_per_s'] / baseline['docs_per_s']:.2f}x，"
+          f"查询p50加速比: {baseline['query_p50_ms'] / candidate['query_p50_ms']:.2f}x")
+
+    query_cosine = np.sum(baseline["queries"] * candidate["queries"], axis=1)
+    corpus_cosine = np.sum(baseline["corpus"] * candidate["corpus"], axis=1)
+    recall = recall_at_k(baseline, candidate, documents, args.k)
+    print(f"\n查询向量余弦: 均值 {query_cosine.mean():.4f}，最小 {query_cosine.min():.4f}")
+    print(f"语料向量余弦: 均值 {corpus_cosine.mean():.4f}，最小 {corpus_cosine.min():.4f}")
+    print(f"recall@{args.k}: {recall:.3f}")
+
+    passed = query_cosine.mean() >= args.min_cosine and recall >= args.min_recall
+    print(f"\n一致性检查{'通过' if passed else '未通过'}"
+          f"（阈值: 余弦均值 >= {args.min_cosine}，recall@{args.k} >= {args.min_recall}）")
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+每轮对话的图构建与工具绑定开销
+
+对比两种方式下一轮对话（含 --llm-steps 次LLM调用）在调用模型之前的准备耗时：
+- 每轮重建：build_graph() 构建并编译对话图，每次LLM调用前 bind_tools 转换全部工具的JSON Schema
+- 缓存复用：get_graph() 与 get_model_with_tools()，首次之后直接返回缓存的实例
+
+不发起任何模型请求，只测量构建与绑定本身。
+
+用法（在项目根目录执行）：
+    python -m robot.benchmark.bench_graph_setup
+    python -m robot.benchmark.bench_graph_setup --turns 200 --llm-steps 3
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Callable, List
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from robot import aagent, globals
+from robot.tools import tools
+
+
+def measure(turn: Callable[[], None], turns: int) -> List[float]:
+    """重复执行一轮准备工作，返回每轮耗时（秒）"""
+    samples = []
+    for _ in range(turns):
+        start = time.perf_counter()
+        turn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="每轮对话的图构建与工具绑定开销")
+    parser.add_argument("--turns", type=int, default=100, help="模拟的对话轮数")
+    parser.add_argument("--llm-steps", type=int, default=2, help="每轮的LLM调用次数（chatbot→tools→chatbot为2次）")
+    args = parser.parse_args()
+
+    def rebuild_turn():
+        aagent.build_graph()
+        for _ in range(args.llm_steps):
+            globals.current_model.bind_tools(tools)
+
+    def cached_turn():
+        aagent.get_graph()
+        for _ in range(args.llm_steps):
+            aagent.get_model_with_tools()
+
+    cached_turn()  # 首次构建不计入
+    print(f"模型: {globals.current_model_name}，工具数: {len(tools)}，每轮LLM调用: {args.llm_steps}")
+    print(f"\n{'方式':<10}{'均值(ms)':>10}{'p50(ms)':>10}{'p99(ms)':>10}")
+    results = {}
+    for name, turn in [("每轮重建", rebuild_turn), ("缓存复用", cached_turn)]:
+        samples = np.array(measure(turn, args.turns)) * 1000
+        results[name] = samples.mean()
+        print(f"{name:<10}{samples.mean():>10.3f}{np.percentile(samples, 50):>10.3f}{np.percentile(samples, 99):>10.3f}")
+    print(f"\n每轮节省 {results['每轮重建'] - results['缓存复用']:.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+查询意图识别基准测试
+
+对比逐表遍历关键词（原 match_nutrient_query / filter_and_sort_results / format_results 的做法）
+与 IntentClassifier 一次扫描的单条查询耗时，并核对两者得到的过滤意图是否一致。
+
+查询语料默认使用 rag.py 的测试用例；也可以用 --queries-file 指定日志导出的查询文件（每行一条）。
+
+用法（在项目根目录执行）：
+    python -m robot.benchmark.bench_intent
+    python -m robot.benchmark.bench_intent --queries-file logs/queries.txt --repeat 200
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Callable, List
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from robot.retrieval import parse_range_conditions
+from robot.tools import rag
+
+# 默认查询语料：rag.py 测试用例以及提示词中的示例问法
+DEFAULT_QUERIES = [
+    "高蛋白质的食物有哪些", "低脂肪的食物推荐", "富含维生素C的水果", "高钙的食物", "含铁丰富的食材",
+    "简单快速的家常菜", "适合上班族的快手菜", "新手也能做的菜谱", "半小时能做好的菜", "不用复杂调料的菜",
+    "养胃的食谱", "补气养血的食物", "安神助眠的食材", "清热降火的饮品", "开胃促消化的菜",
+    "适合老年人的养生汤", "孕妇补铁食谱", "儿童补钙食谱", "减肥期间的低脂餐", "熬夜后的调理食谱",
+    "蛋白质大于20克的食物", "脂肪低于5g且热量不超过100的食物", "维生素C含量最高的蔬菜",
+    "我今天应该吃什么", "推荐一道滋阴的汤", "低热量高纤维的早餐",
+]
+
+
+def legacy_classify(query: str):
+    """逐表遍历关键词的原始实现，返回 (营养素排序, 食谱过滤, 中医功效, 是否食谱查询, 标题)"""
+    conditions = parse_range_conditions(query)
+    nutrient_sort = None
+    for keyword, spec in rag.nutrient_keywords.items():
+        if keyword in query:
+            nutrient_sort = spec
+            break
+    if nutrient_sort is None and conditions:
+        field, op, _ = conditions[0]
+        nutrient_sort = (field, op in ('>', '>='))
+
+    recipe_filter = None
+    for keyword, spec in rag.recipe_keywords.items():
+        if keyword in query:
+            recipe_filter = spec
+            break
+
+    tcm_effect = None
+    for effect in rag.tcm_keywords:
+        if effect in query:
+            tcm_effect = effect
+            break
+
+    is_recipe_query = any(word in query for word in rag.RECIPE_QUERY_WORDS)
+
+    if any(keyword in query for keyword in rag.nutrient_mention_words):
+        label = "【营养成分检索结果】"
+    elif any(keyword in query for keyword in ['补气', '养血', '健脾', '养胃', '清热', '滋阴', '安神']):
+        label = "【中医功效检索结果】"
+    elif any(keyword in query for keyword in rag.recipe_mention_words):
+        label = "【食谱检索结果】"
+    else:
+        label = "【综合检索结果】"
+    return nutrient_sort, recipe_filter, tcm_effect, is_recipe_query, label
+
+
+def compiled_classify(query: str):
+    """IntentClassifier 一次扫描"""
+    intent = rag.intent_classifier.classify(query)
+    return intent.sort_spec(), intent.recipe_filter, intent.tcm_effect, intent.is_recipe_query, intent.label(None)
+
+
+def measure_us(classify: Callable[[str], object], queries: List[str], repeat: int) -> List[float]:
+    """重复执行全部查询，返回每轮的单条平均耗时（微秒）"""
+    for query in queries:
+        classify(query)  # 预热
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for query in queries:
+            classify(query)
+        samples.append((time.perf_counter() - start) / len(queries) * 1e6)
+    return samples
+
+
+def load_queries(path: str) -> List[str]:
+    """读取查询文件，每行一条，忽略空行"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查询意图识别基准测试")
+    parser.add_argument("--queries-file", help="查询文件，每行一条（例如从日志导出的用户查询）")
+    parser.add_argument("--repeat", type=int, default=100, help="重复轮数")
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries_file) if args.queries_file else DEFAULT_QUERIES
+    print(f"查询数: {len(queries)}，重复轮数: {args.repeat}")
+
+    # 核对过滤意图（标题以外的部分）是否一致
+    mismatches = [q for q in queries if legacy_classify(q)[:4] != compiled_classify(q)[:4]]
+    print(f"过滤意图不一致的查询: {len(mismatches)}")
+    for query in mismatches[:10]:
+        print(f"  {query}\n    逐表遍历: {legacy_classify(query)[:4]}\n    一次扫描: {compiled_classify(query)[:4]}")
+
+    print(f"{'实现':<12}{'p50(μs)':>12}{'p99(μs)':>12}")
+    for name, classify in (("逐表遍历", legacy_classify), ("一次扫描", compiled_classify)):
+        samples = measure_us(classify, queries, args.repeat)
+        print(f"{name:<12}{np.percentile(samples, 50):>12.2f}{np.percentile(samples, 99):>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
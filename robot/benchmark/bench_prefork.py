@@ -0,0 +1,136 @@
+"""
+多worker内存基准测试：各worker独立加载 vs 主进程预加载后fork
+
+两种方式各启动 --workers 个worker，每个worker执行一轮标注查询（与 bench_retrieval 相同的
+rag.retrieve_documents），让分块文档、缓存等对象被实际访问后，再统计每个worker的：
+- USS：独占内存，即该worker退出后能释放的内存，多开一个worker的实际代价
+- PSS：共享页按进程数均摊后的内存，全部进程的PSS之和即整组服务占用的物理内存
+- RSS：常驻内存，共享页在每个进程中都计入一次
+
+spawn 方式对应 uvicorn 自带的多worker模式（每个worker自行导入并加载全部组件），
+fork 方式对应 run.py 在 ROBOT_WORKERS > 1 时的预加载后fork模式（robot/prefork.py）。
+仅支持Linux（依赖 /proc/<pid>/smaps_rollup 与fork）。
+
+用法（在项目根目录执行）：
+    python -m robot.benchmark.bench_prefork --embedder fake --workers 4
+    python -m robot.benchmark.bench_prefork --embedder torch --workers 4 \
+        --components embeddings corpus_index nutrient_table food_predictor
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+from typing import Any, Dict, List
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from robot.benchmark.bench_retrieval import DEFAULT_QUERIES_FILE, load_cases, run_pass
+
+
+def run_worker(preloaded: bool, components: List[str], cases: List[Dict[str, Any]], ready, release):
+    """worker进程：未预加载时自行加载组件，执行一轮查询后等待主进程统计内存"""
+    from robot.prefork import preload_components
+    from robot.tools import rag
+
+    if not preloaded:
+        preload_components(components)
+
+    async def queries():
+        await run_pass(cases)
+        await rag.close_embedding_batcher()
+
+    asyncio.run(queries())
+    ready.put(os.getpid())
+    release.wait()
+
+
+def supervise(mode: str, workers: int, components: List[str], cases: List[Dict[str, Any]], results):
+    """在独立进程中按指定方式启动worker，统计各进程内存后放入results"""
+    from robot.prefork import preload_components, worker_memory_report
+    from robot.retrieval import process_memory
+
+    if mode == "fork":
+        preload_components(components)
+    context = multiprocessing.get_context(mode)
+    ready, release = context.Queue(), context.Event()
+    processes = [
+        context.Process(target=run_worker, args=(mode == "fork", components, cases, ready, release))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    pids = [ready.get() for _ in processes]
+    report = worker_memory_report(pids)
+    master = {name: round(value, 1) for name, value in process_memory().items()}
+    release.set()
+    for process in processes:
+        process.join()
+    results.put({"workers": report, "master": master})
+
+
+def measure(mode: str, workers: int, components: List[str], cases: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """以全新的监管进程测量一种启动方式，避免两种方式互相影响"""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=supervise, args=(mode, workers, components, cases, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def prepare_index(components: List[str]):
+    """预先构建索引快照，避免各worker同时构建"""
+    from robot.tools import resources
+
+    resources.preload([name for name in components if name == "corpus_index"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多worker内存基准测试：独立加载 vs 预加载后fork")
+    parser.add_argument("--embedder", default="fake", choices=["fake", "torch", "onnx"], help="嵌入后端")
+    parser.add_argument("--workers", type=int, default=4, help="worker数量")
+    parser.add_argument("--components", nargs="+", default=["embeddings", "corpus_index", "nutrient_table"],
+                        help="预加载的组件")
+    parser.add_argument("--modes", nargs="+", default=["spawn", "fork"], choices=["spawn", "fork"], help="启动方式")
+    parser.add_argument("--queries-file", default=DEFAULT_QUERIES_FILE, help="标注查询集")
+    parser.add_argument("--index-dir", help="索引快照目录，fake后端默认使用临时目录")
+    args = parser.parse_args()
+
+    # rag.py 在导入时读取配置，需先设置环境变量（子进程继承）
+    os.environ["RAG_EMBEDDING_BACKEND"] = args.embedder
+    if args.index_dir:
+        os.environ["RAG_INDEX_DIR"] = args.index_dir
+    elif args.embedder == "fake":
+        os.environ["RAG_INDEX_DIR"] = tempfile.mkdtemp(prefix="rag_bench_index_")
+
+    cases = load_cases(args.queries_file)
+    context = multiprocessing.get_context("spawn")
+    process = context.Process(target=prepare_index, args=(args.components,))
+    process.start()
+    process.join()
+
+    print(f"worker数: {args.workers}，嵌入后端: {args.embedder}，组件: {', '.join(args.components)}")
+    print(f"\n{'方式':<8}{'USS均值(MB)':>14}{'PSS均值(MB)':>14}{'RSS均值(MB)':>14}{'主进程RSS(MB)':>16}{'PSS合计(MB)':>14}")
+    for mode in args.modes:
+        result = measure(mode, args.workers, args.components, cases)
+        workers = result["workers"]
+        if not workers:
+            print(f"{mode:<8}无法读取进程内存（仅支持Linux）")
+            continue
+        mean = {name: float(np.mean([w[name] for w in workers])) for name in ("uss", "pss", "rss")}
+        # 预加载的主进程常驻期间同样占用内存，计入合计
+        total = sum(w["pss"] for w in workers) + (result["master"].get("pss", 0.0) if mode == "fork" else 0.0)
+        print(f"{mode:<8}{mean['uss']:>14.1f}{mean['pss']:>14.1f}{mean['rss']:>14.1f}"
+              f"{result['master'].get('rss', 0.0):>16.1f}{total:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+检索质量与延迟基准测试
+
+用标注查询集（labeled_queries.json：营养素、食谱、中医功效、过敏原四类，附期望命中的食物名称/菜名）
+调用 rag.retrieve_documents，报告：
+- 质量：recall@5、MRR，以及过敏原查询的违规结果数（返回了含排除过敏原的文档），按类别和整体汇总
+- 延迟：冷启动（清空查询向量缓存与结果缓存后的首轮）与热运行（重复查询）的 p50/p95/p99
+
+结果写入JSON（含提交号、嵌入后端和逐条查询明细），可用 --baseline 与之前的结果对比，
+评估分块、候选数量（RAG_RETRIEVE_CANDIDATES）或过滤逻辑的改动。
+
+--embedder fake 使用确定性的假嵌入，无需下载模型即可离线运行（向量检索近似随机，排序主要由
+BM25与营养成分表决定，适合在CI中发现回退）；此时索引快照写入临时目录，不影响正式快照。
+--embedder torch / onnx 使用真实模型，复用正式的索引快照。
+
+用法（在项目根目录执行）：
+    python -m robot.benchmark.bench_retrieval --embedder fake --output bench_fake.json
+    python -m robot.benchmark.bench_retrieval --embedder torch --output after.json --baseline before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+DEFAULT_QUERIES_FILE = os.path.join(os.path.dirname(__file__), 'labeled_queries.json')
+
+
+def load_cases(path: str) -> List[Dict[str, Any]]:
+    """读取标注查询集"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)['cases']
+
+
+def git_commit() -> Optional[str]:
+    """当前提交号，工作区有未提交改动时加 -dirty 后缀；不在git仓库中时返回None"""
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=project_root, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+        dirty = subprocess.check_output(
+            ['git', 'status', '--porcelain', '--untracked-files=no'], cwd=project_root, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def document_name(doc) -> str:
+    """文档对应的食物名称或菜名"""
+    return str(doc.metadata.get('食物名称') or doc.metadata.get('菜名') or '')
+
+
+def score_case(case: Dict[str, Any], docs, k: int) -> Dict[str, Any]:
+    """计算单条查询的 recall@k、倒数排名和过敏原违规数"""
+    from robot.tools import rag
+
+    names = [document_name(doc) for doc in docs[:k]]
+    expected = case.get('expected', [])
+    result = {'names': names}
+    if expected:
+        hits = [name for name in names if name in expected]
+        first = next((rank for rank, name in enumerate(names, 1) if name in expected), None)
+        result['recall'] = len(set(hits)) / min(len(expected), k)
+        result['reciprocal_rank'] = 1.0 / first if first else 0.0
+    bits = rag.allergen_index.bits_for(case.get('allergens'))
+    if bits:
+        result['allergen_violations'] = sum(
+            1 for doc in docs[:k] if rag.allergen_index.document_mask(doc.metadata) & bits
+        )
+    return result
+
+
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    """延迟分位数（毫秒）"""
+    values = np.array(samples) * 1000
+    return {
+        'count': len(samples),
+        'mean': round(float(values.mean()), 3),
+        'p50': round(float(np.percentile(values, 50)), 3),
+        'p95': round(float(np.percentile(values, 95)), 3),
+        'p99': round(float(np.percentile(values, 99)), 3),
+        'max': round(float(values.max()), 3),
+    }
+
+
+def quality_summary(results: List[Dict[str, Any]], k: int) -> Dict[str, Any]:
+    """汇总一组查询的质量指标"""
+    labeled = [result for result in results if 'recall' in result]
+    return {
+        'queries': len(results),
+        f'recall@{k}': round(float(np.mean([r['recall'] for r in labeled])), 4) if labeled else None,
+        'mrr': round(float(np.mean([r['reciprocal_rank'] for r in labeled])), 4) if labeled else None,
+        'allergen_violations': sum(r.get('allergen_violations', 0) for r in results),
+    }
+
+
+async def run_pass(cases: List[Dict[str, Any]]):
+    """依次执行全部查询，返回每条的检索结果和耗时（秒）"""
+    from robot.retrieval import canonical_query
+    from robot.tools import rag
+
+    docs_list, samples = [], []
+    for case in cases:
+        query = canonical_query(case['query'])
+        bits = rag.allergen_index.bits_for(case.get('allergens'))
+        start = time.perf_counter()
+        docs = await rag.retrieve_documents(query, bits)
+        samples.append(time.perf_counter() - start)
+        docs_list.append(docs)
+    return docs_list, samples
+
+
+async def run_benchmark(cases: List[Dict[str, Any]], embedder: str, k: int, warm_repeat: int) -> Dict[str, Any]:
+    from robot.tools import rag
+
+    start = time.perf_counter()
+    corpus_index = await rag.corpus_index_resource.aget()
+    await rag.nutrient_table_resource.aget()
+    load_time = time.perf_counter() - start
+
+    # 冷启动：清空查询向量缓存与结果缓存
+    rag.query_embedding_cache.clear()
+    rag.retrieve_result_cache.clear()
+    docs_list, cold_samples = await run_pass(cases)
+
+    warm_samples = []
+    for _ in range(warm_repeat):
+        _, samples = await run_pass(cases)
+        warm_samples.extend(samples)
+    await rag.close_embedding_batcher()
+
+    per_query = []
+    for case, docs, latency in zip(cases, docs_list, cold_samples):
+        per_query.append({
+            'category': case['category'],
+            'query': case['query'],
+            'allergens': case.get('allergens', []),
+            'cold_ms': round(latency * 1000, 3),
+            **score_case(case, docs, k),
+        })
+
+    categories = {}
+    for category in dict.fromkeys(case['category'] for case in cases):
+        categories[category] = quality_summary([r for r in per_query if r['category'] == category], k)
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'embedder': embedder,
+            'model_id': rag.get_embedding_model_id(),
+            'index_version': corpus_index.key,
+            'corpus_chunks': len(corpus_index),
+            'hybrid_search': rag.HYBRID_SEARCH,
+            'retrieve_candidates': rag.RETRIEVE_CANDIDATES,
+            'k': k,
+            'load_s': round(load_time, 3),
+        },
+        'overall': quality_summary(per_query, k),
+        'categories': categories,
+        'latency_ms': {
+            'cold': latency_summary(cold_samples),
+            'warm': latency_summary(warm_samples) if warm_samples else None,
+        },
+        'queries': per_query,
+    }
+
+
+def print_report(report: Dict[str, Any], k: int):
+    meta = report['meta']
+    print(f"提交: {meta['commit']}  嵌入后端: {meta['embedder']}  分块数: {meta['corpus_chunks']}  "
+          f"候选数: {meta['retrieve_candidates']}  加载耗时: {meta['load_s']:.2f}s")
+
+    print(f"\n{'类别':<12}{'查询数':>8}{f'recall@{k}':>12}{'MRR':>10}{'过敏原违规':>12}")
+    rows = list(report['categories'].items()) + [('overall', report['overall'])]
+    for name, summary in rows:
+        recall = summary[f'recall@{k}']
+        mrr = summary['mrr']
+        print(f"{name:<12}{summary['queries']:>8}"
+              f"{'-' if recall is None else f'{recall:.3f}':>12}"
+              f"{'-' if mrr is None else f'{mrr:.3f}':>10}"
+              f"{summary['allergen_violations']:>12}")
+
+    print(f"\n{'延迟(ms)':<12}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for name, summary in report['latency_ms'].items():
+        if summary:
+            print(f"{name:<12}{summary['p50']:>10.2f}{summary['p95']:>10.2f}{summary['p99']:>10.2f}{summary['max']:>10.2f}")
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], k: int):
+    """与之前的结果对比整体质量指标与延迟"""
+    print(f"\n与基线对比（基线提交: {baseline['meta'].get('commit')}，嵌入后端: {baseline['meta'].get('embedder')}）")
+    # (指标, 越大越好)
+    for key, higher_is_better in [(f'recall@{k}', True), ('mrr', True), ('allergen_violations', False)]:
+        before, after = baseline['overall'].get(key), report['overall'].get(key)
+        if before is None or after is None:
+            continue
+        delta = after - before
+        worse = delta < 0 if higher_is_better else delta > 0
+        print(f"  {key:<22}{before:>10.3f} -> {after:<10.3f}{'回退' if worse else ''}")
+    for run in ('cold', 'warm'):
+        before, after = baseline['latency_ms'].get(run), report['latency_ms'].get(run)
+        if not before or not after:
+            continue
+        for quantile in ('p50', 'p95', 'p99'):
+            ratio = after[quantile] / before[quantile] if before[quantile] else float('nan')
+            print(f"  {run + ' ' + quantile:<22}{before[quantile]:>10.2f} -> {after[quantile]:<10.2f}({ratio:.2f}x)")
+    for before, after in zip(baseline.get('queries', []), report['queries']):
+        if before['query'] == after['query'] and before.get('recall', 0) > after.get('recall', 0):
+            print(f"  召回下降: [{after['category']}] {after['query']} "
+                  f"{before['recall']:.2f} -> {after['recall']:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检索质量与延迟基准测试")
+    parser.add_argument("--embedder", default="fake", choices=["fake", "torch", "onnx"], help="嵌入后端")
+    parser.add_argument("--queries-file", default=DEFAULT_QUERIES_FILE, help="标注查询集")
+    parser.add_argument("--index-dir", help="索引快照目录，fake后端默认使用临时目录")
+    parser.add_argument("--k", type=int, default=5, help="recall@k 的k")
+    parser.add_argument("--warm-repeat", type=int, default=5, help="热运行重复的轮数")
+    parser.add_argument("--output", help="结果JSON的输出路径")
+    parser.add_argument("--baseline", help="用于对比的历史结果JSON")
+    args = parser.parse_args()
+
+    # rag.py 在导入时读取配置，需先设置环境变量
+    os.environ["RAG_EMBEDDING_BACKEND"] = args.embedder
+    if args.index_dir:
+        os.environ["RAG_INDEX_DIR"] = args.index_dir
+    elif args.embedder == "fake":
+        os.environ["RAG_INDEX_DIR"] = tempfile.mkdtemp(prefix="rag_bench_index_")
+
+    cases = load_cases(args.queries_file)
+    report = asyncio.run(run_benchmark(cases, args.embedder, args.k, args.warm_repeat))
+    print_report(report, args.k)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            compare(report, json.load(f), args.k)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+向量压缩存储基准测试
+
+对 float32 / float16 / int8 三种存储类型以及不同的重排倍数（RAG_RESCORE_FACTOR），报告：
+- 每个worker的内存：在独立子进程中以内存映射方式加载快照数组并执行查询，统计查询后进程
+  常驻内存（RSS）的增量，即检索实际读入的向量页
+- recall@k：以float32精确检索的 top-k 为准
+- 单条查询延迟 p50/p99
+
+加 --ann 时在IVF近似索引上做同样的比较（倒排列表中的向量按存储类型压缩）。
+向量为合成的聚类数据，生成方式见 bench_ann.py。
+
+用法（在项目根目录执行）：
+    python -m robot.benchmark.bench_vector_storage
+    python -m robot.benchmark.bench_vector_storage --size 100000 --rescore 0 2 4 8 --ann
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from typing import Dict
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import FakeEmbeddings
+
+from robot.benchmark.bench_ann import clustered_vectors
+from robot.retrieval import (
+    IVFFlatIndex, MatrixVectorStore, QuantizedMatrix, STORAGE_TYPES, normalize_rows, process_memory, top_k_indices
+)
+
+
+def write_arrays(directory: str, vectors: np.ndarray, storage: str, ann: bool):
+    """按存储类型写入与快照相同布局的数组"""
+    os.makedirs(directory)
+    np.save(os.path.join(directory, "embeddings.npy"), vectors)
+    if ann:
+        arrays = IVFFlatIndex.build(vectors, storage=storage).to_arrays()
+    elif storage != 'float32':
+        arrays = QuantizedMatrix.encode(vectors, storage).to_arrays()
+    else:
+        arrays = {}
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, f"{name}.npy"), array)
+
+
+def run_worker(directory: str, rescore_factor: int, n_probe: int, queries: np.ndarray, k: int) -> Dict[str, object]:
+    """
+    在子进程中执行：以内存映射方式加载数组、构建向量存储并逐条查询
+
+    返回结果行号、延迟以及加载前后的进程内存，与服务worker从快照加载的方式一致。
+    """
+    before = process_memory()
+    vectors = np.load(os.path.join(directory, "embeddings.npy"), mmap_mode='r')
+    arrays = {
+        name[:-4]: np.load(os.path.join(directory, name), mmap_mode='r')
+        for name in os.listdir(directory) if name != "embeddings.npy"
+    }
+    ann_index = IVFFlatIndex.from_arrays(arrays, n_probe)
+    compressed = QuantizedMatrix.from_arrays(arrays) if ann_index is None else None
+    documents = [Document(page_content="")] * len(vectors)
+    store = MatrixVectorStore(
+        FakeEmbeddings(size=vectors.shape[1]), documents, vectors, normalized=True,
+        ann_index=ann_index, compressed=compressed, rescore_factor=rescore_factor
+    )
+
+    results, samples = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append([row for row, _ in store.search_rows_by_vector(query, k)])
+        samples.append(time.perf_counter() - start)
+    after = process_memory()
+    return {
+        "results": results,
+        "samples": samples,
+        "rss_mb": after.get("rss", 0.0) - before.get("rss", 0.0),
+        "uss_mb": after.get("uss", 0.0) - before.get("uss", 0.0),
+    }
+
+
+def measure(directory: str, rescore_factor: int, n_probe: int, queries: np.ndarray, k: int) -> Dict[str, object]:
+    """在全新的子进程中测量，避免上一组配置读入的页计入本组的内存"""
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1) as pool:
+        return pool.apply(run_worker, (directory, rescore_factor, n_probe, queries, k))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量压缩存储的内存与召回率基准测试")
+    parser.add_argument("--size", type=int, default=100000, help="语料规模")
+    parser.add_argument("--dim", type=int, default=768, help="向量维度")
+    parser.add_argument("--latent-dim", type=int, default=32, help="合成数据的隐空间维度")
+    parser.add_argument("--clusters", type=int, default=1000, help="合成数据的高斯混合分量数")
+    parser.add_argument("--noise", type=float, default=1.0, help="合成数据的噪声强度")
+    parser.add_argument("--storages", nargs="+", default=list(STORAGE_TYPES), choices=STORAGE_TYPES, help="存储类型")
+    parser.add_argument("--rescore", type=int, nargs="+", default=[0, 4], help="重排倍数，0表示不重排")
+    parser.add_argument("--ann", action="store_true", help="在IVF近似索引上比较")
+    parser.add_argument("--probes", type=int, default=16, help="IVF每次查询扫描的聚类数")
+    parser.add_argument("--queries", type=int, default=200, help="查询数量")
+    parser.add_argument("--k", type=int, default=10, help="recall@k 的k")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    centers = normalize_rows(rng.standard_normal((args.clusters, args.latent_dim), dtype=np.float32))
+    projection = rng.standard_normal((args.latent_dim, args.dim), dtype=np.float32)
+    vectors = clustered_vectors(args.size, centers, projection, args.noise, rng)
+    queries = clustered_vectors(args.queries, centers, projection, args.noise, rng)
+    exact = [top_k_indices(vectors @ query, args.k).tolist() for query in queries]
+    print(f"规模: {args.size}，维度: {args.dim}，float32矩阵 {vectors.nbytes / 2 ** 20:.0f}MB，"
+          f"{'IVF n_probe=' + str(args.probes) if args.ann else '精确检索'}，k={args.k}")
+
+    print(f"\n{'存储':<10}{'重排倍数':>8}{f'recall@{args.k}':>12}{'p50(ms)':>10}{'p99(ms)':>10}"
+          f"{'RSS增量(MB)':>14}{'独占增量(MB)':>14}")
+    with tempfile.TemporaryDirectory(prefix="vector_storage_bench_") as tmp_dir:
+        for storage in args.storages:
+            directory = os.path.join(tmp_dir, storage)
+            write_arrays(directory, vectors, storage, args.ann)
+            # float32 的得分本身精确，重排没有意义
+            for rescore_factor in ([0] if storage == 'float32' else args.rescore):
+                result = measure(directory, rescore_factor, args.probes, queries, args.k)
+                recall = float(np.mean([
+                    len(set(approx) & set(expected)) / len(expected)
+                    for approx, expected in zip(result["results"], exact)
+                ]))
+                samples = np.array(result["samples"]) * 1000
+                print(f"{storage:<10}{rescore_factor:>8}{recall:>12.3f}"
+                      f"{np.percentile(samples, 50):>10.3f}{np.percentile(samples, 99):>10.3f}"
+                      f"{result['rss_mb']:>14.1f}{result['uss_mb']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+向量存储检索延迟基准测试
+
+对比 InMemoryVectorStore 与 MatrixVectorStore 在不同语料规模下的 top-k 检索延迟（p50/p99），
+并测量 MatrixVectorStore 批量检索的单条摊销延迟。使用随机向量直接按向量检索，不加载嵌入模型。
+
+用法（在项目根目录执行）：
+    python -m robot.benchmark.bench_vector_store
+    python -m robot.benchmark.bench_vector_store --sizes 600 10000 100000 --queries 50
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import FakeEmbeddings
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from robot.retrieval import MatrixVectorStore
+
+
+def percentile_ms(samples: List[float], q: float) -> float:
+    """计算延迟分位数（毫秒）"""
+    return float(np.percentile(samples, q) * 1000)
+
+
+def measure(search: Callable[[np.ndarray], object], queries: np.ndarray) -> List[float]:
+    """逐条执行查询并记录耗时（秒）"""
+    search(queries[0])  # 预热
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def build_stores(size: int, dim: int, rng: np.random.Generator):
+    """构建两个内容相同的向量存储"""
+    vectors = rng.standard_normal((size, dim), dtype=np.float32)
+    documents = [Document(page_content=f"chunk-{i}", metadata={'数据类型': '食物成分'}) for i in range(size)]
+    embedding = FakeEmbeddings(size=dim)
+
+    in_memory = InMemoryVectorStore(embedding)
+    for i, (doc, vector) in enumerate(zip(documents, vectors)):
+        in_memory.store[str(i)] = {
+            "id": str(i),
+            "vector": vector.tolist(),
+            "text": doc.page_content,
+            "metadata": doc.metadata
+        }
+    matrix = MatrixVectorStore(embedding, documents, vectors)
+    return in_memory, matrix
+
+
+def run(sizes: List[int], dim: int, num_queries: int, k: int, batch_size: int, seed: int) -> List[Dict]:
+    rng = np.random.default_rng(seed)
+    rows = []
+    for size in sizes:
+        in_memory, matrix = build_stores(size, dim, rng)
+        queries = rng.standard_normal((num_queries, dim), dtype=np.float32)
+        query_lists = [q.tolist() for q in queries]
+
+        # InMemoryVectorStore 在大语料上每次查询需秒级时间，减少查询次数
+        baseline_queries = query_lists[:max(3, num_queries * 600 // max(size, 600))]
+        baseline = measure(lambda q: in_memory.similarity_search_by_vector(q, k=k), baseline_queries)
+        single = measure(lambda q: matrix.similarity_search_by_vector(q, k=k), queries)
+
+        batches = [queries[i:i + batch_size] for i in range(0, num_queries, batch_size)]
+        batch_samples = measure(lambda b: matrix.batch_similarity_search_by_vectors(b, k=k), batches)
+        per_query = [s / batch_size for s in batch_samples]
+
+        rows.append({
+            "size": size,
+            "in_memory_p50": percentile_ms(baseline, 50),
+            "in_memory_p99": percentile_ms(baseline, 99),
+            "matrix_p50": percentile_ms(single, 50),
+            "matrix_p99": percentile_ms(single, 99),
+            "batch_per_query_p50": percentile_ms(per_query, 50),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量存储检索延迟基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[600, 5000, 20000, 100000])
+    parser.add_argument("--dim", type=int, default=768, help="向量维度（text2vec-base-chinese为768）")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=15)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rows = run(args.sizes, args.dim, args.queries, args.k, args.batch_size, args.seed)
+
+    header = f"{'分块数':>8} | {'InMemory p50':>12} {'p99':>9} | {'Matrix p50':>10} {'p99':>9} | {'批量/条 p50':>10}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(
+            f"{row['size']:>8} | {row['in_memory_p50']:>10.3f}ms {row['in_memory_p99']:>7.3f}ms | "
+            f"{row['matrix_p50']:>8.3f}ms {row['matrix_p99']:>7.3f}ms | {row['batch_per_query_p50']:>8.3f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
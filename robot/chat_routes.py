@@ -9,9 +9,10 @@ if project_root not in sys.path:
     sys.path.append(project_root)
 
 from fastapi import FastAPI, Request, Depends
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 import uvicorn
-from robot.chat_server import chat
+from robot.chat_server import chat, chat_stream
+from robot.aagent import invalidate_model_cache, get_agent_stats
 from fastapi.middleware.cors import CORSMiddleware
 from robot.database.memory import with_mysql_pool, get_pool
 import datetime
@@ -19,7 +20,13 @@ from langchain_core.messages import HumanMessage, AIMessage
 from contextlib import asynccontextmanager
 from robot import globals
 from robot.llms import get_llm, model
+from robot.tools import resources, rag
+from robot import session_summary
+from robot.response_cache import get_response_cache_stats
+from robot.tools.tool_cache import get_tool_cache_stats
+from robot.retrieval import process_memory
 import base64
+import json
 import shutil
 import logging
 from PIL import Image
@@ -48,10 +55,32 @@ async def lifespan(app: FastAPI):
         # 初始化数据库连接池
         pool = await get_pool()
         logger.info("数据库连接池初始化成功")
+        # 后台预热检索、图片识别等重量级组件，不阻塞服务启动
+        if os.getenv("ROBOT_WARMUP", "true").lower() == "true":
+            warmup_task = asyncio.create_task(resources.warm_up())
+        # 监视食物/食谱数据文件，变化后增量重建检索索引
+        watch_interval = float(os.getenv("RAG_WATCH_INTERVAL", 0))
+        if watch_interval > 0:
+            watch_task = asyncio.create_task(rag.watch_corpus_files(watch_interval))
+        # 多worker部署时索引只在一个worker中重建，其他worker轮询快照目录切换到新快照
+        multi_worker = int(os.getenv("ROBOT_WORKERS", 1)) > 1
+        snapshot_poll_interval = float(os.getenv("RAG_SNAPSHOT_POLL_INTERVAL", 10 if multi_worker else 0))
+        if snapshot_poll_interval > 0:
+            follow_task = asyncio.create_task(rag.follow_snapshots(snapshot_poll_interval))
         logger.info("应用启动完成")
         yield
     finally:
         logger.info("正在关闭应用...")
+        if 'warmup_task' in locals() and not warmup_task.done():
+            warmup_task.cancel()
+        if 'watch_task' in locals():
+            watch_task.cancel()
+        if 'follow_task' in locals():
+            follow_task.cancel()
+        # 取消未完成的会话摘要更新
+        await session_summary.close()
+        # 停止查询嵌入的批量合并任务
+        await rag.close_embedding_batcher()
         # 关闭数据库连接池
         if 'pool' in locals():
             pool.close()
@@ -106,6 +135,163 @@ async def root():
     """健康检查接口"""
     return {"status": "ok", "message": "服务正常运行"}
 
+@app.get("/api/ready")
+async def ready():
+    """
+    就绪探针接口
+    retrieve 和 image_parser 依赖的组件全部加载完成前返回503
+    """
+    status = resources.readiness()
+    return JSONResponse(
+        status_code=200 if status["ready"] else 503,
+        content=status
+    )
+
+@app.get("/api/metrics")
+async def metrics():
+    """
+    运行指标接口，返回各级缓存（含跨轮次的工具结果缓存）的命中统计、查询嵌入批量合并的直方图，
+    工具超时与强制结束次数、每轮耗时与流式接口首字延迟分布，会话摘要的更新统计，语义回复缓存的命中率，以及处理本次请求的worker的内存占用（多worker时各worker分别统计）
+    """
+    return JSONResponse(content={
+        "query_embedding_cache": rag.get_query_cache_stats(),
+        "retrieve_result_cache": rag.get_result_cache_stats(),
+        "embedding_batching": rag.get_embedding_batch_stats(),
+        "tool_result_cache": get_tool_cache_stats(),
+        "agent": get_agent_stats(),
+        "session_summary": session_summary.get_summary_stats(),
+        "response_cache": get_response_cache_stats(),
+        "process_memory": {"pid": os.getpid(), **process_memory()}
+    })
+
+@app.post("/api/reindex")
+async def reindex():
+    """
+    数据文件更新后增量重建检索索引，构建完成后原子切换，期间请求仍由旧索引服务
+
+    多worker部署时只有处理本请求的worker立即切换，其他worker在
+    RAG_SNAPSHOT_POLL_INTERVAL 秒内发现新快照后切换
+    """
+    try:
+        result = await rag.reload_corpus()
+        return JSONResponse(content={**result, "success": True})
+    except Exception as e:
+        logger.error(f"重建索引失败: {str(e)}")
+        return JSONResponse(
+            status_code=500,
+            content={
+                "error": f"Reindex failed: {str(e)}",
+                "success": False
+            }
+        )
+
+async def save_user_message(pool, session_id: str, user_message: str, images: list, device_id: str):
+    """
+    保存用户消息（以及附带的图片）并设置当前用户的全局变量
+    :return: (user_id, record_id)，会话不存在时返回 (None, None)
+    """
+    # 从session_id获取user_id并设置全局变量
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "SELECT user_id FROM robot_sessions WHERE session_id = %s",
+                (session_id,)
+            )
+            result = await cur.fetchone()
+            if not result:
+                return None, None
+            user_id = result[0]
+            
+            # 设置全局变量
+            globals.current_user_id = user_id
+            globals.current_session_id = session_id
+
+    # 如果有图片，先清空全局图片目录
+    has_images = len(images)  # 修改为存储实际的图片数量
+    if has_images > 0:
+        if os.path.exists(GLOBAL_IMAGE_DIR):
+            shutil.rmtree(GLOBAL_IMAGE_DIR)
+        os.makedirs(GLOBAL_IMAGE_DIR)
+        logger.info(f"清空并重建图片目录: {GLOBAL_IMAGE_DIR}")
+        
+        # 保存新的图片
+        for i, img in enumerate(images):
+            img_data = base64.b64decode(img["data"])
+            img_path = os.path.join(GLOBAL_IMAGE_DIR, f"image_{i+1}{os.path.splitext(img['name'])[1]}")
+            with open(img_path, "wb") as f:
+                f.write(img_data)
+            logger.info(f"保存图片 {i+1}: {img['name']}")
+            
+    # 保存用户消息到数据库
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """
+                INSERT INTO chat_records (session_id, user_id, user_message, has_images, device_id, sync_status) 
+                VALUES (%s, %s, %s, %s, %s, %s)
+                """,
+                (session_id, user_id, user_message, has_images, device_id, "pending")
+            )
+            record_id = cur.lastrowid
+            logger.info(f"保存用户消息 - record_id: {record_id}")
+            
+            # 保存图片到chat_images表
+            if has_images > 0:
+                # 准备图片数据
+                image_data = [record_id]  # 第一个参数是record_id
+                placeholders = ['%s']  # record_id的占位符
+                
+                # 处理每张图片的数据
+                for i, img in enumerate(images):
+                    img_data = base64.b64decode(img["data"])
+                    image_data.append(img_data)
+                    placeholders.append('%s')
+                
+                # 补充剩余的NULL值直到5个图片位置
+                remaining_images = 5 - has_images
+                for _ in range(remaining_images):
+                    image_data.append(None)
+                    placeholders.append('%s')
+                
+                # 构造INSERT语句
+                columns = ['record_id'] + [f'image_{i+1}' for i in range(5)]
+                insert_sql = f"""
+                    INSERT INTO chat_images ({', '.join(columns)})
+                    VALUES ({', '.join(placeholders)})
+                """
+                
+                # 执行INSERT
+                await cur.execute(insert_sql, tuple(image_data))
+                logger.info(f"保存 {has_images} 张图片到chat_images表 - record_id: {record_id}")
+            await conn.commit()  # 提交事务
+    return user_id, record_id
+
+async def save_bot_response(pool, session_id: str, record_id: int, bot_response: str):
+    """保存机器人回复，并在后台更新会话摘要"""
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            # 更新机器人响应
+            await cur.execute(
+                """
+                UPDATE chat_records 
+                SET bot_response = %s, response_at = CURRENT_TIMESTAMP 
+                WHERE record_id = %s
+                """,
+                (bot_response, record_id)
+            )
+            await conn.commit()
+            logger.info(f"保存AI回复 - record_id: {record_id}")
+    session_summary.schedule_summary_update(session_id)
+
+def session_not_found():
+    return JSONResponse(
+        status_code=404,
+        content={
+            "error": "Session not found",
+            "success": False
+        }
+    )
+
 @app.post("/api/chat")
 @with_mysql_pool
 async def chat_endpoint(request: Request, pool=None):
@@ -121,113 +307,26 @@ async def chat_endpoint(request: Request, pool=None):
         
         logger.info(f"收到聊天请求 - session_id: {session_id}, message: {user_message}, images: {len(images)}, device_id: {device_id}")
         
-        # 从session_id获取user_id并设置全局变量
-        async with pool.acquire() as conn:
-            async with conn.cursor() as cur:
-                await cur.execute(
-                    "SELECT user_id FROM robot_sessions WHERE session_id = %s",
-                    (session_id,)
-                )
-                result = await cur.fetchone()
-                if not result:
-                    return JSONResponse(
-                        status_code=404,
-                        content={
-                            "error": "Session not found",
-                            "success": False
-                        }
-                    )
-                user_id = result[0]
+        user_id, record_id = await save_user_message(pool, session_id, user_message, images, device_id)
+        if user_id is None:
+            return session_not_found()
                 
-                # 设置全局变量
-                globals.current_user_id = user_id
-                globals.current_session_id = session_id
-
-        # 如果有图片，先清空全局图片目录
-        has_images = len(images)  # 修改为存储实际的图片数量
-        if has_images > 0:
-            if os.path.exists(GLOBAL_IMAGE_DIR):
-                shutil.rmtree(GLOBAL_IMAGE_DIR)
-            os.makedirs(GLOBAL_IMAGE_DIR)
-            logger.info(f"清空并重建图片目录: {GLOBAL_IMAGE_DIR}")
-            
-            # 保存新的图片
-            for i, img in enumerate(images):
-                img_data = base64.b64decode(img["data"])
-                img_path = os.path.join(GLOBAL_IMAGE_DIR, f"image_{i+1}{os.path.splitext(img['name'])[1]}")
-                with open(img_path, "wb") as f:
-                    f.write(img_data)
-                logger.info(f"保存图片 {i+1}: {img['name']}")
-                
-        # 保存用户消息到数据库
-        async with pool.acquire() as conn:
-            async with conn.cursor() as cur:
-                await cur.execute(
-                    """
-                    INSERT INTO chat_records (session_id, user_id, user_message, has_images, device_id, sync_status) 
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                    """,
-                    (session_id, user_id, user_message, has_images, device_id, "pending")
-                )
-                record_id = cur.lastrowid
-                logger.info(f"保存用户消息 - record_id: {record_id}")
-                
-                # 保存图片到chat_images表
-                if has_images > 0:
-                    # 准备图片数据
-                    image_data = [record_id]  # 第一个参数是record_id
-                    placeholders = ['%s']  # record_id的占位符
-                    
-                    # 处理每张图片的数据
-                    for i, img in enumerate(images):
-                        img_data = base64.b64decode(img["data"])
-                        image_data.append(img_data)
-                        placeholders.append('%s')
-                    
-                    # 补充剩余的NULL值直到5个图片位置
-                    remaining_images = 5 - has_images
-                    for _ in range(remaining_images):
-                        image_data.append(None)
-                        placeholders.append('%s')
-                    
-                    # 构造INSERT语句
-                    columns = ['record_id'] + [f'image_{i+1}' for i in range(5)]
-                    insert_sql = f"""
-                        INSERT INTO chat_images ({', '.join(columns)})
-                        VALUES ({', '.join(placeholders)})
-                    """
-                    
-                    # 执行INSERT
-                    await cur.execute(insert_sql, tuple(image_data))
-                    await conn.commit()  # 提交事务
-                    logger.info(f"保存 {has_images} 张图片到chat_images表 - record_id: {record_id}")
-                
-                # 获取聊天响应
-                bot_response = ""
-                try:
-                    # 先获取异步生成器
-                    chat_gen = await chat(session_id, user_message, has_images=has_images)
-                    # 然后迭代它
-                    async for msg in chat_gen:
-                        if msg:
-                            bot_response = msg
-                            logger.info(f"收到AI回复: {msg[:100]}...")  # 只记录前100个字符
-                except Exception as e:
-                    logger.error(f"生成回复失败: {str(e)}")
-                    bot_response = f"抱歉，处理消息时出现错误: {str(e)}"
-                
-                if bot_response:
-                    # 更新机器人响应
-                    await cur.execute(
-                        """
-                        UPDATE chat_records 
-                        SET bot_response = %s, response_at = CURRENT_TIMESTAMP 
-                        WHERE record_id = %s
-                        """,
-                        (bot_response, record_id)
-                    )
-                    await conn.commit()
-                    logger.info(f"保存AI回复 - record_id: {record_id}")
+        # 获取聊天响应
+        bot_response = ""
+        try:
+            # 先获取异步生成器
+            chat_gen = await chat(session_id, user_message, has_images=len(images))
+            # 然后迭代它
+            async for msg in chat_gen:
+                if msg:
+                    bot_response = msg
+                    logger.info(f"收到AI回复: {msg[:100]}...")  # 只记录前100个字符
+        except Exception as e:
+            logger.error(f"生成回复失败: {str(e)}")
+            bot_response = f"抱歉，处理消息时出现错误: {str(e)}"
+        
+        if bot_response:
+            await save_bot_response(pool, session_id, record_id, bot_response)
 
         return JSONResponse(content={
             "message": bot_response,
@@ -244,6 +343,58 @@ async def chat_endpoint(request: Request, pool=None):
             }
         )
 
+def sse_event(event: dict) -> str:
+    """把事件编码为一条SSE消息，事件类型写入 event 字段"""
+    return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+@app.post("/api/chat/stream")
+@with_mysql_pool
+async def chat_stream_endpoint(request: Request, pool=None):
+    """
+    流式聊天接口，请求体与 /api/chat 相同，以SSE（text/event-stream）逐条返回：
+    token（模型输出片段）、tool_start / tool_end（工具执行进度）、done（最终回复）或 error。
+    收到 done 后最终回复写入 chat_records；客户端中途断开时本轮不保存回复。
+    """
+    try:
+        data = await request.json()
+        session_id = str(data.get("session_id", ""))
+        user_message = str(data.get("message", ""))
+        images = data.get("images", [])
+        device_id = str(data.get("device_id", ""))
+        
+        logger.info(f"收到流式聊天请求 - session_id: {session_id}, message: {user_message}, images: {len(images)}, device_id: {device_id}")
+        
+        user_id, record_id = await save_user_message(pool, session_id, user_message, images, device_id)
+        if user_id is None:
+            return session_not_found()
+        event_gen = await chat_stream(session_id, user_message, has_images=len(images))
+    except Exception as e:
+        logger.error(f"流式聊天接口错误: {str(e)}")
+        return JSONResponse(
+            status_code=500,
+            content={
+                "error": f"Internal server error: {str(e)}",
+                "success": False
+            }
+        )
+
+    async def body():
+        async for event in event_gen:
+            if event["type"] in ("done", "error"):
+                # 错误信息与 /api/chat 一样作为本轮回复保存
+                try:
+                    await save_bot_response(pool, session_id, record_id, event["message"])
+                except Exception as e:
+                    logger.error(f"保存AI回复失败: {str(e)}")
+            yield sse_event(event)
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        # 关闭反向代理（如nginx）的缓冲，事件产生后立即送达客户端
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/api/switch_model")
 async def switch_model(request: Request):
     """
@@ -266,8 +417,10 @@ async def switch_model(request: Request):
             logger.info(f"本次使用的模型是：{model_name}")  # 添加日志打印
             # 尝试获取新模型实例
             new_model = get_llm(model_name)
-            # 如果成功，更新全局模型
+            # 如果成功，更新全局模型，并清除该模型名称下绑定了工具的旧实例
             globals.current_model = new_model
+            globals.current_model_name = model_name
+            invalidate_model_cache(model_name)
             
             return JSONResponse(content={
                 "message": f"Successfully switched to {model_name}",
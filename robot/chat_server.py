@@ -8,12 +8,17 @@ project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 if project_root not in sys.path:
     sys.path.append(project_root)
 
-from robot.aagent import build_graph
+from robot.aagent import get_graph, agent_metrics, TURN_DEADLINE
 from robot.database.memory import with_mysql_pool, get_pool
 import asyncio
+import random
+import time
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from llms import gen_prompt, prompt
-from llms.prompt import get_chat_system_message
+from llms.prompt import get_chat_system_message, get_system_prefix
+from llms.prompt_assembler import PromptAssembler, get_token_counter, MAX_HISTORY_TURNS, PROMPT_COMPARE_RATE
+from robot.session_summary import load_summary
+from robot import response_cache
 from robot.tools.image_parser_tool import image_parser
 from robot import globals
 import logging
@@ -22,6 +27,132 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def parse_response(content: str) -> str:
+    """取出模型回复的文本，JSON格式的回复取其中的 response 字段"""
+    try:
+        content_json = json.loads(content)
+        if isinstance(content_json, dict) and "response" in content_json:
+            return content_json["response"]
+    except (json.JSONDecodeError, TypeError):
+        # 如果不是JSON格式，保持原样
+        pass
+    return content
+
+async def prepare_turn(session_id: str, message: str, pool, has_images: int, started_at: float, model, model_name: str):
+    """
+    准备一轮对话：查询会话所属用户及其个性化规则，加载会话摘要和摘要之后的历史消息，
+    按token预算拼接系统前缀、个性化规则、会话摘要、历史、用户消息和图片分析结果
+    :param model: 本轮使用的模型，与 model_name 由调用方在请求开始时一并取定
+    :param model_name: 本轮使用的模型名称
+    :return: (图的输入, 图的配置)
+    """
+    # 从session_id获取user_id，以及该用户的个性化规则（不读取会被其他用户的请求修改的全局变量）
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """
+                SELECT s.user_id, u.ai_rules, u.is_rules_enabled
+                FROM robot_sessions s
+                LEFT JOIN user_preferences u ON u.user_id = s.user_id
+                WHERE s.session_id = %s
+                """,
+                (session_id,)
+            )
+            result = await cur.fetchone()
+            if not result:
+                raise Exception("会话不存在")
+            user_id, ai_rules, rules_enabled = result
+    
+    config = {
+        "configurable": {
+            "thread_id": session_id,
+            "model": model,
+            "deadline": started_at + TURN_DEADLINE,
+            "user_id": user_id  # 按用户缓存的工具以此区分用户，不读取会被并发请求覆盖的全局变量
+        },
+        "user_id": user_id
+    }
+    
+    # 会话摘要覆盖了较早的对话，只加载摘要之后的原始对话
+    summary, last_record_id = await load_summary(pool, session_id)
+    
+    # 加载最近的历史消息，由拼接器按token预算从最新一轮开始取用
+    history = []
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """
+                SELECT user_message, bot_response 
+                FROM chat_records 
+                WHERE session_id = %s 
+                AND record_id > %s
+                AND bot_response IS NOT NULL
+                ORDER BY created_at DESC
+                LIMIT %s
+                """,
+                (session_id, last_record_id, MAX_HISTORY_TURNS)
+            )
+            async for row in cur:
+                history.append(row)
+    history.reverse()
+    
+    logger.info(f"[历史消息] 加载了 {len(history)} 轮历史消息，{'有' if summary else '无'}会话摘要")
+    
+    # 固定的系统前缀：静态的角色说明和最佳实践只出现一次，不再包装进用户消息
+    system_messages = [get_system_prefix(with_guidance=prompt)]
+    
+    # 添加个性化规则（如果启用）
+    if rules_enabled and ai_rules:
+        logger.info(f"[个性化规则] 当前规则启用状态: {bool(rules_enabled)}, 规则内容: {ai_rules}")
+        logger.info("[个性化规则] 应用用户自定义规则")
+        system_messages.append(SystemMessage(content=f"请严格遵守以下规则：\n{ai_rules}"))
+    else:
+        logger.info("[个性化规则] 用户自定义规则未启用")
+    rules_end = len(system_messages)
+    
+    if summary:
+        system_messages.append(SystemMessage(content=f"以下是本会话较早对话的摘要，回答时可参考：\n{summary}"))
+    
+    # 如果有图片，先使用image_parser分析图片
+    extra_messages = []
+    if has_images > 0:
+        try:
+            image_description = await image_parser.ainvoke(
+                "C:\\Users\\yuyuyu\\Desktop\\毕设\\代码\\robot\\global_image"
+            )
+            extra_messages.append(SystemMessage(content=f"图片分析结果（共{has_images}张）：\n{image_description}"))
+            logger.info(f"[图片分析] {image_description}")
+        except Exception as e:
+            logger.error(f"[图片分析错误] {str(e)}")
+            extra_messages.append(SystemMessage(content=f"图片分析失败：{str(e)}"))
+    
+    # 用当前模型的分词器计数，分词器首次加载可能较慢，放到线程中执行
+    count_tokens = await asyncio.to_thread(get_token_counter, model_name)
+    assembler = PromptAssembler(count_tokens)
+    assembled = await asyncio.to_thread(assembler.assemble, system_messages, history, message, extra_messages)
+    logger.info(
+        f"[提示拼接] 提示 {assembled.prompt_tokens} tokens（预算 {assembler.budget}），"
+        f"历史 {assembled.history_turns} 轮，超出预算未放入 {assembled.dropped_turns} 轮"
+    )
+    # 与原拼接方式的对比需要再分词一遍，只对抽样的轮次统计
+    if PROMPT_COMPARE_RATE > 0 and random.random() < PROMPT_COMPARE_RATE:
+        legacy_tokens = await asyncio.to_thread(
+            assembler.legacy_tokens,
+            [get_chat_system_message(), *system_messages[1:rules_end]],
+            history,
+            gen_prompt(message) if prompt else message,
+            extra_messages
+        )
+        logger.info(f"[提示拼接] 比原拼接方式节省 {legacy_tokens - assembled.prompt_tokens} tokens")
+    message_list = assembled.messages
+
+    graph_input = {
+        "messages": message_list,
+        "next_step": "chatbot",
+        "error_info": None
+    }
+    return graph_input, config
+
 @with_mysql_pool
 async def chat(session_id: str, message: str, pool=None, memory=None, has_images: int = 0):
     '''
@@ -33,121 +164,42 @@ async def chat(session_id: str, message: str, pool=None, memory=None, has_images
     :param has_images: 图片数量
     :return: 异步生成器，生成回复消息
     '''
+    # 本轮对话的截止时间，经图配置传给各节点，从收到消息开始计算
+    started_at = time.monotonic()
+    # 本轮使用的模型在收到消息时取定，回复缓存的上下文与拼接提示所用的分词器一致
+    model, model_name = globals.current_model, globals.current_model_name
     try:
         logger.info(f"[接收请求] session_id: {session_id}, message: {message}, has_images: {has_images}张图片")
-        
-        # 从session_id获取user_id
-        async with pool.acquire() as conn:
-            async with conn.cursor() as cur:
-                await cur.execute(
-                    "SELECT user_id FROM robot_sessions WHERE session_id = %s",
-                    (session_id,)
-                )
-                result = await cur.fetchone()
-                if not result:
-                    raise Exception("会话不存在")
-                user_id = result[0]
-        
-        if prompt:
-            message = gen_prompt(message)
-            logger.info(f"[提示词生成] 生成的提示词: {message}")
-
-        config = {
-            "configurable": {
-                "thread_id": session_id,
-                "model": globals.current_model  # 使用全局模型
-            }
-        }
-        current_graph = build_graph()  # 使用build_graph函数创建新的图实例
-        
-        # 加载历史消息
-        history_messages = []
-        async with pool.acquire() as conn:
-            async with conn.cursor() as cur:
-                await cur.execute(
-                    """
-                    SELECT user_message, bot_response 
-                    FROM chat_records 
-                    WHERE session_id = %s 
-                    AND bot_response IS NOT NULL
-                    ORDER BY created_at ASC
-                    LIMIT 10
-                    """,
-                    (session_id,)
-                )
-                async for row in cur:
-                    user_msg, bot_msg = row
-                    if user_msg:
-                        history_messages.append(HumanMessage(content=user_msg))
-                    if bot_msg:
-                        history_messages.append(AIMessage(content=bot_msg))
-        
-        logger.info(f"[历史消息] 加载了 {len(history_messages)} 条历史消息")
-        
-        # 构建基本消息列表
-        message_list = [
-            get_chat_system_message(),  # 系统消息
-        ]
-        
-        # 添加个性化规则（如果启用）
-        if globals.current_rules_enabled and globals.current_ai_rules:
-            logger.info(f"[个性化规则] 当前规则启用状态: {globals.current_rules_enabled}, 规则内容: {globals.current_ai_rules}")
-            logger.info("[个性化规则] 应用用户自定义规则")
-            message_list.append(SystemMessage(content=f"请严格遵守以下规则：\n{globals.current_ai_rules}"))
-        else:
-            logger.info("[个性化规则] 用户自定义规则未启用")
-            
-        # 添加历史消息和用户消息
-        message_list.extend([
-            *history_messages,  # 历史消息
-            HumanMessage(content=message)  # 用户消息
-        ])
-        
-        # 如果有图片，先使用image_parser分析图片
-        if has_images > 0:
-            try:
-                image_description = await image_parser.ainvoke(
-                    "C:\\Users\\yuyuyu\\Desktop\\毕设\\代码\\robot\\global_image"
-                )
-                message_list.append(SystemMessage(content=f"图片分析结果（共{has_images}张）：\n{image_description}"))
-                logger.info(f"[图片分析] {image_description}")
-            except Exception as e:
-                logger.error(f"[图片分析错误] {str(e)}")
-                message_list.append(SystemMessage(content=f"图片分析失败：{str(e)}"))
+        # 通用问题先查语义回复缓存，命中时不再加载历史、摘要或分析图片
+        cache_probe = await response_cache.probe(pool, session_id, message, model_name, has_images)
+        if cache_probe is not None and cache_probe.answer is not None:
+            async def cached_generator():
+                agent_metrics.turn_latency.observe(time.monotonic() - started_at)
+                yield cache_probe.answer
+            return cached_generator()
+        graph_input, config = await prepare_turn(session_id, message, pool, has_images, started_at, model, model_name)
+        current_graph = get_graph()  # 复用编译后的图实例
             
         # 创建异步生成器
         async def message_generator():
             logger.info("[开始生成] 正在生成回复...")
             last_response = None
+            final_state = {}
+            had_error = False  # 本轮是否进入过错误处理（错误处理节点结束时会清空 error_info）
             try:
-                # 添加user_id到配置中
-                config["user_id"] = user_id
                 events = current_graph.astream(
-                    input={
-                        "messages": message_list,
-                        "next_step": "chatbot",
-                        "error_info": None
-                    },
+                    input=graph_input,
                     config=config,
                     stream_mode="values",
                 )
                 
                 async for event in events:
+                    final_state = event
+                    had_error = had_error or bool(event.get("error_info"))
                     if "messages" in event:
                         for msg in event["messages"]:
                             if isinstance(msg, AIMessage):
-                                content = msg.content
-                                # 处理可能的JSON格式响应
-                                try:
-                                    # 尝试解析JSON
-                                    content_json = json.loads(content)
-                                    if isinstance(content_json, dict) and "response" in content_json:
-                                        content = content_json["response"]
-                                except json.JSONDecodeError:
-                                    # 如果不是JSON格式，保持原样
-                                    pass
-                                
-                                last_response = content
+                                last_response = parse_response(msg.content)
                                 # 如果是结束对话的消息，立即返回
                                 if "结束对话" in last_response:
                                     logger.info(f"[对话结束] {last_response}")
@@ -157,6 +209,11 @@ async def chat(session_id: str, message: str, pool=None, memory=None, has_images
                 # 只返回最终的回复
                 if last_response:
                     logger.info(f"[最终回复] {last_response}")
+                    response_cache.store(
+                        cache_probe, last_response,
+                        final_state.get("messages", [])[len(graph_input["messages"]):],
+                        failed=had_error
+                    )
                     yield last_response
                 else:
                     error_msg = "生成回复失败：没有有效的回复内容"
@@ -167,6 +224,8 @@ async def chat(session_id: str, message: str, pool=None, memory=None, has_images
                 error_msg = f"生成回复时出错: {str(e)}"
                 logger.error(f"[错误] {error_msg}")
                 yield error_msg
+            finally:
+                agent_metrics.turn_latency.observe(time.monotonic() - started_at)
         
         # 返回异步生成器
         return message_generator()
@@ -179,6 +238,103 @@ async def chat(session_id: str, message: str, pool=None, memory=None, has_images
             yield error_msg
         return error_generator()
 
+@with_mysql_pool
+async def chat_stream(session_id: str, message: str, pool=None, has_images: int = 0):
+    '''
+    流式聊天函数，边生成边返回事件：
+    - {"type": "token", "content": ...}：对话节点的模型输出片段
+    - {"type": "tool_start", "tool": ...} / {"type": "tool_end", "tool": ..., "status": ..., "elapsed_ms": ...}：工具执行进度
+    - {"type": "done", "message": ..., "ttft_ms": ...}：最终回复（以此为准，模型输出JSON格式时已取出 response 字段）
+    - {"type": "error", "message": ...}：出错，之后不再有事件
+    :param session_id: 会话ID
+    :param message: 用户消息
+    :param pool: 数据库连接池
+    :param has_images: 图片数量
+    :return: 异步生成器，生成事件字典
+    '''
+    started_at = time.monotonic()
+    model, model_name = globals.current_model, globals.current_model_name
+    try:
+        logger.info(f"[接收流式请求] session_id: {session_id}, message: {message}, has_images: {has_images}张图片")
+        cache_probe = await response_cache.probe(pool, session_id, message, model_name, has_images)
+        if cache_probe is None or cache_probe.answer is None:
+            graph_input, config = await prepare_turn(session_id, message, pool, has_images, started_at, model, model_name)
+            current_graph = get_graph()
+    except Exception as e:
+        logger.error(f"[错误] Chat error in chat_stream function: {str(e)}")
+        async def error_generator():
+            yield {"type": "error", "message": f"抱歉，处理消息时出现错误: {str(e)}"}
+        return error_generator()
+
+    async def event_generator():
+        last_response = None
+        first_token_at = None
+        final_state = {}
+        had_error = False
+        if cache_probe is not None and cache_probe.answer is not None:
+            # 命中回复缓存，整段回复作为一个片段发送
+            agent_metrics.time_to_first_token.observe(time.monotonic() - started_at)
+            agent_metrics.turn_latency.observe(time.monotonic() - started_at)
+            yield {"type": "token", "content": cache_probe.answer}
+            yield {
+                "type": "done",
+                "message": cache_probe.answer,
+                "ttft_ms": round((time.monotonic() - started_at) * 1000),
+                "cached": True
+            }
+            return
+        try:
+            # messages：模型逐段输出；custom：工具节点发出的进度事件；values：每步之后的完整状态
+            events = current_graph.astream(
+                input=graph_input,
+                config=config,
+                stream_mode=["messages", "custom", "values"],
+            )
+            async for mode, payload in events:
+                if mode == "messages":
+                    chunk, metadata = payload
+                    # 只转发对话节点的输出，工具内部调用模型产生的片段不转发
+                    if metadata.get("langgraph_node") != "chatbot" or not isinstance(chunk.content, str) or not chunk.content:
+                        continue
+                    if first_token_at is None:
+                        first_token_at = time.monotonic()
+                        agent_metrics.time_to_first_token.observe(first_token_at - started_at)
+                        logger.info(f"[首字延迟] {first_token_at - started_at:.2f}s")
+                    yield {"type": "token", "content": chunk.content}
+                elif mode == "custom":
+                    yield payload
+                elif mode == "values":
+                    final_state = payload
+                    had_error = had_error or bool(payload.get("error_info"))
+                    messages = payload.get("messages") or []
+                    if messages and isinstance(messages[-1], AIMessage):
+                        last_response = parse_response(messages[-1].content)
+
+            if last_response:
+                logger.info(f"[最终回复] {last_response}")
+                response_cache.store(
+                    cache_probe, last_response,
+                    final_state.get("messages", [])[len(graph_input["messages"]):],
+                    failed=had_error
+                )
+                yield {
+                    "type": "done",
+                    "message": last_response,
+                    "ttft_ms": None if first_token_at is None else round((first_token_at - started_at) * 1000)
+                }
+            else:
+                error_msg = "生成回复失败：没有有效的回复内容"
+                logger.error(f"[错误] {error_msg}")
+                yield {"type": "error", "message": error_msg}
+        except Exception as e:
+            error_msg = f"生成回复时出错: {str(e)}"
+            logger.error(f"[错误] {error_msg}")
+            yield {"type": "error", "message": error_msg}
+        finally:
+            agent_metrics.turn_latency.observe(time.monotonic() - started_at)
+
+    return event_generator()
+
 async def test_chat():
     """测试聊天功能"""
     try:
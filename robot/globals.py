@@ -12,6 +12,9 @@ current_session_id = None
 # 当前使用的模型
 current_model = model  # 默认使用 llms 中的默认模型 
 
+# 当前使用的模型名称，用于按模型缓存绑定了工具的模型实例
+current_model_name = "glm-4-plus"
+
 # 当前AI规则
 current_ai_rules = None  # 存储用户的个性化AI规则
 
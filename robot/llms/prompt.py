@@ -389,6 +389,27 @@ def gen_prompt(query):
     )
     return prompt
 
+# 固定的系统前缀：聊天角色说明、基础角色定义和最佳实践只在系统消息中出现一次，
+# 用户消息不再逐轮包装；前缀内容不随对话变化，模型服务可以复用前缀缓存
+system_prefix_template = """{chat_role}
+{system_role}
+最佳实践参考:
+{best_practices}
+"""
+
+SYSTEM_PREFIX_PROMPT = system_prefix_template.format(
+    chat_role=CHAT_SYSTEM_PROMPT,
+    system_role=BASE_SYSTEM_PROMPT,
+    best_practices=best_practices_prompt,
+)
+
+def get_system_prefix(with_guidance: bool = True):
+    """
+    获取固定的系统前缀消息
+    :param with_guidance: 是否包含基础角色定义和最佳实践，否则只有聊天系统提示
+    """
+    return SystemMessage(content=SYSTEM_PREFIX_PROMPT if with_guidance else CHAT_SYSTEM_PROMPT)
+
 def get_chat_system_message():
     """获取聊天系统消息"""
     return SystemMessage(content=CHAT_SYSTEM_PROMPT)
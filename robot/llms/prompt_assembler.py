@@ -0,0 +1,165 @@
+"""
+按token预算拼接每轮对话的消息
+
+原先每轮把系统提示、个性化规则、最多10轮历史以及经 gen_prompt 包装的用户消息（其中重复了
+整段 BASE_SYSTEM_PROMPT 和全部最佳实践）依次拼接，提示长度随回复变长而不受限制地增长。
+这里改为：
+- 静态的角色说明和最佳实践只放在固定的系统前缀中（get_system_prefix），用户消息保持原文
+- 用当前模型的分词器计数，历史消息从最新一轮开始向前放入，直到用完预算
+- 记录每轮的提示token数；按 PROMPT_COMPARE_RATE 抽样记录与原先拼接方式相比节省的token数
+"""
+import logging
+import os
+import re
+from functools import lru_cache
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+logger = logging.getLogger(__name__)
+
+# 每轮提示（系统前缀、规则、历史、用户消息）的token预算
+PROMPT_TOKEN_BUDGET = int(os.getenv("ROBOT_PROMPT_TOKEN_BUDGET", 8000))
+
+# 最多放入的历史轮数
+MAX_HISTORY_TURNS = int(os.getenv("ROBOT_MAX_HISTORY_TURNS", 20))
+
+# 按原先的拼接方式重新计数、统计节省量的轮次比例（0~1）。需要再做一遍完整的分词，
+# 默认不统计，评估时打开
+PROMPT_COMPARE_RATE = float(os.getenv("ROBOT_PROMPT_COMPARE_RATE", 0))
+
+# 每条消息的角色标记等格式开销（token）
+MESSAGE_OVERHEAD = 4
+
+# 各模型对应的分词器（HuggingFace 模型ID或本地目录）；未列出或加载失败时按字符估算。
+# glm-4-plus 为在线API，没有公开的分词器，使用估算
+MODEL_TOKENIZERS = {
+    "deepseek-r1-1.5b": "deepseek-ai/DeepSeek-R1-Distill-Qwen-1.5B",
+    "qwen2.5-1.5b": "Qwen/Qwen2.5-1.5B-Instruct",
+    "llama3.2-3b": "meta-llama/Llama-3.2-3B-Instruct",
+    "deepseek-v3-latest": "deepseek-ai/DeepSeek-V3",
+}
+
+_CJK_PATTERN = re.compile(r"[　-〿㐀-䶿一-鿿＀-￯]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    没有分词器时的保守估算：中日韩字符及全角标点每个按1个token计，其余字符每4个按1个token计
+    （常见中文分词器约每1.5个汉字1个token，估算偏大，不会超出预算）
+    """
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(model_name: str) -> Callable[[str], int]:
+    """返回模型对应的计数函数，分词器只加载一次"""
+    tokenizer_id = os.getenv(f"ROBOT_TOKENIZER_{re.sub(r'[^0-9A-Za-z]', '_', model_name).upper()}",
+                             MODEL_TOKENIZERS.get(model_name))
+    if tokenizer_id:
+        try:
+            from transformers import AutoTokenizer
+
+            tokenizer = AutoTokenizer.from_pretrained(tokenizer_id)
+            logger.info(f"模型 {model_name} 使用分词器 {tokenizer_id} 计数")
+            return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+        except Exception as e:
+            logger.warning(f"加载分词器 {tokenizer_id} 失败，按字符估算token数: {str(e)}")
+    return estimate_tokens
+
+
+class AssembledPrompt:
+    """拼接结果"""
+
+    def __init__(self, messages: List[BaseMessage], prompt_tokens: int, history_turns: int, dropped_turns: int):
+        self.messages = messages
+        self.prompt_tokens = prompt_tokens  # 本轮提示的token数
+        self.history_turns = history_turns  # 放入的历史轮数
+        self.dropped_turns = dropped_turns  # 因超出预算未放入的历史轮数
+
+
+class PromptAssembler:
+    """按token预算拼接系统前缀、附加的系统消息、历史和用户消息"""
+
+    def __init__(
+        self,
+        count_tokens: Callable[[str], int],
+        budget: int = PROMPT_TOKEN_BUDGET,
+        max_history_turns: int = MAX_HISTORY_TURNS
+    ):
+        """
+        Args:
+            count_tokens: 文本的token计数函数，通常为 get_token_counter(模型名称)
+            budget: 整个提示的token预算
+            max_history_turns: 最多放入的历史轮数
+        """
+        self.count_tokens = count_tokens
+        self.budget = budget
+        self.max_history_turns = max_history_turns
+
+    def message_tokens(self, message: BaseMessage) -> int:
+        return self.count_tokens(message.content if isinstance(message.content, str) else str(message.content)) \
+            + MESSAGE_OVERHEAD
+
+    def assemble(
+        self,
+        system_messages: Sequence[BaseMessage],
+        history: Sequence[Tuple[Optional[str], Optional[str]]],
+        user_message: str,
+        extra_messages: Sequence[BaseMessage] = ()
+    ) -> AssembledPrompt:
+        """
+        Args:
+            system_messages: 系统前缀与个性化规则等，总是放入
+            history: 历史的 (用户消息, 回复)，按时间从旧到新
+            user_message: 本轮用户消息
+            extra_messages: 放在用户消息之后的消息（如图片分析结果），总是放入
+
+        Returns:
+            拼接结果；固定部分本身超出预算时不放入历史
+        """
+        current = HumanMessage(content=user_message)
+        used = sum(self.message_tokens(m) for m in (*system_messages, current, *extra_messages))
+
+        # 从最新一轮开始向前放入，某一轮放不下时停止，保持历史连续
+        kept: List[List[BaseMessage]] = []
+        recent = list(history)[-self.max_history_turns:] if self.max_history_turns > 0 else []
+        for user_msg, bot_msg in reversed(recent):
+            turn = [HumanMessage(content=user_msg)] if user_msg else []
+            if bot_msg:
+                turn.append(AIMessage(content=bot_msg))
+            tokens = sum(self.message_tokens(m) for m in turn)
+            if used + tokens > self.budget:
+                break
+            used += tokens
+            kept.append(turn)
+
+        messages = list(system_messages)
+        for turn in reversed(kept):
+            messages.extend(turn)
+        messages.append(current)
+        messages.extend(extra_messages)
+        return AssembledPrompt(
+            messages=messages,
+            prompt_tokens=used,
+            history_turns=len(kept),
+            dropped_turns=len(history) - len(kept)
+        )
+
+    def legacy_tokens(
+        self,
+        system_messages: Sequence[BaseMessage],
+        history: Sequence[Tuple[Optional[str], Optional[str]]],
+        wrapped_user_message: str,
+        extra_messages: Sequence[BaseMessage] = (),
+        history_turns: int = 10
+    ) -> int:
+        """原先的拼接方式（最多10轮完整历史，用户消息经 gen_prompt 包装）的token数，用于统计节省量"""
+        messages = [*system_messages, HumanMessage(content=wrapped_user_message), *extra_messages]
+        for user_msg, bot_msg in list(history)[-history_turns:]:
+            if user_msg:
+                messages.append(HumanMessage(content=user_msg))
+            if bot_msg:
+                messages.append(AIMessage(content=bot_msg))
+        return sum(self.message_tokens(m) for m in messages)
@@ -0,0 +1,204 @@
+"""
+预加载后fork的多worker启动方式（仅Linux/macOS）
+
+uvicorn 自带的多worker模式以spawn方式启动子进程，每个worker各自导入torch并加载
+text2vec嵌入模型、索引和ViT模型。这里改为由主进程导入应用并加载这些只读资源，
+再fork出worker：模型权重和各类数组在fork后以写时复制的方式共享，worker只为
+自己写过的页付出内存。
+
+- 索引快照的向量、过敏原掩码、BM25倒排等数组本身以只读内存映射方式打开，数据页属于
+  页缓存，引用计数的写入只落在数组对象头上，不会复制数据页
+- 分块文档等Python对象在被访问时会因引用计数写入而逐步复制；fork前调用 gc.freeze()，
+  避免垃圾回收遍历这些对象时把整个对象图写脏
+- 异步资源（Neo4j连接）和数据库连接池绑定事件循环，由各worker在启动时自行创建
+
+主进程不做嵌入推理（torch的线程池等状态在fork后不可用）：当前数据的索引快照不存在时，
+先在子进程中运行 python -m robot.retrieval.build_index 构建，失败则直接退出，主进程只加载快照。
+"""
+import gc
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Dict, Iterable, List, Optional
+
+from robot.retrieval import process_memory
+
+logger = logging.getLogger(__name__)
+
+# 主进程预加载的只读组件
+PRELOAD_COMPONENTS = ["embeddings", "corpus_index", "nutrient_table", "food_predictor"]
+
+# worker启动后多久由主进程记录一次各worker的内存（秒）
+MEMORY_REPORT_DELAY = float(os.getenv("ROBOT_MEMORY_REPORT_DELAY", 30))
+
+
+def worker_memory_report(pids: Iterable[int]) -> List[Dict[str, float]]:
+    """读取各worker的内存占用（MB），已退出的进程被忽略"""
+    report = []
+    for pid in pids:
+        memory = process_memory(pid)
+        if memory:
+            report.append({"pid": pid, **{name: round(value, 1) for name, value in memory.items()}})
+    return report
+
+
+def log_worker_memory(pids: Iterable[int]):
+    """记录各worker的独占内存（USS）、均摊内存（PSS）和共享内存"""
+    for memory in worker_memory_report(pids):
+        logger.info(
+            f"worker {memory['pid']} 内存: USS {memory['uss']}MB，PSS {memory['pss']}MB，"
+            f"共享 {memory['shared']}MB，RSS {memory['rss']}MB"
+        )
+
+
+def ensure_snapshot():
+    """
+    确保当前数据的索引快照已存在：不存在时在子进程中构建，主进程不加载构建所需的推理状态
+
+    Raises:
+        RuntimeError: 构建失败或构建后仍找不到快照
+    """
+    from robot.retrieval import snapshot_exists
+    from robot.tools import rag
+
+    if snapshot_exists(rag.INDEX_DIR, rag.get_snapshot_key()):
+        return
+    logger.info("未找到当前数据的索引快照，在子进程中构建")
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-m", "robot.retrieval.build_index"], cwd=project_root)
+    if result.returncode != 0:
+        raise RuntimeError(
+            f"构建索引快照失败（退出码 {result.returncode}），请先运行 python -m robot.retrieval.build_index"
+        )
+    # 构建期间数据文件又发生变化时快照键不同，不在主进程中补建
+    if not snapshot_exists(rag.INDEX_DIR, rag.get_snapshot_key()):
+        raise RuntimeError("构建完成后仍未找到当前数据的索引快照，数据文件可能在构建期间发生了变化")
+
+
+def preload_components(components: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    同步加载只读组件并冻结垃圾回收，之后即可fork；预加载语料索引时先确保快照已构建
+
+    Returns:
+        成功加载的组件名称
+    """
+    from robot.tools import resources
+
+    components = list(PRELOAD_COMPONENTS if components is None else components)
+    if "corpus_index" in components:
+        ensure_snapshot()
+    loaded = resources.preload(components)
+    # 把已有对象移出垃圾回收的跟踪范围，fork后回收时不再写入这些对象所在的页
+    gc.collect()
+    gc.freeze()
+    return loaded
+
+
+def preload_app(app: str, components: Optional[Iterable[str]] = None):
+    """
+    在主进程中导入应用并预加载只读组件
+
+    Returns:
+        应用对象
+    """
+    from uvicorn.importer import import_from_string
+
+    started_at = time.perf_counter()
+    app_object = import_from_string(app)
+    loaded = preload_components(components)
+    logger.info(
+        f"主进程预加载完成，耗时 {time.perf_counter() - started_at:.2f}s，已加载组件: {loaded}，"
+        f"主进程内存: {process_memory().get('rss', 0.0):.1f}MB"
+    )
+    return app_object
+
+
+def _run_worker(config, sock):
+    """worker进程入口：在继承的监听socket上运行uvicorn服务"""
+    import uvicorn
+
+    # 恢复默认信号处理，由uvicorn重新安装自己的处理函数
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def serve(
+    app: str,
+    host: str,
+    port: int,
+    workers: int,
+    components: Optional[Iterable[str]] = None
+):
+    """
+    预加载后fork出多个worker并监管：worker异常退出时重新fork，收到SIGINT/SIGTERM时
+    通知全部worker优雅退出
+
+    Args:
+        app: 应用的导入路径，例如 "robot.chat_routes:app"
+        host: 监听地址
+        port: 监听端口
+        workers: worker数量
+        components: 预加载的组件，默认 PRELOAD_COMPONENTS
+    """
+    import uvicorn
+
+    app_object = preload_app(app, components)
+    config = uvicorn.Config(app_object, host=host, port=port)
+    sock = config.bind_socket()
+
+    children: Dict[int, int] = {}
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                _run_worker(config, sock)
+            except BaseException:
+                logger.exception("worker异常退出")
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+        children[pid] = time.monotonic()
+        logger.info(f"已启动worker {pid}")
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for _ in range(workers):
+        spawn()
+
+    report_at = time.monotonic() + MEMORY_REPORT_DELAY
+    try:
+        while children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                if report_at is not None and time.monotonic() >= report_at:
+                    log_worker_memory(children)
+                    report_at = None
+                time.sleep(0.5)
+                continue
+            if pid not in children:
+                continue
+            del children[pid]
+            if not stopping:
+                logger.warning(f"worker {pid} 已退出（状态 {status}），重新启动")
+                spawn()
+    except ChildProcessError:
+        pass
+    finally:
+        sock.close()
+    logger.info("全部worker已退出")
@@ -0,0 +1,210 @@
+"""
+按语义相似度命中的回复缓存（默认关闭，ROBOT_RESPONSE_CACHE=true 启用）
+
+很多用户会问相同的通用问题（"感冒吃什么好"、"高血压饮食注意"），每次都要走一轮多工具的
+智能体对话。这里用检索所用的嵌入模型对规范化后的问题做嵌入，在与本轮上下文（会话所属用户的
+过敏原、是否启用个性化规则及规则内容、本轮使用的模型）相同的已缓存回复中查找最相似的一条，
+相似度不低于阈值时直接返回。查找在加载历史、摘要和拼接提示之前进行。
+
+- 只用于会话的第一轮：之后的问题（"详细说说"、"那晚餐呢"）依赖本会话的历史和摘要，
+  不能与其他会话共用回复。第一轮时 chat_history 工具查不到任何记录，不影响回复
+- 上下文按请求从数据库读取会话所属用户的档案和规则，模型名称由调用方在请求开始时取定，
+  不读取会被其他用户的请求修改的全局变量
+- 保存建议、图片识别、个性化建议等有副作用、依赖本轮输入或依赖用户个人数据的工具被调用、
+  有工具执行失败、带图片或生成出错时不写入缓存
+"""
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+
+from robot.retrieval import SemanticCache, normalize_query
+
+logger = logging.getLogger(__name__)
+
+# 是否启用回复缓存
+RESPONSE_CACHE_ENABLED = os.getenv("ROBOT_RESPONSE_CACHE", "false").lower() == "true"
+
+# 命中所需的最低余弦相似度
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("ROBOT_RESPONSE_CACHE_THRESHOLD", 0.92))
+
+# 缓存回复的存活时间（秒）
+RESPONSE_CACHE_TTL = float(os.getenv("ROBOT_RESPONSE_CACHE_TTL", 86400))
+
+# 缓存的最大条目数
+RESPONSE_CACHE_SIZE = int(os.getenv("ROBOT_RESPONSE_CACHE_SIZE", 2048))
+
+# 本轮调用过其中任何一个时回复不写入缓存：保存建议有副作用，图片识别依赖本轮上传的图片，
+# 个性化建议依赖用户档案和饮食记录（其结果由工具结果缓存按用户缓存）
+UNCACHEABLE_TOOLS = {"save_health_advice", "image_parser", "generate_personalized_advice"}
+
+response_cache = SemanticCache(
+    threshold=RESPONSE_CACHE_THRESHOLD,
+    maxsize=RESPONSE_CACHE_SIZE,
+    ttl=RESPONSE_CACHE_TTL
+)
+
+# 写入缓存的回复数，以及未查找或未写入缓存的轮数，按原因统计
+_stored = 0
+_skipped: Dict[str, int] = {"follow_up": 0, "uncacheable_tool": 0, "failed": 0}
+
+
+class ResponseCacheProbe:
+    """一次缓存查找的结果，未命中时用于在本轮结束后写入回复"""
+
+    def __init__(
+        self,
+        question: str,
+        context: str,
+        vector: List[float],
+        answer: Optional[str],
+        similarity: float
+    ):
+        self.question = question
+        self.context = context  # 本轮上下文的哈希，作为缓存分区
+        self.vector = vector
+        self.answer = answer  # 命中的回复，未命中时为None
+        self.similarity = similarity
+
+
+async def load_session_context(pool, session_id) -> Optional[Tuple[List[str], Optional[str], bool]]:
+    """
+    一次查询会话所属用户档案中的过敏信息、用户的个性化规则，以及会话中是否已有完成的对话
+
+    Returns:
+        (过敏原, 启用的个性化规则, 是否已有对话)；规则未启用或为空时为None，会话不存在时返回None
+    """
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """
+                SELECT p.allergies, u.ai_rules, u.is_rules_enabled,
+                    EXISTS(SELECT 1 FROM chat_records c WHERE c.session_id = s.session_id AND c.bot_response IS NOT NULL)
+                FROM robot_sessions s
+                LEFT JOIN user_profiles p ON p.user_id = s.user_id
+                LEFT JOIN user_preferences u ON u.user_id = s.user_id
+                WHERE s.session_id = %s
+                """,
+                (session_id,)
+            )
+            result = await cur.fetchone()
+    if not result:
+        return None
+    allergies, rules, rules_enabled, has_history = result
+    if isinstance(allergies, str):
+        allergies = json.loads(allergies)
+    return (
+        sorted(str(allergy) for allergy in allergies or []),
+        rules if rules_enabled and rules else None,
+        bool(has_history)
+    )
+
+
+def context_key(allergies: Sequence[str], rules: Optional[str], model_name: str) -> str:
+    """影响回复的本轮上下文的哈希，上下文不同的请求互不命中"""
+    context = {
+        "allergies": sorted(allergies),
+        "rules": rules,
+        "model": model_name
+    }
+    return hashlib.sha1(json.dumps(context, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+async def probe(pool, session_id, question: str, model_name: str, has_images: int = 0) -> Optional[ResponseCacheProbe]:
+    """
+    查找问题的缓存回复，在准备本轮对话（加载历史、摘要、拼接提示）之前调用
+
+    Args:
+        model_name: 本轮使用的模型名称，由调用方在请求开始时取定
+
+    Returns:
+        查找结果；未启用、带图片、问题为空、会话已有对话、会话不存在或查找失败时返回None，
+        本轮也不写入缓存
+    """
+    if not RESPONSE_CACHE_ENABLED or has_images or not normalize_query(question):
+        return None
+    try:
+        from robot.tools import rag
+
+        session = await load_session_context(pool, session_id)
+        if session is None:
+            return None
+        allergies, rules, has_history = session
+        if has_history:
+            _skipped["follow_up"] += 1
+            return None
+        context = context_key(allergies, rules, model_name)
+        embeddings = await rag.embeddings_resource.aget()
+        # 嵌入模型会先规范化问题文本，同一问题的不同写法得到相同的向量
+        vector = await embeddings.aembed_query(question)
+    except Exception as e:
+        logger.warning(f"回复缓存查找失败，跳过缓存: {str(e)}")
+        return None
+    entry, similarity, _ = response_cache.lookup([context], vector)
+    if entry is not None:
+        logger.info(f"[回复缓存] 命中，相似度 {similarity:.3f}，缓存问题: {entry['question']}")
+    return ResponseCacheProbe(
+        question, context, vector, None if entry is None else entry["answer"], similarity
+    )
+
+
+def tools_used(messages: Sequence[BaseMessage]) -> List[str]:
+    """本轮消息中调用过的工具"""
+    return [
+        tool_call["name"]
+        for message in messages if isinstance(message, AIMessage)
+        for tool_call in (message.tool_calls or [])
+    ]
+
+
+def store(
+    probe: Optional[ResponseCacheProbe],
+    answer: Optional[str],
+    turn_messages: Sequence[BaseMessage],
+    failed: bool = False
+) -> bool:
+    """
+    本轮结束后写入回复
+
+    Args:
+        probe: 本轮开始时的查找结果
+        answer: 最终回复
+        turn_messages: 本轮新产生的消息，用于判断调用过的工具
+        failed: 本轮是否经过错误处理
+
+    Returns:
+        是否写入
+    """
+    if probe is None or probe.answer is not None or not answer:
+        return False
+    global _stored
+    if UNCACHEABLE_TOOLS.intersection(tools_used(turn_messages)):
+        _skipped["uncacheable_tool"] += 1
+        return False
+    if failed or answer.startswith("抱歉") or any(
+        isinstance(message, ToolMessage) and message.status == "error" for message in turn_messages
+    ):
+        _skipped["failed"] += 1
+        return False
+    response_cache.set(probe.context, probe.vector, {"question": probe.question, "answer": answer})
+    _stored += 1
+    return True
+
+
+def get_response_cache_stats() -> Dict[str, Any]:
+    """
+    回复缓存的命中率、淘汰与过期次数、写入与未写入的轮数
+
+    store_rate 为查找未命中的轮次中回复被写入缓存的比例，用于评估缓存能否积累起来
+    """
+    attempted = _stored + _skipped["uncacheable_tool"] + _skipped["failed"]
+    return {
+        "enabled": RESPONSE_CACHE_ENABLED,
+        **response_cache.stats(),
+        "stored": _stored,
+        "skipped": dict(_skipped),
+        "store_rate": round(_stored / attempted, 4) if attempted else 0.0
+    }
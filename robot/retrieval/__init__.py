@@ -0,0 +1,38 @@
+"""
+检索模块
+提供RAG语料的分块加载、向量索引构建、增量更新与快照、相似度与BM25混合检索、IVF近似最近邻检索、
+向量压缩存储、查询与结果缓存、按相似度命中的语义缓存、批量嵌入、ONNX嵌入后端、营养成分列式查询以及过敏原过滤功能
+"""
+
+from .snapshot import compute_snapshot_key, compute_config_id, save_snapshot, load_snapshot, latest_snapshot, \
+    snapshot_exists
+from .vector_index import MatrixVectorStore, normalize_rows, top_k_indices
+from .cache import TTLCache
+from .semantic_cache import SemanticCache
+from .embedding_cache import CachedQueryEmbeddings, normalize_query, canonical_query
+from .nutrient_table import NutrientTable, parse_range_conditions
+from .matcher import MultiPatternMatcher
+from .allergen_mask import AllergenIndex, allowed_rows
+from .corpus import CorpusIndex
+from .intent import IntentClassifier, QueryIntent
+from .ann import IVFFlatIndex
+from .quantization import QuantizedMatrix, STORAGE_TYPES
+from .lexical import BM25Index, tokenize, reciprocal_rank_fusion
+from .metrics import Histogram, process_memory
+from .batching import BatchingEmbeddings
+from .onnx_embeddings import OnnxEmbeddings
+from .ingest import FOOD_TEMPLATE, RECIPE_TEMPLATE, render_row, render_frame, iter_document_batches, row_hash, \
+    IncrementalBuild, embed_incrementally
+
+__all__ = [
+    'compute_snapshot_key', 'compute_config_id', 'save_snapshot', 'load_snapshot', 'latest_snapshot', 'snapshot_exists',
+    'MatrixVectorStore', 'normalize_rows', 'top_k_indices',
+    'TTLCache', 'SemanticCache', 'CachedQueryEmbeddings', 'normalize_query', 'canonical_query',
+    'NutrientTable', 'parse_range_conditions',
+    'MultiPatternMatcher', 'AllergenIndex', 'allowed_rows', 'CorpusIndex',
+    'IntentClassifier', 'QueryIntent',
+    'IVFFlatIndex', 'QuantizedMatrix', 'STORAGE_TYPES', 'BM25Index', 'tokenize', 'reciprocal_rank_fusion',
+    'Histogram', 'process_memory', 'BatchingEmbeddings', 'OnnxEmbeddings',
+    'FOOD_TEMPLATE', 'RECIPE_TEMPLATE', 'render_row', 'render_frame', 'iter_document_batches', 'row_hash',
+    'IncrementalBuild', 'embed_incrementally'
+]
@@ -0,0 +1,117 @@
+import logging
+from typing import Any, Dict, Iterable, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .matcher import MultiPatternMatcher
+
+logger = logging.getLogger(__name__)
+
+# 参与过敏原匹配的食谱字段
+RECIPE_INGREDIENT_FIELDS = ['主料', '辅料', '调料']
+
+# 除 common_names 外的匹配词：具体的食材、调料名称。
+# allergens_data.json 中的 common_foods 是"海鲜"、"面包"、"中式菜肴"这类可能含有该过敏原的
+# 泛称，作为子串匹配会把大量无关食物标为含过敏原，不参与匹配
+ALLERGEN_TERMS = {
+    'milk': ['乳酪', '芝士', '奶粉', '炼乳', '淡奶', '乳清'],
+    'eggs': ['鸭蛋', '鹅蛋', '鹌鹑蛋', '咸蛋', '皮蛋', '松花蛋', '蛋清'],
+    'peanuts': ['花生米'],
+    'tree_nuts': ['松子', '碧根果', '夏威夷果', '巴旦木'],
+    'wheat': ['面条', '挂面', '馒头', '面包'],
+    'soy': ['黄豆', '酱油', '腐竹', '豆皮', '腐乳', '毛豆', '味噌'],
+    'fish': [],
+    'shellfish': ['扇贝', '牡蛎', '生蚝', '蚝油', '贻贝', '青口', '蛏子', '花甲', '鲍鱼', '海螺'],
+    'sesame': ['麻油', '香油', '麻酱'],
+    'mustard': [],
+}
+
+# 各过敏原的排除词：匹配词出现在这些词之内时不算命中，例如"鱼"出现在"鱼腥草"（蔬菜）、
+# "鱿鱼"（软体动物）中，"蛋白"出现在"蛋白质"中
+ALLERGEN_EXCLUSIONS = {
+    'milk': ['奶油生菜', '奶油南瓜'],
+    'eggs': ['蛋白质', '大豆蛋白', '植物蛋白', '乳清蛋白', '鸡蛋果'],
+    'wheat': ['荞麦面', '荞麦面粉', '荞麦面条', '玉米面粉', '面包果'],
+    'soy': ['杏仁豆腐'],
+    'fish': ['鱼腥草', '鱿鱼', '墨鱼', '章鱼', '鲍鱼', '甲鱼', '鳄鱼', '娃娃鱼', '鱼香'],
+    'shellfish': ['蟹味菇'],
+}
+
+
+class AllergenIndex:
+    """
+    过敏原位掩码索引
+
+    每种过敏原对应一个比特位。索引构建时用一个多模式匹配自动机扫描食物名称
+    以及食谱的主料、辅料、调料，得到每个分块的过敏原位掩码；检索时只需一次
+    按位与即可得到允许返回的行。匹配词出现在同一过敏原的排除词之内时不算命中。
+    """
+
+    def __init__(self, allergens_data: Dict[str, Any]):
+        """
+        Args:
+            allergens_data: allergens_data.json 的内容，使用每种过敏原的
+                common_names 以及 ALLERGEN_TERMS 中的词作为匹配词
+        """
+        common_allergens = allergens_data['common_allergens']
+        if len(common_allergens) > 64:
+            raise ValueError(f"过敏原种类过多: {len(common_allergens)}，最多支持64种")
+
+        self.bits = {name: 1 << i for i, name in enumerate(common_allergens)}
+        patterns = []
+        for name, info in common_allergens.items():
+            terms = set(info.get('common_names', [])) | set(ALLERGEN_TERMS.get(name, []))
+            # 载荷为 (比特位, 是否为排除词)
+            patterns.extend((term, (self.bits[name], False)) for term in terms)
+            patterns.extend((term, (self.bits[name], True)) for term in ALLERGEN_EXCLUSIONS.get(name, []))
+        self.matcher = MultiPatternMatcher(patterns)
+
+    def bits_for(self, allergens: Iterable[str]) -> int:
+        """将过敏原名称列表转换为位掩码，未知的过敏原被忽略"""
+        bits = 0
+        for allergen in allergens or []:
+            bits |= self.bits.get(allergen, 0)
+        return bits
+
+    def text_mask(self, text: str) -> int:
+        """计算一段文本命中的过敏原位掩码"""
+        hits = []
+        exclusions = []
+        for start, pattern, (bit, excluded) in self.matcher.iter_matches(text):
+            (exclusions if excluded else hits).append((start, start + len(pattern), bit))
+        mask = 0
+        for start, end, bit in hits:
+            if not any(
+                bit == excl_bit and excl_start <= start and end <= excl_end
+                for excl_start, excl_end, excl_bit in exclusions
+            ):
+                mask |= bit
+        return mask
+
+    def document_mask(self, metadata: Dict[str, Any]) -> int:
+        """根据文档metadata计算过敏原位掩码"""
+        if metadata.get('数据类型') == '食谱':
+            text = '\n'.join(str(metadata.get(field, '')) for field in RECIPE_INGREDIENT_FIELDS)
+        else:
+            text = str(metadata.get('食物名称', ''))
+        return self.text_mask(text)
+
+    def compute_masks(self, documents: Sequence[Document]) -> np.ndarray:
+        """计算每个分块的过敏原位掩码"""
+        masks = np.fromiter(
+            (self.document_mask(doc.metadata) for doc in documents),
+            dtype=np.uint64,
+            count=len(documents)
+        )
+        logger.info(f"过敏原位掩码计算完成，{int(np.count_nonzero(masks))}/{len(masks)} 个分块含过敏原")
+        return masks
+
+    def compute_name_masks(self, names: Iterable[str]) -> np.ndarray:
+        """计算一组食物名称的过敏原位掩码"""
+        return np.fromiter((self.text_mask(str(name)) for name in names), dtype=np.uint64)
+
+
+def allowed_rows(masks: np.ndarray, bits: int) -> np.ndarray:
+    """返回不含指定过敏原的行掩码"""
+    return (masks & np.uint64(bits)) == 0
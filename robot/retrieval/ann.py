@@ -0,0 +1,225 @@
+import logging
+import math
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .quantization import QuantizedMatrix, encode_vectors
+from .vector_index import normalize_rows, top_k_indices
+
+logger = logging.getLogger(__name__)
+
+# 快照中保存倒排文件索引所用数组的名称前缀
+ARRAY_PREFIX = "ivf_"
+
+# 分配所属聚类时每块处理的向量数，限制临时得分矩阵的内存
+ASSIGN_BLOCK_SIZE = 65536
+
+
+def default_n_lists(n: int) -> int:
+    """聚类数的默认值：约为 sqrt(n)，每个倒排列表平均约 sqrt(n) 个向量"""
+    return max(1, min(n, int(round(math.sqrt(n)))))
+
+
+def assign_lists(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """按内积将每个（已归一化的）向量分配到最近的聚类中心，分块计算"""
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_BLOCK_SIZE):
+        block = np.asarray(vectors[start:start + ASSIGN_BLOCK_SIZE], dtype=np.float32)
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def spherical_kmeans(
+    vectors: np.ndarray,
+    n_clusters: int,
+    n_iter: int = 10,
+    seed: int = 0
+) -> np.ndarray:
+    """
+    球面k-means：按余弦相似度聚类，中心每轮重新归一化
+
+    空聚类用随机样本重新初始化，避免倒排列表数量因训练退化而减少。
+
+    Returns:
+        (n_clusters, dim) 的归一化聚类中心
+    """
+    rng = np.random.default_rng(seed)
+    centroids = np.array(vectors[rng.choice(len(vectors), n_clusters, replace=False)], dtype=np.float32)
+    for _ in range(n_iter):
+        assignments = assign_lists(vectors, centroids)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        # 按聚类排序后分段求和，比逐行 np.add.at 快得多
+        order = np.argsort(assignments, kind='stable')
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        nonempty = np.flatnonzero(counts)
+        sums = np.zeros_like(centroids)
+        sums[nonempty] = np.add.reduceat(vectors[order], starts[nonempty], axis=0)
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+class IVFFlatIndex:
+    """
+    倒排文件（IVF-Flat）近似最近邻索引
+
+    用球面k-means把向量划分为 n_lists 个聚类，查询时只对与查询最相近的 n_probe 个
+    聚类内的向量精确打分，单次查询的计算量约为 n_lists + N * n_probe / n_lists。
+    n_probe 越大召回越高、延迟越高，n_probe == n_lists 时等价于精确检索。
+
+    倒排列表以 CSR 形式存放：第i个聚类的向量位于 list_vectors 的 [list_ptr[i], list_ptr[i+1]) 区间，
+    对应的原始行号在 list_rows 的同一区间。向量按聚类连续存放，每个聚类的打分是对一段
+    连续内存的矩阵-向量乘法，比按行号零散取出向量快数倍；启用该索引后检索不再访问
+    向量存储的原矩阵，原矩阵的内存映射页不会被读入。list_vectors 也可以是压缩存储的
+    QuantizedMatrix，此时返回的得分是近似值。
+    """
+
+    def __init__(
+        self,
+        list_vectors: Union[np.ndarray, QuantizedMatrix],
+        centroids: np.ndarray,
+        list_ptr: np.ndarray,
+        list_rows: np.ndarray,
+        n_probe: int = 8
+    ):
+        """
+        Args:
+            list_vectors: 按聚类排列的已L2归一化向量（float32矩阵或压缩存储）
+            centroids: (n_lists, dim) 的归一化聚类中心
+            list_ptr: 长度为 n_lists + 1 的倒排列表偏移
+            list_rows: list_vectors 每一行对应的原始行号
+            n_probe: 默认每次查询扫描的聚类数
+        """
+        if len(list_rows) != len(list_vectors) or list_ptr[-1] != len(list_rows):
+            raise ValueError(f"倒排列表行数 {len(list_rows)} 与向量数量 {len(list_vectors)} 不一致")
+        self.list_vectors = list_vectors
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.list_ptr = np.asarray(list_ptr)
+        self.list_rows = list_rows
+        self.n_probe = n_probe
+
+    @classmethod
+    def build(
+        cls,
+        vectors: np.ndarray,
+        n_lists: Optional[int] = None,
+        n_iter: int = 10,
+        sample_size: Optional[int] = None,
+        n_probe: int = 8,
+        seed: int = 0,
+        storage: str = 'float32'
+    ) -> 'IVFFlatIndex':
+        """
+        训练聚类中心并构建倒排列表
+
+        Args:
+            vectors: 已L2归一化的向量矩阵
+            n_lists: 聚类数，为None时取 default_n_lists
+            n_iter: k-means迭代轮数
+            sample_size: 训练聚类中心所用的样本数，为None时取 64 * n_lists；
+                训练完成后全部向量再分配一次
+            n_probe: 默认每次查询扫描的聚类数
+            seed: 随机种子，相同输入得到相同索引
+            storage: 倒排列表中向量的存储类型，见 quantization.STORAGE_TYPES
+        """
+        n = len(vectors)
+        if n == 0:
+            raise ValueError("不能对空向量矩阵构建索引")
+        n_lists = min(n, n_lists or default_n_lists(n))
+        sample_size = min(n, max(n_lists, sample_size or 64 * n_lists))
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(n, sample_size, replace=False)) if sample_size < n else slice(None)
+        sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+
+        centroids = spherical_kmeans(sample, n_lists, n_iter, seed)
+        assignments = assign_lists(vectors, centroids)
+        list_rows = np.argsort(assignments, kind='stable')
+        list_ptr = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=n_lists), out=list_ptr[1:])
+        list_vectors = encode_vectors(np.take(np.asarray(vectors, dtype=np.float32), list_rows, axis=0), storage)
+        logger.info(f"IVF索引构建完成：{n} 个向量，{n_lists} 个聚类（训练样本 {sample_size}）")
+        return cls(list_vectors, centroids, list_ptr, list_rows, n_probe)
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """导出为可写入快照的数组"""
+        if self.quantized:
+            arrays = self.list_vectors.to_arrays(f"{ARRAY_PREFIX}vectors_")
+        else:
+            arrays = {f"{ARRAY_PREFIX}vectors": self.list_vectors}
+        arrays.update({
+            f"{ARRAY_PREFIX}centroids": self.centroids,
+            f"{ARRAY_PREFIX}list_ptr": self.list_ptr,
+            f"{ARRAY_PREFIX}list_rows": self.list_rows,
+        })
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], n_probe: int = 8) -> Optional['IVFFlatIndex']:
+        """从快照数组恢复索引，数组不全时返回None"""
+        names = ('centroids', 'list_ptr', 'list_rows')
+        if any(f"{ARRAY_PREFIX}{name}" not in arrays for name in names):
+            return None
+        list_vectors = arrays.get(f"{ARRAY_PREFIX}vectors")
+        if list_vectors is None:
+            list_vectors = QuantizedMatrix.from_arrays(arrays, f"{ARRAY_PREFIX}vectors_")
+        if list_vectors is None:
+            return None
+        return cls(list_vectors, *(arrays[f"{ARRAY_PREFIX}{name}"] for name in names), n_probe=n_probe)
+
+    @property
+    def quantized(self) -> bool:
+        """倒排列表中的向量是否为压缩存储（得分为近似值）"""
+        return isinstance(self.list_vectors, QuantizedMatrix)
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    def __len__(self) -> int:
+        return len(self.list_rows)
+
+    def _scan(self, query: np.ndarray, n_probe: int, allowed: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """对最相近的 n_probe 个聚类打分，返回 (行号, 得分)，已去掉不允许的行"""
+        # 按聚类在内存中的顺序扫描，访问尽量连续
+        lists = np.sort(top_k_indices(self.centroids @ query, n_probe))
+        rows, scores = [], []
+        for i in lists:
+            start, end = self.list_ptr[i], self.list_ptr[i + 1]
+            if start == end:
+                continue
+            rows.append(self.list_rows[start:end])
+            scores.append(self.list_vectors[start:end] @ query)
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows, scores = np.concatenate(rows), np.concatenate(scores)
+        if allowed is not None:
+            keep = allowed[rows]
+            rows, scores = rows[keep], scores[keep]
+        return rows, scores
+
+    def search(
+        self,
+        embedding: Sequence[float],
+        k: int = 4,
+        allowed: Optional[np.ndarray] = None,
+        n_probe: Optional[int] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        近似检索，返回 (行号, 余弦相似度)
+
+        Args:
+            allowed: 行掩码，为False的行不参与排序；探查的聚类中可用行不足k个时
+                逐步加倍 n_probe，直到凑够k个或已扫描全部聚类
+            n_probe: 本次查询扫描的聚类数，为None时使用默认值
+        """
+        query = normalize_rows(embedding)[0]
+        n_probe = min(self.n_lists, max(1, n_probe or self.n_probe))
+        while True:
+            rows, scores = self._scan(query, n_probe, allowed)
+            if len(rows) >= k or n_probe >= self.n_lists:
+                break
+            n_probe = min(self.n_lists, n_probe * 2)
+        return [(int(rows[i]), float(scores[i])) for i in top_k_indices(scores, k)]
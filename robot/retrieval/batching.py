@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from .metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128]
+LATENCY_MS_BUCKETS = [0.5, 1, 2, 5, 10, 20, 50, 100, 250, 500, 1000]
+
+
+class BatchingEmbeddings(Embeddings):
+    """
+    跨请求合并查询嵌入的包装
+
+    aembed_query 把查询文本放入队列，由事件循环中的收集任务在一个时间窗口内
+    （或凑满最大批量时）取出全部排队的查询，在专用线程上用一次 embed_documents
+    完成嵌入，再逐个唤醒调用方。并发请求因此共享一次前向计算，而不是各自在
+    线程池中争抢CPU。同步的 embed_query 和 embed_documents 直接透传给底层模型。
+    """
+
+    def __init__(self, embeddings: Embeddings, window_ms: float = 5.0, max_batch_size: int = 32):
+        """
+        Args:
+            embeddings: 底层嵌入模型
+            window_ms: 收到第一个查询后等待更多查询的时间窗口（毫秒）
+            max_batch_size: 单批最多合并的查询数，凑满后立即嵌入
+        """
+        self.embeddings = embeddings
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_ms = Histogram(LATENCY_MS_BUCKETS)
+        self.embed_ms = Histogram(LATENCY_MS_BUCKETS)
+        # 专用线程在收集任务启动时创建，aclose 后再次嵌入时重新创建
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """排队等待批量嵌入"""
+        queue = self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await queue.put((text, future, time.perf_counter()))
+        return await future
+
+    def _ensure_worker(self) -> asyncio.Queue:
+        """在当前事件循环中启动收集任务；事件循环变化时（如多次 asyncio.run）或 aclose 之后重新创建"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-batch")
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+        return self._queue
+
+    async def _collect(self) -> List[Tuple[str, asyncio.Future, float]]:
+        """取出一批查询：等到第一个查询后，在时间窗口内继续收集直到凑满"""
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        # 窗口结束时已在队列中的查询一并带上
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # 调用方已取消的查询不再嵌入
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                self.queue_wait_ms.observe((started - enqueued) * 1000)
+            self.batch_sizes.observe(len(batch))
+
+            try:
+                vectors = await loop.run_in_executor(
+                    self._executor, self.embeddings.embed_documents, [text for text, _, _ in batch]
+                )
+            except Exception as e:
+                logger.error(f"批量嵌入失败: {str(e)}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                self.embed_ms.observe((time.perf_counter() - started) * 1000)
+
+            for (_, future, _), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+
+    async def aclose(self):
+        """停止收集任务并关闭专用线程，之后再次调用 aembed_query 时重新启动"""
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        """返回批量大小、排队等待和嵌入耗时的直方图"""
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch_size": self.max_batch_size,
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+            "embed_ms": self.embed_ms.snapshot(),
+        }
+
+    def __getattr__(self, name):
+        # 其余属性（如model_name）转发给底层模型
+        if name == 'embeddings':
+            raise AttributeError(name)
+        return getattr(self.embeddings, name)
@@ -0,0 +1,42 @@
+"""
+离线构建RAG索引快照
+
+用法（在项目根目录执行）：
+    python -m robot.retrieval.build_index          # 快照键未变化时直接复用
+    python -m robot.retrieval.build_index --force  # 强制重新嵌入全部分块
+"""
+import argparse
+import logging
+import os
+import sys
+
+# 添加项目根目录到Python路径
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="构建RAG语料的向量索引快照")
+    parser.add_argument("--force", action="store_true", help="忽略已有快照，强制重新嵌入")
+    args = parser.parse_args()
+
+    from robot.tools import rag
+
+    key, splits, vectors, arrays = rag.build_index(force=args.force)
+
+    logger.info(
+        f"索引快照就绪: {os.path.abspath(rag.INDEX_DIR)} "
+        f"key={key[:12]} 分块数={len(splits)} 维度={vectors.shape[1]} "
+        f"含过敏原分块数={int((arrays['allergen_masks'] != 0).sum())} "
+        f"倒排索引词数={len(arrays.get('bm25_terms', []))} "
+        f"IVF聚类数={len(arrays.get('ivf_centroids', []))} "
+        f"向量存储={rag.VECTOR_STORAGE}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import asyncio
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .allergen_mask import allowed_rows
+from .embedding_cache import normalize_query
+from .lexical import BM25Index, reciprocal_rank_fusion
+from .vector_index import MatrixVectorStore
+
+# 作为精确名称查找依据的metadata字段
+NAME_FIELDS = ['食物名称', '菜名']
+
+
+class CorpusIndex:
+    """
+    一个版本的RAG语料索引
+
+    包含向量存储以及与分块一一对应的附加数据（过敏原位掩码、BM25倒排索引），
+    由同一份快照构建，保证各部分的行号一致。
+    """
+
+    def __init__(
+        self,
+        key: str,
+        vector_store: MatrixVectorStore,
+        allergen_masks: np.ndarray,
+        lexical_index: Optional[BM25Index] = None,
+        candidates: int = 50,
+        rrf_k: int = 60
+    ):
+        """
+        Args:
+            lexical_index: BM25倒排索引，为None时只做向量检索
+            candidates: 混合检索时每一路取出参与融合的候选数量
+            rrf_k: 倒数排名融合的平滑常数
+        """
+        if len(allergen_masks) != len(vector_store):
+            raise ValueError(f"过敏原位掩码数量 {len(allergen_masks)} 与分块数量 {len(vector_store)} 不一致")
+        if lexical_index is not None and len(lexical_index) != len(vector_store):
+            raise ValueError(f"倒排索引行数 {len(lexical_index)} 与分块数量 {len(vector_store)} 不一致")
+        self.key = key
+        self.vector_store = vector_store
+        self.allergen_masks = allergen_masks
+        self.lexical_index = lexical_index
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+
+        # 规范化后的食物名称/菜名到行号的映射，用于精确名称查找
+        self.name_rows: Dict[str, List[int]] = {}
+        for row, doc in enumerate(vector_store.documents):
+            for field in NAME_FIELDS:
+                name = doc.metadata.get(field)
+                if name:
+                    self.name_rows.setdefault(normalize_query(str(name)), []).append(row)
+
+    def __len__(self) -> int:
+        return len(self.vector_store)
+
+    def lookup_name(self, query: str, allowed: Optional[np.ndarray] = None) -> List[int]:
+        """查询恰好是某个食物名称或菜名时返回对应行号，否则返回空列表"""
+        rows = self.name_rows.get(normalize_query(query), [])
+        if allowed is not None:
+            rows = [row for row in rows if allowed[row]]
+        return rows
+
+    def search(self, query: str, k: int = 4, exclude_bits: int = 0) -> List[Document]:
+        """
+        检索与查询最相关的k个分块
+
+        查询恰好是食物名称或菜名时直接返回对应分块，不调用嵌入模型；否则将BM25与向量
+        检索的结果做倒数排名融合，兼顾精确的名称命中和语义相似。
+
+        Args:
+            exclude_bits: 需要排除的过敏原位掩码，含这些过敏原的分块在选取 top-k 前即被排除，
+                只要安全分块足够就总能返回k个结果
+        """
+        allowed = allowed_rows(self.allergen_masks, exclude_bits) if exclude_bits else None
+        rows = self.lookup_name(query, allowed)
+        if not rows:
+            query_vector = self.vector_store.embedding.embed_query(query)
+            rows = self._rank_rows(query, query_vector, k, allowed)
+        return [self.vector_store.documents[row] for row in rows[:k]]
+
+    async def asearch(self, query: str, k: int = 4, exclude_bits: int = 0) -> List[Document]:
+        """
+        search 的异步版本
+
+        查询向量通过嵌入模型的 aembed_query 获取，可与其他并发请求合并为一次批量嵌入；
+        打分与融合在线程中执行。
+        """
+        allowed = allowed_rows(self.allergen_masks, exclude_bits) if exclude_bits else None
+        rows = self.lookup_name(query, allowed)
+        if not rows:
+            query_vector = await self.vector_store.embedding.aembed_query(query)
+            rows = await asyncio.to_thread(self._rank_rows, query, query_vector, k, allowed)
+        return [self.vector_store.documents[row] for row in rows[:k]]
+
+    def _rank_rows(
+        self,
+        query: str,
+        query_vector: Sequence[float],
+        k: int,
+        allowed: Optional[np.ndarray]
+    ) -> List[int]:
+        """按查询向量检索，启用BM25时与词法检索结果融合，返回行号"""
+        if self.lexical_index is None:
+            return [row for row, _ in self.vector_store.search_rows_by_vector(query_vector, k, allowed)]
+
+        candidates = max(k, self.candidates)
+        dense_rows = [row for row, _ in self.vector_store.search_rows_by_vector(query_vector, candidates, allowed)]
+        lexical_rows = [row for row, _ in self.lexical_index.search(query, candidates, allowed)]
+        return reciprocal_rank_fusion([dense_rows, lexical_rows], k=self.rrf_k)[:k]
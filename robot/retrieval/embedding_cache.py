@@ -0,0 +1,71 @@
+import re
+import unicodedata
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from .cache import TTLCache
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """
+    规范化查询文本，提高缓存命中率
+
+    - NFKC规范化：全角字母、数字、标点转为半角
+    - 去除标点符号
+    - 英文转小写，合并连续空白
+    """
+    text = unicodedata.normalize('NFKC', str(text))
+    text = ''.join(ch for ch in text if not unicodedata.category(ch).startswith('P'))
+    text = _WHITESPACE_RE.sub(' ', text).strip()
+    return text.lower()
+
+
+def canonical_query(text: str) -> str:
+    """
+    查询文本的规范形式，用于结果级缓存
+
+    只做NFKC规范化和空白合并，保留标点与大小写：这些字符会影响意图识别和范围条件
+    （如 "2.5" 与 "25"），不能像 normalize_query 那样去掉。
+    """
+    return ' '.join(unicodedata.normalize('NFKC', str(text)).split())
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    带查询向量缓存的嵌入模型包装
+
+    embed_query / aembed_query 先规范化查询文本再查缓存，未命中时嵌入规范化后的文本，
+    保证同一个缓存键总是对应同一个向量；embed_documents 直接透传给底层模型。
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: TTLCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_query(self, text: str) -> List[float]:
+        key = normalize_query(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(key or text)
+            self.cache.set(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = normalize_query(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(key or text)
+            self.cache.set(key, vector)
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def __getattr__(self, name):
+        # 其余属性（如model_name）转发给底层模型
+        if name == 'embeddings':
+            raise AttributeError(name)
+        return getattr(self.embeddings, name)
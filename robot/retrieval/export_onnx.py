@@ -0,0 +1,102 @@
+"""
+将 sentence-transformers 嵌入模型导出为 ONNX，可选int8动态量化
+
+用法（在项目根目录执行）：
+    python -m robot.retrieval.export_onnx              # 导出到 RAG_ONNX_MODEL_DIR
+    python -m robot.retrieval.export_onnx --quantize   # 同时生成int8量化模型
+
+导出后设置 RAG_EMBEDDING_BACKEND=onnx（量化模型再加 RAG_ONNX_QUANTIZED=true）即可切换后端，
+切换前可用 python -m robot.benchmark.bench_embedding_backends 核对一致性与吞吐。
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+# 添加项目根目录到Python路径
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from robot.retrieval.onnx_embeddings import CONFIG_FILE, MODEL_FILE, QUANTIZED_MODEL_FILE
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# BertModel.forward 的参数顺序
+FORWARD_INPUTS = ['input_ids', 'attention_mask', 'token_type_ids']
+
+
+def export_onnx(model_name: str, output_dir: str, quantize: bool = False, opset: int = 14):
+    """
+    导出嵌入模型
+
+    Args:
+        model_name: sentence-transformers 模型名称或本地路径
+        output_dir: 输出目录，写入ONNX模型、分词器和池化配置
+        quantize: 是否额外生成int8动态量化模型
+        opset: ONNX算子集版本
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    st_model = SentenceTransformer(model_name, device='cpu')
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+    pooling = 'cls' if st_model[1].get_pooling_mode_str() == 'cls' else 'mean'
+
+    os.makedirs(output_dir, exist_ok=True)
+    model_path = os.path.join(output_dir, MODEL_FILE)
+
+    dummy = tokenizer(["示例文本", "用于导出的第二条示例文本"], padding=True, return_tensors='pt')
+    input_names = [name for name in FORWARD_INPUTS if name in dummy]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(dummy[name] for name in input_names),
+            model_path,
+            input_names=input_names,
+            output_names=['last_hidden_state'],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset
+        )
+    tokenizer.save_pretrained(output_dir)
+    with open(os.path.join(output_dir, CONFIG_FILE), 'w', encoding='utf-8') as f:
+        json.dump({
+            'model_name': model_name,
+            'max_seq_length': st_model.max_seq_length,
+            'pooling': pooling
+        }, f, ensure_ascii=False, indent=2)
+    logger.info(f"ONNX模型已导出: {model_path}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantized_path = os.path.join(output_dir, QUANTIZED_MODEL_FILE)
+        quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+        logger.info(f"int8量化模型已导出: {quantized_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导出ONNX嵌入模型")
+    parser.add_argument("--model", help="模型名称或路径，默认与rag.py一致")
+    parser.add_argument("--output-dir", help="输出目录，默认为RAG_ONNX_MODEL_DIR")
+    parser.add_argument("--quantize", action="store_true", help="同时生成int8动态量化模型")
+    parser.add_argument("--opset", type=int, default=14, help="ONNX算子集版本")
+    args = parser.parse_args()
+
+    from robot.tools import rag
+
+    export_onnx(
+        args.model or rag.MODEL_NAME,
+        args.output_dir or rag.ONNX_MODEL_DIR,
+        quantize=args.quantize,
+        opset=args.opset
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from langchain_core.documents import Document
+
+from .nutrient_table import clean_numeric_column
+from .vector_index import normalize_rows
+
+logger = logging.getLogger(__name__)
+
+# 文档模板：(字面文本, 字段名) 序列，字段名为None表示只有字面文本。
+# 同一模板既可逐条渲染（render_row），也可对整个DataFrame向量化渲染（render_frame）。
+Template = Sequence[Tuple[str, Optional[str]]]
+
+FOOD_TEMPLATE: Template = [
+    ("食物：", '食物名称'),
+    ("\n类别：", '食物类别'),
+    (" - ", '子类名称'),
+    ("\n营养成分：\n- 能量：", '能量(kcal)'),
+    ("千卡\n- 蛋白质：", '蛋白质(g)'),
+    ("克\n- 脂肪：", '脂肪(g)'),
+    ("克\n- 碳水化合物：", '碳水化合物(g)'),
+    ("克\n- 膳食纤维：", '膳食纤维(g)'),
+    ("克", None),
+]
+
+RECIPE_TEMPLATE: Template = [
+    ("菜品：", '菜名'),
+    ("\n烹饪信息：\n- 烹饪方法：", '烹饪方法'),
+    ("\n- 口味：", '口味'),
+    ("\n- 难度等级", '难度等级'),
+    ("\n- 预估成本：", '预估成本'),
+    ("\n- 烹饪时长", '烹饪时长'),
+    ("\n食材配料：\n- 主料：", '主料'),
+    ("\n- 辅料：", '辅料'),
+    ("\n- 调料：", '调料'),
+    ("\n功效与注意事项：\n- 功效：", '功效'),
+    ("\n- 注意事项：", '注意事项'),
+]
+
+# 食物成分：数值字段 -> CSV列名；文本字段 -> (CSV列名, 缺失列时的默认值)
+FOOD_NUMERIC_COLUMNS = {
+    '能量(kcal)': '能量(kcal)',
+    '蛋白质(g)': '蛋白质(g)',
+    '脂肪(g)': '脂肪(g)',
+    '碳水化合物(g)': '碳水化合物(g)',
+    '膳食纤维(g)': '膳食纤维(g)',
+}
+FOOD_TEXT_COLUMNS = {
+    '食物类别': ('大类名称', '未分类'),
+    '子类名称': ('子类名称', '未分类'),
+}
+
+# 食谱：文本字段 -> (CSV列名, 缺失列时的默认值)
+RECIPE_TEXT_COLUMNS = {
+    '烹饪方法': ('烹饪方法', '未知'),
+    '口味': ('口味', '未知'),
+    '难度等级': ('难度等级', '未知'),
+    '预估成本': ('预估成本', '未知'),
+    '烹饪时长': ('烹饪时长', '未知'),
+    '主料': ('主料', ''),
+    '辅料': ('辅料', ''),
+    '调料': ('调料', ''),
+    '步骤': ('步骤', ''),
+    '功效': ('功效', ''),
+    '注意事项': ('注意事项', ''),
+}
+
+
+def render_row(template: Template, data: Dict[str, Any]) -> str:
+    """按模板渲染单条记录"""
+    return ''.join(text + (str(data[field]) if field else '') for text, field in template)
+
+
+def render_frame(template: Template, frame: pd.DataFrame) -> pd.Series:
+    """按模板对整个DataFrame做向量化的字符串拼接"""
+    content = pd.Series('', index=frame.index, dtype=object)
+    for text, field in template:
+        content = content + text
+        if field:
+            content = content + _as_text(frame[field])
+    return content
+
+
+def row_hash(document: Document) -> int:
+    """
+    文档内容的稳定哈希（64位）
+
+    由文本内容和metadata共同决定，与行在CSV中的位置无关；
+    用于增量重建索引时识别新增、修改和删除的行。
+    """
+    payload = json.dumps([document.page_content, document.metadata], ensure_ascii=False, sort_keys=True, default=str)
+    return int.from_bytes(hashlib.blake2b(payload.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _as_text(series: pd.Series) -> pd.Series:
+    """转为文本列，缺失值与逐行 str() 一样渲染为 'nan'"""
+    return series.astype(str).fillna('nan')
+
+
+def _text_column(df: pd.DataFrame, column: str, default: str) -> pd.Series:
+    """文本列，缺失列时整列取默认值（与逐行 str(row.get(column, default)) 一致）"""
+    if column in df.columns:
+        return _as_text(df[column])
+    return pd.Series(default, index=df.index, dtype=object)
+
+
+def _records(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    """按列取出Python原生值再按行组装字典，比 DataFrame.to_dict('records') 逐单元格装箱快得多"""
+    columns = list(frame.columns)
+    values = [frame[column].tolist() for column in columns]
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+def food_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """将食物成分CSV的一个分块整理为文档metadata，数值列向量化清洗，缺失食物名称的行被跳过"""
+    df = df[df['食物名称'].notna()]
+    frame = pd.DataFrame({'食物名称': df['食物名称'].astype(str)}, index=df.index)
+    for field, column in FOOD_NUMERIC_COLUMNS.items():
+        frame[field] = clean_numeric_column(df[column]) if column in df.columns else 0.0
+    for field, (column, default) in FOOD_TEXT_COLUMNS.items():
+        frame[field] = _text_column(df, column, default)
+    frame['数据类型'] = '食物成分'
+    return frame
+
+
+def recipe_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """将食谱CSV的一个分块整理为文档metadata，缺失菜名的行被跳过"""
+    df = df[df['菜名'].notna()]
+    frame = pd.DataFrame({'菜名': df['菜名'].astype(str)}, index=df.index)
+    for field, (column, default) in RECIPE_TEXT_COLUMNS.items():
+        frame[field] = _text_column(df, column, default)
+    frame['数据类型'] = '食谱'
+    return frame
+
+
+# 数据类型 -> (metadata整理函数, 文档模板)
+DATA_TYPES = {
+    'food': (food_frame, FOOD_TEMPLATE),
+    'recipe': (recipe_frame, RECIPE_TEMPLATE),
+}
+
+
+def iter_document_batches(file_path: str, data_type: str = 'food', chunksize: int = 5000) -> Iterator[List[Document]]:
+    """
+    分块读取CSV，逐块产出文档
+
+    每次只有一个CSV分块驻留内存，清洗与模板渲染均为整列的向量化操作，
+    下游可以边读取边分割、嵌入，峰值内存由分块大小而非语料规模决定。
+
+    Args:
+        file_path: CSV文件路径
+        data_type: 'food' 或 'recipe'
+        chunksize: 每块读取的行数
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"找不到文件: {file_path}")
+    if not file_path.endswith('.csv'):
+        raise ValueError(f"不支持的文件类型: {file_path}")
+    if data_type not in DATA_TYPES:
+        raise ValueError(f"不支持的数据类型: {data_type}")
+
+    to_frame, template = DATA_TYPES[data_type]
+    total, skipped = 0, 0
+    for chunk in pd.read_csv(file_path, chunksize=chunksize):
+        frame = to_frame(chunk)
+        skipped += len(chunk) - len(frame)
+        if frame.empty:
+            continue
+        contents = render_frame(template, frame)
+        documents = [
+            Document(page_content=content, metadata=metadata)
+            for content, metadata in zip(contents.tolist(), _records(frame))
+        ]
+        total += len(documents)
+        yield documents
+
+    if skipped:
+        logger.warning(f"{file_path} 中有 {skipped} 行缺少名称，已跳过")
+    logger.info(f"成功加载 {total} 条{data_type}数据")
+
+
+class IncrementalBuild:
+    """增量构建的结果：分块、L2归一化后的向量及每个分块所属行的哈希和行号，以及行数统计"""
+
+    def __init__(self, splits: List[Document], vectors: np.ndarray, row_hashes: List[int], row_ids: List[int],
+                 reused_rows: int, embedded_rows: int, deleted_rows: int):
+        self.splits = splits
+        self.vectors = vectors
+        self.row_hashes = row_hashes
+        self.row_ids = row_ids
+        self.reused_rows = reused_rows
+        self.embedded_rows = embedded_rows
+        self.deleted_rows = deleted_rows
+
+
+def embed_incrementally(
+    batches: Iterable[List[Document]],
+    split_documents: Callable[[List[Document]], List[Document]],
+    embed_documents: Callable[[List[str]], List[List[float]]],
+    previous_splits: Sequence[Document] = (),
+    previous_vectors: Optional[np.ndarray] = None,
+    previous_rows: Optional[Dict[int, Tuple[int, int]]] = None
+) -> IncrementalBuild:
+    """
+    逐批分割、嵌入文档，内容未变化的行复用旧快照中的分块和向量
+
+    每行按 row_hash 与旧快照比对：命中时取旧快照中该行的分块区间，不再分割和嵌入；
+    否则分割后只嵌入这些新分块。没有分块的批次（全部为空行）被跳过。
+
+    Args:
+        batches: 逐批产出的文档，如 iter_document_batches
+        split_documents: 将文档分割为分块
+        embed_documents: 嵌入分块文本
+        previous_splits: 旧快照的分块
+        previous_vectors: 旧快照的向量
+        previous_rows: 旧快照中行哈希到该行分块区间 [start, end) 的映射
+
+    Raises:
+        ValueError: 全部批次都没有分块
+    """
+    previous_rows = previous_rows or {}
+    splits, vector_batches, row_hashes, row_ids = [], [], [], []
+    seen_hashes = set()
+    reused_rows = embedded_rows = 0
+    for documents in batches:
+        batch_splits, reused, new_positions = [], [], []
+        for doc in documents:
+            row_id = reused_rows + embedded_rows
+            digest = row_hash(doc)
+            seen_hashes.add(digest)
+            if digest in previous_rows:
+                start, end = previous_rows[digest]
+                chunks = previous_splits[start:end]
+                reused.extend(zip(range(len(batch_splits), len(batch_splits) + len(chunks)), range(start, end)))
+                reused_rows += 1
+            else:
+                chunks = split_documents([doc])
+                new_positions.extend(range(len(batch_splits), len(batch_splits) + len(chunks)))
+                embedded_rows += 1
+            batch_splits.extend(chunks)
+            row_hashes.extend([digest] * len(chunks))
+            row_ids.extend([row_id] * len(chunks))
+        if not batch_splits:
+            continue
+
+        new_vectors = normalize_rows(
+            embed_documents([batch_splits[i].page_content for i in new_positions])
+        ) if new_positions else None
+        # 只复用旧分块的批次没有新向量，维度取自旧快照
+        dim = new_vectors.shape[1] if new_vectors is not None else previous_vectors.shape[1]
+        batch_vectors = np.empty((len(batch_splits), dim), dtype=np.float32)
+        if new_vectors is not None:
+            batch_vectors[new_positions] = new_vectors
+        if reused:
+            positions, rows = zip(*reused)
+            batch_vectors[list(positions)] = previous_vectors[list(rows)]
+        vector_batches.append(batch_vectors)
+        splits.extend(batch_splits)
+        logger.info(f"已处理 {len(splits)} 个分块（复用 {reused_rows} 行，嵌入 {embedded_rows} 行）")
+
+    if not splits:
+        raise ValueError("语料中没有可索引的分块")
+    return IncrementalBuild(
+        splits, np.vstack(vector_batches), row_hashes, row_ids,
+        reused_rows, embedded_rows, len(previous_rows.keys() - seen_hashes)
+    )
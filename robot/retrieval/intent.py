@@ -0,0 +1,157 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .matcher import MultiPatternMatcher
+from .nutrient_table import COMPARATORS, Condition, parse_range_conditions
+
+# 结果标题
+LABEL_NUTRIENT = "【营养成分检索结果】"
+LABEL_TCM = "【中医功效检索结果】"
+LABEL_RECIPE = "【食谱检索结果】"
+LABEL_GENERAL = "【综合检索结果】"
+
+# 匹配载荷的类别
+NUTRIENT = "nutrient"
+RECIPE = "recipe"
+TCM = "tcm"
+NUTRIENT_MENTION = "nutrient_mention"
+RECIPE_MENTION = "recipe_mention"
+RECIPE_QUERY = "recipe_query"
+COMPARATOR = "comparator"
+
+
+class QueryIntent:
+    """
+    查询意图
+
+    由 IntentClassifier 一次扫描得到，过滤排序和结果标题都基于同一个对象，
+    不会出现过滤按一种意图、标题按另一种意图的情况。
+    """
+
+    def __init__(
+        self,
+        nutrient_sort: Optional[Tuple[str, bool]] = None,
+        recipe_filter: Optional[Tuple[str, List[str]]] = None,
+        tcm_effect: Optional[str] = None,
+        tcm_foods: Optional[List[str]] = None,
+        conditions: Sequence[Condition] = (),
+        mentions_nutrient: bool = False,
+        mentions_recipe: bool = False,
+        is_recipe_query: bool = False,
+        matched: Sequence[str] = ()
+    ):
+        self.nutrient_sort = nutrient_sort  # (营养素字段, 是否降序)
+        self.recipe_filter = recipe_filter  # (食谱字段, 匹配值列表)
+        self.tcm_effect = tcm_effect
+        self.tcm_foods = tcm_foods or []
+        self.conditions = list(conditions)  # 营养素范围条件
+        self.mentions_nutrient = mentions_nutrient
+        self.mentions_recipe = mentions_recipe
+        self.is_recipe_query = is_recipe_query  # 明确是在找食谱/菜品
+        self.matched = list(matched)  # 命中的全部关键词，便于调试
+
+    def sort_spec(self) -> Optional[Tuple[str, bool]]:
+        """营养素排序方式；只有范围条件时按第一个条件的字段排序"""
+        if self.nutrient_sort:
+            return self.nutrient_sort
+        if self.conditions:
+            field, op, _ = self.conditions[0]
+            return field, op in ('>', '>=')
+        return None
+
+    def applied_filter(self, data_type: Optional[str]) -> Optional[str]:
+        """给定结果的数据类型，返回实际生效的过滤类别"""
+        if data_type == '食物成分':
+            if self.sort_spec():
+                return NUTRIENT
+            if self.tcm_foods:
+                return TCM
+        elif data_type == '食谱':
+            if self.recipe_filter:
+                return RECIPE
+            if self.tcm_foods:
+                return TCM
+        return None
+
+    def label(self, data_type: Optional[str]) -> str:
+        """根据实际生效的过滤类别生成结果标题"""
+        applied = self.applied_filter(data_type)
+        if applied == NUTRIENT or (applied is None and self.mentions_nutrient):
+            return LABEL_NUTRIENT
+        if applied == TCM or (applied is None and self.tcm_effect):
+            return LABEL_TCM
+        if applied == RECIPE or (applied is None and self.mentions_recipe):
+            return LABEL_RECIPE
+        return LABEL_GENERAL
+
+    def __repr__(self) -> str:
+        return (
+            f"QueryIntent(nutrient_sort={self.nutrient_sort}, recipe_filter={self.recipe_filter}, "
+            f"tcm_effect={self.tcm_effect}, conditions={self.conditions}, "
+            f"is_recipe_query={self.is_recipe_query}, matched={self.matched})"
+        )
+
+
+class IntentClassifier:
+    """
+    查询意图分类器
+
+    将营养素、食谱、中医功效关键词表以及标题判定用的词表编译成一个多模式匹配自动机，
+    对查询只扫描一遍即可得到全部命中的意图。同类意图命中多个关键词时，按关键词在
+    原始表中的顺序取第一个，与逐表遍历的结果一致。
+    """
+
+    def __init__(
+        self,
+        nutrient_keywords: Dict[str, Tuple[str, bool]],
+        recipe_keywords: Dict[str, Tuple[str, List[str]]],
+        tcm_keywords: Dict[str, List[str]],
+        nutrient_mentions: Sequence[str] = (),
+        recipe_mentions: Sequence[str] = (),
+        recipe_query_words: Sequence[str] = ()
+    ):
+        self.nutrient_keywords = nutrient_keywords
+        self.recipe_keywords = recipe_keywords
+        self.tcm_keywords = tcm_keywords
+
+        patterns = []
+        for kind, keywords in (
+            (NUTRIENT, nutrient_keywords),
+            (RECIPE, recipe_keywords),
+            (TCM, tcm_keywords),
+            (NUTRIENT_MENTION, nutrient_mentions),
+            (RECIPE_MENTION, recipe_mentions),
+            (RECIPE_QUERY, recipe_query_words),
+            (COMPARATOR, list(COMPARATORS)),
+        ):
+            patterns.extend((keyword, (kind, order, keyword)) for order, keyword in enumerate(keywords))
+        self.matcher = MultiPatternMatcher(patterns)
+
+    def classify(self, query: str) -> QueryIntent:
+        """对查询文本做一次扫描，返回结构化的查询意图"""
+        best: Dict[str, Tuple[int, str]] = {}
+        kinds = set()
+        matched = []
+        for _, keyword, (kind, order, _) in self.matcher.iter_matches(query):
+            kinds.add(kind)
+            if kind == COMPARATOR:
+                continue
+            matched.append(keyword)
+            if kind not in best or order < best[kind][0]:
+                best[kind] = (order, keyword)
+
+        nutrient_sort = self.nutrient_keywords[best[NUTRIENT][1]] if NUTRIENT in best else None
+        recipe_filter = self.recipe_keywords[best[RECIPE][1]] if RECIPE in best else None
+        tcm_effect = best[TCM][1] if TCM in best else None
+
+        return QueryIntent(
+            nutrient_sort=nutrient_sort,
+            recipe_filter=recipe_filter,
+            tcm_effect=tcm_effect,
+            tcm_foods=self.tcm_keywords[tcm_effect] if tcm_effect else None,
+            # 只有命中比较词时才解析范围条件
+            conditions=parse_range_conditions(query) if COMPARATOR in kinds else (),
+            mentions_nutrient=NUTRIENT_MENTION in kinds,
+            mentions_recipe=RECIPE_MENTION in kinds,
+            is_recipe_query=RECIPE_QUERY in kinds,
+            matched=matched
+        )
@@ -0,0 +1,157 @@
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .vector_index import top_k_indices
+
+# 中文连续片段，或以字母开头的英文/型号词（如 维生素b1 中的 b1）
+_TOKEN_RE = re.compile(r'[㐀-鿿]+|[a-z][a-z0-9]*')
+
+# 快照中保存倒排索引所用数组的名称前缀
+ARRAY_PREFIX = "bm25_"
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    中文按字的一元与二元切分，英文按词切分
+
+    不依赖分词词典，菜名、药材名等未登录词也能通过二元组精确命中。
+    """
+    tokens = []
+    for run in _TOKEN_RE.findall(unicodedata.normalize('NFKC', text).lower()):
+        if run[0].isascii():
+            tokens.append(run)
+            continue
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class BM25Index:
+    """
+    BM25 倒排索引
+
+    倒排表以 CSR 形式存放：terms[i] 的倒排记录位于 doc_ids/term_freqs 的
+    [term_ptr[i], term_ptr[i+1]) 区间。每条倒排记录的 BM25 权重在加载时一次算好，
+    查询时每个词只需一次向量化的累加。
+    """
+
+    def __init__(
+        self,
+        terms: np.ndarray,
+        term_ptr: np.ndarray,
+        doc_ids: np.ndarray,
+        term_freqs: np.ndarray,
+        doc_lengths: np.ndarray,
+        k1: float = 1.5,
+        b: float = 0.75
+    ):
+        self.terms = terms
+        self.term_ptr = term_ptr
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.vocabulary: Dict[str, int] = {term: i for i, term in enumerate(terms.tolist())}
+
+        n = len(doc_lengths)
+        doc_freqs = np.diff(term_ptr).astype(np.float32)
+        idf = np.log1p((n - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+        avg_length = float(doc_lengths.mean()) if n else 0.0
+        norm = k1 * (1 - b + b * doc_lengths / avg_length) if avg_length else np.full(n, k1)
+        tf = term_freqs.astype(np.float32)
+        posting_idf = np.repeat(idf, np.diff(term_ptr))
+        self.weights = (posting_idf * tf * (k1 + 1) / (tf + norm[doc_ids])).astype(np.float32)
+
+    @classmethod
+    def build(cls, texts: Iterable[str], k1: float = 1.5, b: float = 0.75) -> 'BM25Index':
+        """对文本序列构建倒排索引，行号即文本在序列中的位置"""
+        postings: Dict[str, Dict[int, int]] = {}
+        doc_lengths = []
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths.append(len(tokens))
+            for token in tokens:
+                counts = postings.setdefault(token, {})
+                counts[row] = counts.get(row, 0) + 1
+
+        terms = sorted(postings)
+        term_ptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        doc_ids, term_freqs = [], []
+        for i, term in enumerate(terms):
+            rows = sorted(postings[term].items())
+            doc_ids.extend(row for row, _ in rows)
+            term_freqs.extend(freq for _, freq in rows)
+            term_ptr[i + 1] = len(doc_ids)
+
+        return cls(
+            np.array(terms, dtype=str),
+            term_ptr,
+            np.array(doc_ids, dtype=np.int32),
+            np.array(term_freqs, dtype=np.int32),
+            np.array(doc_lengths, dtype=np.float32),
+            k1,
+            b
+        )
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """导出为可写入快照的数组"""
+        return {
+            f"{ARRAY_PREFIX}terms": self.terms,
+            f"{ARRAY_PREFIX}term_ptr": self.term_ptr,
+            f"{ARRAY_PREFIX}doc_ids": self.doc_ids,
+            f"{ARRAY_PREFIX}term_freqs": self.term_freqs,
+            f"{ARRAY_PREFIX}doc_lengths": self.doc_lengths,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], k1: float = 1.5, b: float = 0.75) -> Optional['BM25Index']:
+        """从快照数组恢复索引，数组不全时返回None"""
+        names = ('terms', 'term_ptr', 'doc_ids', 'term_freqs', 'doc_lengths')
+        if any(f"{ARRAY_PREFIX}{name}" not in arrays for name in names):
+            return None
+        return cls(*(arrays[f"{ARRAY_PREFIX}{name}"] for name in names), k1=k1, b=b)
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def get_scores(self, query: str) -> np.ndarray:
+        """计算查询对每一行的 BM25 得分"""
+        scores = np.zeros(len(self), dtype=np.float32)
+        for token in set(tokenize(query)):
+            i = self.vocabulary.get(token)
+            if i is None:
+                continue
+            start, end = self.term_ptr[i], self.term_ptr[i + 1]
+            # 同一个词的倒排记录行号互不重复，可以直接按下标累加
+            scores[self.doc_ids[start:end]] += self.weights[start:end]
+        return scores
+
+    def search(self, query: str, k: int = 4, allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """返回得分最高的k个 (行号, 得分)，不含任何查询词的行不返回"""
+        scores = self.get_scores(query)
+        if allowed is not None:
+            scores[~allowed] = 0
+        indices = top_k_indices(scores, k)
+        return [(int(i), float(scores[i])) for i in indices if scores[i] > 0]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = 60) -> List[int]:
+    """
+    倒数排名融合（RRF）
+
+    Args:
+        rankings: 多路检索结果的行号列表，各自按相关度降序
+        k: 平滑常数，越大各路排名靠后的结果影响越大
+
+    Returns:
+        按融合得分降序的行号，得分相同时先出现者在前
+    """
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused, key=lambda row: -fused[row])
@@ -0,0 +1,72 @@
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+
+class MultiPatternMatcher:
+    """
+    Aho-Corasick 多模式匹配自动机
+
+    构建一次后，对任意文本只需扫描一遍即可找出全部命中的模式；
+    同一模式可以关联多个载荷，例如同一食材属于多种过敏原。
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, Any]]):
+        """
+        Args:
+            patterns: (模式串, 载荷) 序列，空模式串会被忽略
+        """
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[str, Any]]] = [[]]
+        for pattern, payload in patterns:
+            if pattern:
+                self._add(pattern, payload)
+        self._build()
+
+    def _add(self, pattern: str, payload: Any):
+        state = 0
+        for ch in pattern:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][ch] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((pattern, payload))
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(ch, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, str, Any]]:
+        """按出现顺序逐个产出 (起始位置, 模式串, 载荷)"""
+        state = 0
+        goto, fail, output = self._goto, self._fail, self._output
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for pattern, payload in output[state]:
+                yield i - len(pattern) + 1, pattern, payload
+
+    def find_all(self, text: str) -> List[Tuple[int, str, Any]]:
+        """返回全部命中，按起始位置排序，同一位置较长的模式在前"""
+        return sorted(self.iter_matches(text), key=lambda m: (m[0], -len(m[1])))
+
+    def payloads(self, text: str) -> List[Any]:
+        """返回全部命中的载荷（去重，保持首次出现顺序）"""
+        seen = []
+        for _, _, payload in self.find_all(text):
+            if payload not in seen:
+                seen.append(payload)
+        return seen
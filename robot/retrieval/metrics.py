@@ -0,0 +1,87 @@
+import bisect
+import os
+import threading
+from typing import Any, Dict, Optional, Sequence
+
+
+class Histogram:
+    """
+    固定分桶的线程安全直方图
+
+    每个桶统计 (上一个边界, 当前边界] 区间内的样本数，超过最大边界的样本计入 "+Inf" 桶；
+    分位数按桶上边界近似，足以用于调整参数。
+    """
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        """记录一个样本"""
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.total += value
+            self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """按桶上边界近似计算分位数，超过最大边界时返回观测到的最大值"""
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = q * self.count
+            cumulative = 0
+            for bound, count in zip(self.buckets, self._counts):
+                cumulative += count
+                if cumulative >= rank:
+                    return min(bound, self.max)
+            return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回直方图统计信息"""
+        with self._lock:
+            labels = [f"<={bound:g}" for bound in self.buckets] + ["+Inf"]
+            counts = dict(zip(labels, self._counts))
+            count, total, maximum = self.count, self.total, self.max
+        return {
+            "count": count,
+            "mean": total / count if count else 0.0,
+            "max": maximum,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": counts,
+        }
+
+
+def process_memory(pid: Optional[int] = None) -> Dict[str, float]:
+    """
+    进程内存占用（MB），读取 /proc/<pid>/smaps_rollup，仅支持Linux
+
+    - rss: 常驻内存，包含与其他进程共享的页
+    - pss: 按共享进程数均摊后的常驻内存
+    - uss: 进程独占的页（Private_Clean + Private_Dirty），即该进程退出后能释放的内存
+    - shared: 与其他进程共享的页（Shared_Clean + Shared_Dirty），包括fork后未写入的页和内存映射文件的页缓存
+
+    Returns:
+        各项占用；不支持的平台返回空字典
+    """
+    path = f"/proc/{pid or os.getpid()}/smaps_rollup"
+    if not os.path.exists(path):
+        return {}
+    fields = {}
+    with open(path, 'r') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                fields[parts[0][:-1]] = int(parts[1]) / 1024
+    return {
+        "rss": fields.get("Rss", 0.0),
+        "pss": fields.get("Pss", 0.0),
+        "uss": fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0),
+        "shared": fields.get("Shared_Clean", 0.0) + fields.get("Shared_Dirty", 0.0),
+    }
@@ -0,0 +1,202 @@
+import logging
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .allergen_mask import AllergenIndex, allowed_rows
+
+logger = logging.getLogger(__name__)
+
+# 营养素字段（与rag.nutrient_keywords中的字段一致）到CSV列名的映射
+NUTRIENT_COLUMNS = {
+    '能量(kcal)': '能量(kcal)',
+    '蛋白质(g)': '蛋白质(g)',
+    '脂肪(g)': '脂肪(g)',
+    '碳水化合物(g)': '碳水化合物(g)',
+    '膳食纤维(g)': '膳食纤维(g)',
+    '铁(mg)': '铁(mg)',
+    '钙(mg)': '钙(mg)',
+    '维生素C(mg)': '维生素C(mg)',
+    '维生素A(μg)': '维生素A(μgRE)',
+    '维生素E(mg)': '维生素E(mg)',
+    '维生素B1(mg)': '硫胺素(mg)',
+    '维生素B2(mg)': '核黄素(mg)',
+}
+
+# 表示缺失或微量的特殊字符，统一视为0
+MISSING_MARKERS = ['—', '…', 'Tr', '', '-', 'nan']
+
+# 查询中的营养素名称到字段的映射，较长的名称优先匹配
+NUTRIENT_NAMES = {
+    '蛋白质': '蛋白质(g)',
+    '脂肪': '脂肪(g)',
+    '能量': '能量(kcal)',
+    '热量': '能量(kcal)',
+    '碳水化合物': '碳水化合物(g)',
+    '碳水': '碳水化合物(g)',
+    '膳食纤维': '膳食纤维(g)',
+    '纤维': '膳食纤维(g)',
+    '铁': '铁(mg)',
+    '钙': '钙(mg)',
+    '维生素C': '维生素C(mg)',
+    '维生素A': '维生素A(μg)',
+    '维生素E': '维生素E(mg)',
+    '维生素B1': '维生素B1(mg)',
+    '维生素B2': '维生素B2(mg)',
+}
+
+# 比较词到运算符的映射
+COMPARATORS = {
+    '>=': '>=', '≥': '>=', '不低于': '>=', '不少于': '>=', '至少': '>=',
+    '<=': '<=', '≤': '<=', '不高于': '<=', '不超过': '<=', '至多': '<=',
+    '>': '>', '大于': '>', '高于': '>', '超过': '>', '多于': '>',
+    '<': '<', '小于': '<', '低于': '<', '少于': '<',
+}
+
+_RANGE_RE = re.compile(
+    '(' + '|'.join(sorted(map(re.escape, NUTRIENT_NAMES), key=len, reverse=True)) + r')'
+    r'(?:含量)?\s*'
+    '(' + '|'.join(sorted(map(re.escape, COMPARATORS), key=len, reverse=True)) + r')'
+    r'\s*(\d+(?:\.\d+)?)',
+    re.IGNORECASE
+)
+
+Condition = Tuple[str, str, float]
+
+
+def parse_range_conditions(query: str) -> List[Condition]:
+    """
+    从查询文本中解析营养素范围条件
+
+    例如 "蛋白质>20g且脂肪低于5克" 解析为
+    [('蛋白质(g)', '>', 20.0), ('脂肪(g)', '<', 5.0)]
+    """
+    conditions = []
+    for name, comparator, value in _RANGE_RE.findall(query):
+        field = NUTRIENT_NAMES.get(name) or NUTRIENT_NAMES.get(name.upper())
+        conditions.append((field, COMPARATORS[comparator], float(value)))
+    return conditions
+
+
+def clean_numeric_column(series: pd.Series) -> np.ndarray:
+    """向量化地清理数值列，缺失与特殊字符记为0"""
+    cleaned = series.astype(str).str.strip().replace(MISSING_MARKERS, '0')
+    return pd.to_numeric(cleaned, errors='coerce').fillna(0.0).to_numpy(dtype=np.float64)
+
+
+class NutrientTable:
+    """
+    食物成分表的列式查询引擎
+
+    每种营养素存为一个连续的float64数组，并预先计算升序排序下标，
+    按营养素取 top-N 只需对排序下标切片，范围过滤为一次向量化比较。
+    """
+
+    def __init__(
+        self,
+        records: pd.DataFrame,
+        columns: Dict[str, np.ndarray],
+        allergen_masks: Optional[np.ndarray] = None
+    ):
+        self.labels = {name: records[name].to_numpy(dtype=object) for name in records.columns}
+        self.columns = columns
+        self.allergen_masks = allergen_masks
+        self.sorted_indexes = {
+            field: np.argsort(values, kind='stable')
+            for field, values in columns.items()
+        }
+
+    @classmethod
+    def from_csv(
+        cls,
+        file_path: str,
+        nutrient_columns: Dict[str, str] = NUTRIENT_COLUMNS,
+        allergen_index: Optional[AllergenIndex] = None
+    ) -> 'NutrientTable':
+        """从食物成分CSV加载，提供allergen_index时按食物名称预先计算过敏原位掩码"""
+        df = pd.read_csv(file_path)
+        df = df[df['食物名称'].notna()]
+        columns = {
+            field: clean_numeric_column(df[column]) if column in df.columns else np.zeros(len(df))
+            for field, column in nutrient_columns.items()
+        }
+        records = pd.DataFrame({
+            '食物名称': df['食物名称'].astype(str),
+            '食物类别': df['大类名称'].astype(str) if '大类名称' in df.columns else '未分类',
+            '子类名称': df['子类名称'].astype(str) if '子类名称' in df.columns else '未分类',
+        })
+        allergen_masks = allergen_index.compute_name_masks(records['食物名称']) if allergen_index else None
+        logger.info(f"成功加载营养成分列式表，共 {len(records)} 行 {len(columns)} 种营养素")
+        return cls(records, columns, allergen_masks)
+
+    def __len__(self) -> int:
+        return len(self.labels['食物名称'])
+
+    def mask(self, conditions: Iterable[Condition] = (), exclude_bits: int = 0) -> np.ndarray:
+        """
+        计算满足全部范围条件且不含指定过敏原的行掩码
+        """
+        result = np.ones(len(self), dtype=bool)
+        for field, op, value in conditions:
+            values = self.columns[field]
+            if op == '>':
+                result &= values > value
+            elif op == '>=':
+                result &= values >= value
+            elif op == '<':
+                result &= values < value
+            elif op == '<=':
+                result &= values <= value
+            else:
+                raise ValueError(f"不支持的比较运算符: {op}")
+        if exclude_bits and self.allergen_masks is not None:
+            result &= allowed_rows(self.allergen_masks, exclude_bits)
+        return result
+
+    def top(
+        self,
+        field: Optional[str] = None,
+        descending: bool = True,
+        n: int = 5,
+        mask: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        按营养素取前n行的行号
+
+        Args:
+            field: 排序字段，为None时按表中原始顺序返回
+            descending: 是否降序
+            n: 返回数量
+            mask: 行掩码，只在掩码为True的行中选取
+        """
+        if field is None:
+            order = np.arange(len(self))
+        else:
+            order = self.sorted_indexes[field]
+            if descending:
+                order = order[::-1]
+        if mask is not None:
+            order = order[mask[order]]
+        return order[:n]
+
+    def query(
+        self,
+        field: Optional[str] = None,
+        descending: bool = True,
+        n: int = 5,
+        conditions: Sequence[Condition] = (),
+        exclude_bits: int = 0
+    ) -> List[Dict[str, Any]]:
+        """按范围条件和过敏原过滤后按营养素排序，返回前n条记录"""
+        mask = self.mask(conditions, exclude_bits) if conditions or exclude_bits else None
+        return [self.record(i) for i in self.top(field, descending, n, mask)]
+
+    def record(self, index: int) -> Dict[str, Any]:
+        """将一行转换为与食物成分文档metadata一致的字典"""
+        record = {name: values[index] for name, values in self.labels.items()}
+        for field, values in self.columns.items():
+            record[field] = float(values[index])
+        record['数据类型'] = '食物成分'
+        return record
@@ -0,0 +1,89 @@
+import json
+import logging
+import os
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# 导出目录中的文件名
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model_int8.onnx"
+CONFIG_FILE = "embedding_config.json"
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    基于 ONNX Runtime 的CPU嵌入后端
+
+    加载 export_onnx 导出的模型目录（ONNX模型、分词器和池化配置），
+    分批完成分词、推理和池化，结果与 sentence-transformers 的输出一致。
+    onnxruntime 与 transformers 在构造时才导入，未使用该后端时无需安装。
+    """
+
+    def __init__(
+        self,
+        model_dir: str,
+        quantized: bool = False,
+        batch_size: int = 32,
+        num_threads: Optional[int] = None
+    ):
+        """
+        Args:
+            model_dir: export_onnx 的输出目录
+            quantized: 是否加载int8动态量化模型
+            batch_size: 每次推理的最大文本数
+            num_threads: ONNX Runtime 算子内线程数，为None时由运行时决定
+        """
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_path = os.path.join(model_dir, QUANTIZED_MODEL_FILE if quantized else MODEL_FILE)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(
+                f"找不到ONNX模型: {model_path}，请先运行 python -m robot.retrieval.export_onnx"
+                + (" --quantize" if quantized else "")
+            )
+        with open(os.path.join(model_dir, CONFIG_FILE), 'r', encoding='utf-8') as f:
+            config = json.load(f)
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self.input_names = [item.name for item in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model_name = config.get('model_name', model_dir)
+        self.max_seq_length = int(config.get('max_seq_length', 512))
+        self.pooling = config.get('pooling', 'mean')
+        self.batch_size = batch_size
+        self.quantized = quantized
+        logger.info(f"成功加载ONNX嵌入模型: {model_path}（池化方式: {self.pooling}，最大长度: {self.max_seq_length}）")
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        outputs = []
+        for start in range(0, len(texts), self.batch_size):
+            encoded = self.tokenizer(
+                texts[start:start + self.batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors='np'
+            )
+            feeds = {name: encoded[name].astype(np.int64) for name in self.input_names if name in encoded}
+            hidden = self.session.run(None, feeds)[0]
+            if self.pooling == 'cls':
+                pooled = hidden[:, 0]
+            else:
+                mask = encoded['attention_mask'][..., None].astype(np.float32)
+                pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            outputs.append(pooled.astype(np.float32))
+        return np.vstack(outputs) if outputs else np.zeros((0, 0), dtype=np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(list(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0].tolist()
@@ -0,0 +1,143 @@
+from typing import Dict, Optional, Union
+
+import numpy as np
+
+# 快照中保存压缩向量所用数组的名称前缀
+ARRAY_PREFIX = "quantized_"
+
+# 向量的存储类型：float32 为原始精度，其余为压缩存储
+STORAGE_TYPES = ('float32', 'float16', 'int8')
+
+# 打分时每块解码的行数，限制临时float32矩阵的内存（8192行×768维约24MB）
+DECODE_BLOCK_SIZE = 8192
+
+
+class QuantizedMatrix:
+    """
+    压缩存储的向量矩阵（float16，或按维度仿射的int8标量量化）
+
+    int8 时每一维 d 记录 offset[d] 与 scale[d]，x ≈ offset + scale * code，code ∈ [-128, 127]，
+    每维的取值区间 [min, max] 恰好映射到256个码值。内积可以不解码整矩阵直接计算：
+    x·q = offset·q + code·(scale*q)，于是打分只需把码值分块转为float32后做一次矩阵乘法，
+    临时内存与分块大小成正比，常驻内存只有码值本身（float16为原矩阵的1/2，int8为1/4）。
+
+    支持 len()、按行切片/下标取子矩阵以及 matrix @ query，可在打分处替代 numpy 矩阵。
+    """
+
+    def __init__(self, codes: np.ndarray, scale: Optional[np.ndarray] = None, offset: Optional[np.ndarray] = None):
+        """
+        Args:
+            codes: (n, dim) 的float16向量或int8码值
+            scale: int8时每一维的量化步长
+            offset: int8时每一维码值0对应的取值
+        """
+        if codes.dtype == np.int8 and (scale is None or offset is None):
+            raise ValueError("int8量化需要提供 scale 和 offset")
+        if codes.dtype not in (np.int8, np.float16):
+            raise ValueError(f"不支持的压缩类型: {codes.dtype}")
+        self.codes = codes
+        self.scale = None if scale is None else np.asarray(scale, dtype=np.float32)
+        self.offset = None if offset is None else np.asarray(offset, dtype=np.float32)
+
+    @classmethod
+    def encode(cls, vectors: np.ndarray, storage: str) -> 'QuantizedMatrix':
+        """
+        压缩向量矩阵
+
+        Args:
+            vectors: (n, dim) 的float32矩阵
+            storage: 'float16' 或 'int8'
+        """
+        if storage == 'float16':
+            return cls(np.asarray(vectors, dtype=np.float16))
+        if storage != 'int8':
+            raise ValueError(f"不支持的存储类型: {storage}，可选: {', '.join(STORAGE_TYPES[1:])}")
+
+        low = np.full(vectors.shape[1], np.inf, dtype=np.float32)
+        high = np.full(vectors.shape[1], -np.inf, dtype=np.float32)
+        for start in range(0, len(vectors), DECODE_BLOCK_SIZE):
+            block = np.asarray(vectors[start:start + DECODE_BLOCK_SIZE], dtype=np.float32)
+            np.minimum(low, block.min(axis=0), out=low)
+            np.maximum(high, block.max(axis=0), out=high)
+        scale = np.maximum(high - low, 1e-12) / 255
+        offset = low + 128 * scale
+
+        codes = np.empty(vectors.shape, dtype=np.int8)
+        for start in range(0, len(vectors), DECODE_BLOCK_SIZE):
+            block = np.asarray(vectors[start:start + DECODE_BLOCK_SIZE], dtype=np.float32)
+            codes[start:start + len(block)] = np.clip(np.rint((block - offset) / scale), -128, 127)
+        return cls(codes, scale, offset)
+
+    @property
+    def storage(self) -> str:
+        return 'int8' if self.codes.dtype == np.int8 else 'float16'
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def nbytes(self) -> int:
+        extra = 0 if self.scale is None else self.scale.nbytes + self.offset.nbytes
+        return int(self.codes.nbytes) + extra
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, rows) -> 'QuantizedMatrix':
+        """按行切片或按行号取子矩阵，共享量化参数"""
+        return QuantizedMatrix(self.codes[rows], self.scale, self.offset)
+
+    def decode(self, rows=slice(None)) -> np.ndarray:
+        """解码为float32"""
+        block = self.codes[rows].astype(np.float32)
+        if self.scale is not None:
+            block *= self.scale
+            block += self.offset
+        return block
+
+    def __matmul__(self, other: np.ndarray) -> np.ndarray:
+        """
+        与查询向量 (dim,) 或查询矩阵 (dim, b) 的内积，分块解码计算
+
+        Returns:
+            (n,) 或 (n, b) 的float32得分
+        """
+        other = np.asarray(other, dtype=np.float32)
+        if self.scale is not None:
+            weights = other * (self.scale if other.ndim == 1 else self.scale[:, None])
+            bias = self.offset @ other
+        else:
+            weights, bias = other, None
+        out = np.empty((len(self),) + other.shape[1:], dtype=np.float32)
+        for start in range(0, len(self), DECODE_BLOCK_SIZE):
+            block = self.codes[start:start + DECODE_BLOCK_SIZE].astype(np.float32)
+            out[start:start + len(block)] = block @ weights
+        if bias is not None:
+            out += bias
+        return out
+
+    def to_arrays(self, prefix: str = ARRAY_PREFIX) -> Dict[str, np.ndarray]:
+        """导出为可写入快照的数组"""
+        arrays = {f"{prefix}codes": self.codes}
+        if self.scale is not None:
+            arrays[f"{prefix}scale"] = self.scale
+            arrays[f"{prefix}offset"] = self.offset
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], prefix: str = ARRAY_PREFIX) -> Optional['QuantizedMatrix']:
+        """从快照数组恢复，数组不全时返回None"""
+        codes = arrays.get(f"{prefix}codes")
+        if codes is None:
+            return None
+        if codes.dtype == np.int8 and (f"{prefix}scale" not in arrays or f"{prefix}offset" not in arrays):
+            return None
+        return cls(codes, arrays.get(f"{prefix}scale"), arrays.get(f"{prefix}offset"))
+
+
+def encode_vectors(vectors: np.ndarray, storage: str) -> Union[np.ndarray, QuantizedMatrix]:
+    """按存储类型压缩向量矩阵，float32 时原样返回"""
+    if storage == 'float32':
+        return vectors
+    return QuantizedMatrix.encode(vectors, storage)
@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .metrics import Histogram
+from .vector_index import normalize_rows
+
+
+class SemanticCache:
+    """
+    按向量相似度命中的线程安全缓存
+
+    条目按分区（例如用户上下文的哈希）存放，查询只与同一分区内的条目比较余弦相似度，
+    最高相似度不低于阈值时命中。每个条目有各自的存活时间，总条目数超过上限时淘汰
+    最久未使用的条目。命中、未命中、淘汰、过期次数以及命中时的相似度分布可通过 stats() 获取。
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.92,
+        maxsize: int = 1024,
+        ttl: Optional[float] = 86400,
+        timer: Callable[[], float] = time.monotonic
+    ):
+        """
+        Args:
+            threshold: 命中所需的最低余弦相似度
+            maxsize: 最大条目数，超出后淘汰最久未使用的条目
+            ttl: 条目默认存活时间（秒），为None时永不过期
+            timer: 时间函数，便于测试替换
+        """
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._timer = timer
+        # 条目ID -> (分区, 归一化向量, 值, 过期时间)，按最近使用排序
+        self._entries: "OrderedDict[int, Tuple[Hashable, np.ndarray, Any, Optional[float]]]" = OrderedDict()
+        self._partitions: Dict[Hashable, List[int]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.hit_similarity = Histogram([0.9, 0.92, 0.94, 0.96, 0.98, 0.99, 1.0])
+
+    def _remove(self, entry_id: int):
+        partition = self._entries.pop(entry_id)[0]
+        ids = self._partitions[partition]
+        ids.remove(entry_id)
+        if not ids:
+            del self._partitions[partition]
+
+    def get(self, partition: Hashable, vector: np.ndarray) -> Tuple[Any, float]:
+        """
+        查找分区内与向量最相似的未过期条目
+
+        Returns:
+            (值, 相似度)；未命中时值为None，相似度为分区内的最高相似度（分区为空时为0）
+        """
+        value, similarity, _ = self.lookup([partition], vector)
+        return value, similarity
+
+    def lookup(self, partitions: Sequence[Hashable], vector: np.ndarray) -> Tuple[Any, float, Optional[Hashable]]:
+        """
+        在多个分区中查找与向量最相似的未过期条目，计为一次命中或未命中
+
+        Returns:
+            (值, 相似度, 命中的分区)；未命中时值与分区为None，相似度为各分区内的最高相似度
+        """
+        query = normalize_rows(vector)[0]
+        with self._lock:
+            now = self._timer()
+            best_id, similarity = None, 0.0
+            for partition in partitions:
+                for entry_id in list(self._partitions.get(partition, ())):
+                    expires_at = self._entries[entry_id][3]
+                    if expires_at is not None and expires_at <= now:
+                        self._remove(entry_id)
+                        self.expirations += 1
+                ids = self._partitions.get(partition)
+                if not ids:
+                    continue
+                scores = np.stack([self._entries[entry_id][1] for entry_id in ids]) @ query
+                best = int(np.argmax(scores))
+                if best_id is None or scores[best] > similarity:
+                    best_id, similarity = ids[best], float(scores[best])
+            if best_id is None or similarity < self.threshold:
+                self.misses += 1
+                return None, similarity, None
+            self._entries.move_to_end(best_id)
+            partition, _, value, _ = self._entries[best_id]
+            self.hits += 1
+        self.hit_similarity.observe(similarity)
+        return value, similarity, partition
+
+    def set(self, partition: Hashable, vector: np.ndarray, value: Any, ttl: Optional[float] = None):
+        """
+        写入条目，ttl为None时使用默认存活时间；分区内已有几乎相同（相似度不低于阈值）的条目时替换它
+        """
+        ttl = self.ttl if ttl is None else ttl
+        normalized = normalize_rows(vector)[0]
+        with self._lock:
+            expires_at = self._timer() + ttl if ttl is not None else None
+            ids = self._partitions.get(partition)
+            if ids:
+                scores = np.stack([self._entries[entry_id][1] for entry_id in ids]) @ normalized
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self._remove(ids[best])
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (partition, normalized, value, expires_at)
+            self._partitions.setdefault(partition, []).append(entry_id)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        """清空缓存，统计计数保留"""
+        with self._lock:
+            self._entries.clear()
+            self._partitions.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存统计信息"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "partitions": len(self._partitions),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_similarity": self.hit_similarity.snapshot()
+        }
@@ -0,0 +1,259 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+# 快照格式版本，修改文件布局时递增以使旧快照失效
+SNAPSHOT_VERSION = 5
+
+EMBEDDINGS_FILE = "embeddings.npy"
+CHUNKS_FILE = "chunks.json"
+META_FILE = "meta.json"
+
+# 写入新快照后，同一配置下除当前快照外再保留的旧快照数量：
+# 仍在使用上一代快照（已内存映射）的进程不会被删掉正在读取的文件
+KEEP_PREVIOUS = 1
+
+
+def compute_snapshot_key(file_paths: Iterable[str], model_name: str, splitter_settings: Dict[str, Any]) -> str:
+    """
+    计算索引快照的键
+
+    Args:
+        file_paths: 参与构建索引的数据文件路径
+        model_name: 嵌入模型名称
+        splitter_settings: 文本分割器参数
+
+    Returns:
+        str: CSV内容、模型名称和分割参数共同决定的sha256摘要
+    """
+    hasher = hashlib.sha256()
+    hasher.update(f"snapshot-v{SNAPSHOT_VERSION}".encode('utf-8'))
+    hasher.update(model_name.encode('utf-8'))
+    hasher.update(json.dumps(splitter_settings, sort_keys=True).encode('utf-8'))
+    for path in file_paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                hasher.update(block)
+    return hasher.hexdigest()
+
+
+def compute_config_id(model_name: str, settings: Dict[str, Any]) -> str:
+    """
+    计算快照配置的标识：嵌入模型与构建参数相同、只是数据不同的快照属于同一配置
+
+    共用同一快照目录的进程可能使用不同配置（精确检索与IVF、不同的向量存储类型或嵌入后端），
+    清理旧快照时只清理同一配置下的快照。
+    """
+    hasher = hashlib.sha256()
+    hasher.update(f"snapshot-v{SNAPSHOT_VERSION}".encode('utf-8'))
+    hasher.update(model_name.encode('utf-8'))
+    hasher.update(json.dumps(settings, sort_keys=True).encode('utf-8'))
+    return hasher.hexdigest()[:16]
+
+
+def save_snapshot(
+    snapshot_dir: str,
+    key: str,
+    documents: List[Document],
+    vectors: np.ndarray,
+    extra_meta: Optional[Dict[str, Any]] = None,
+    arrays: Optional[Dict[str, np.ndarray]] = None,
+    extra_arrays: Optional[Dict[str, np.ndarray]] = None,
+    config_id: Optional[str] = None
+) -> str:
+    """
+    将分块文档及其向量写入磁盘快照
+
+    先写入临时目录再整体重命名，其他进程不会读到写了一半的快照。
+
+    Args:
+        snapshot_dir: 快照根目录
+        key: 快照键，见 compute_snapshot_key
+        documents: 分块后的文档
+        vectors: 与documents一一对应的向量矩阵
+        extra_meta: 需要一并记录的附加信息
+        arrays: 与分块一一对应的附加数组（如过敏原位掩码），按名称保存
+        extra_arrays: 长度不受分块数量约束的附加数组（如倒排索引），按名称保存
+        config_id: 快照配置的标识，见 compute_config_id；提供时写入后清理同一配置下
+            较旧的快照（保留上一代），为None时不清理
+
+    Returns:
+        str: 快照所在目录
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if vectors.ndim != 2 or vectors.shape[0] != len(documents):
+        raise ValueError(f"向量矩阵形状 {vectors.shape} 与文档数量 {len(documents)} 不匹配")
+
+    arrays = arrays or {}
+    for name, array in arrays.items():
+        if len(array) != len(documents):
+            raise ValueError(f"附加数组 {name} 长度 {len(array)} 与文档数量 {len(documents)} 不匹配")
+    extra_arrays = extra_arrays or {}
+    if set(arrays) & set(extra_arrays):
+        raise ValueError(f"附加数组名称重复: {sorted(set(arrays) & set(extra_arrays))}")
+
+    os.makedirs(snapshot_dir, exist_ok=True)
+    target_dir = os.path.join(snapshot_dir, key)
+    tmp_dir = f"{target_dir}.tmp-{os.getpid()}"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+
+    try:
+        np.save(os.path.join(tmp_dir, EMBEDDINGS_FILE), vectors)
+        for name, array in {**arrays, **extra_arrays}.items():
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), np.ascontiguousarray(array))
+        with open(os.path.join(tmp_dir, CHUNKS_FILE), 'w', encoding='utf-8') as f:
+            json.dump(
+                [{"text": doc.page_content, "metadata": doc.metadata} for doc in documents],
+                f,
+                ensure_ascii=False
+            )
+        meta = {
+            "version": SNAPSHOT_VERSION,
+            "key": key,
+            "count": int(vectors.shape[0]),
+            "dim": int(vectors.shape[1]),
+            "arrays": sorted(arrays),
+            "extra_arrays": sorted(extra_arrays),
+            "config_id": config_id,
+            **(extra_meta or {})
+        }
+        with open(os.path.join(tmp_dir, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        if os.path.exists(target_dir):
+            # 其他进程已写入相同键的快照，内容一致，丢弃本次结果
+            shutil.rmtree(tmp_dir)
+        else:
+            os.replace(tmp_dir, target_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    if config_id is not None:
+        _prune_snapshots(snapshot_dir, keep=key, config_id=config_id)
+    logger.info(f"索引快照已写入: {target_dir}（{len(documents)} 个分块）")
+    return target_dir
+
+
+def load_snapshot(
+    snapshot_dir: str,
+    key: str
+) -> Optional[Tuple[List[Document], np.ndarray, Dict[str, np.ndarray]]]:
+    """
+    按键加载索引快照
+
+    向量矩阵和附加数组以只读内存映射方式打开，多个进程加载同一快照时共享页缓存。
+
+    Returns:
+        (documents, vectors, arrays)，arrays 同时包含分块附加数组和其他附加数组；
+        快照不存在、键不匹配或已损坏时返回None
+    """
+    target_dir = os.path.join(snapshot_dir, key)
+    meta_path = os.path.join(target_dir, META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get("version") != SNAPSHOT_VERSION or meta.get("key") != key:
+            logger.warning(f"索引快照版本或键不匹配，忽略: {target_dir}")
+            return None
+
+        vectors = np.load(os.path.join(target_dir, EMBEDDINGS_FILE), mmap_mode='r')
+        arrays = {
+            name: np.load(os.path.join(target_dir, f"{name}.npy"), mmap_mode='r')
+            for name in meta.get("arrays", [])
+        }
+        with open(os.path.join(target_dir, CHUNKS_FILE), 'r', encoding='utf-8') as f:
+            chunks = json.load(f)
+
+        if vectors.shape[0] != len(chunks) or vectors.shape[0] != meta.get("count") \
+                or any(len(array) != len(chunks) for array in arrays.values()):
+            logger.warning(f"索引快照内容不完整，忽略: {target_dir}")
+            return None
+        for name in meta.get("extra_arrays", []):
+            arrays[name] = np.load(os.path.join(target_dir, f"{name}.npy"), mmap_mode='r')
+
+        documents = [Document(page_content=chunk["text"], metadata=chunk["metadata"]) for chunk in chunks]
+        logger.info(f"已加载索引快照: {target_dir}（{len(documents)} 个分块）")
+        return documents, vectors, arrays
+    except Exception as e:
+        logger.error(f"加载索引快照失败: {str(e)}")
+        return None
+
+
+def snapshot_exists(snapshot_dir: str, key: str) -> bool:
+    """指定键的快照是否已写入（不加载数据）"""
+    return os.path.exists(os.path.join(snapshot_dir, key, META_FILE))
+
+
+def latest_snapshot(snapshot_dir: str, config_id: Optional[str] = None) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """
+    返回最近写入的一个有效快照
+
+    用于增量构建：新键的快照尚不存在时，以最近的快照为基础复用未变化行的向量；
+    也用于多worker部署时发现其他进程写入的新快照。
+
+    Args:
+        snapshot_dir: 快照根目录
+        config_id: 只考虑该配置下的快照，为None时不限
+
+    Returns:
+        (key, meta)；没有可用快照时返回None
+    """
+    if not os.path.isdir(snapshot_dir):
+        return None
+    candidates = []
+    for name in os.listdir(snapshot_dir):
+        meta_path = os.path.join(snapshot_dir, name, META_FILE)
+        if '.tmp-' in name or not os.path.exists(meta_path):
+            continue
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except Exception as e:
+            logger.warning(f"读取快照元数据失败，忽略: {meta_path}（{str(e)}）")
+            continue
+        if meta.get("version") == SNAPSHOT_VERSION and meta.get("key") == name \
+                and (config_id is None or meta.get("config_id") == config_id):
+            candidates.append((os.path.getmtime(meta_path), name, meta))
+    if not candidates:
+        return None
+    _, key, meta = max(candidates, key=lambda item: item[0])
+    return key, meta
+
+
+def _prune_snapshots(snapshot_dir: str, keep: str, config_id: str, keep_previous: int = KEEP_PREVIOUS):
+    """
+    删除同一配置下较旧的快照，保留当前快照以及最近的 keep_previous 个旧快照
+
+    其他配置（或未记录配置）的快照可能正被其他进程使用，不做处理。
+    """
+    candidates = []
+    for name in os.listdir(snapshot_dir):
+        meta_path = os.path.join(snapshot_dir, name, META_FILE)
+        if name == keep or '.tmp-' in name or not os.path.exists(meta_path):
+            continue
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except Exception:
+            continue
+        if meta.get("config_id") == config_id:
+            candidates.append((os.path.getmtime(meta_path), name))
+    candidates.sort(reverse=True)
+    for _, name in candidates[keep_previous:]:
+        path = os.path.join(snapshot_dir, name)
+        shutil.rmtree(path, ignore_errors=True)
+        logger.info(f"已删除旧索引快照: {path}")
@@ -0,0 +1,241 @@
+import logging
+import mmap
+import os
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from .quantization import QuantizedMatrix
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """按行做L2归一化，返回连续的float32矩阵"""
+    matrix = np.array(vectors, dtype=np.float32, copy=True, ndmin=2)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    取每行得分最高的k个下标，按得分降序排列
+
+    Args:
+        scores: 一维 (n,) 或二维 (batch, n) 的得分
+        k: 返回数量
+
+    Returns:
+        np.ndarray: 与scores维度一致的下标数组
+    """
+    n = scores.shape[-1]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.int64)
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    else:
+        candidates = np.broadcast_to(np.arange(n), scores.shape).copy()
+    candidate_scores = np.take_along_axis(scores, candidates, axis=-1)
+    order = np.argsort(-candidate_scores, axis=-1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=-1)
+
+
+def read_rows(matrix: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """
+    取出矩阵的若干行（float32）
+
+    对 np.load(mmap_mode='r') 得到的内存映射矩阵，逐行用 pread 从文件读取，而不是通过映射访问：
+    缺页时内核会把相邻的页一并映射进来（fault-around），零散读取几十行就可能让整个文件的页
+    计入进程的常驻内存。pread 只把数据拷贝到新数组，页仍留在可回收的页缓存中。
+    不支持 preadv 的平台（Windows）或非文件映射的矩阵直接按下标取行。
+    """
+    if not (hasattr(os, 'preadv') and isinstance(matrix, np.memmap) and isinstance(matrix.base, mmap.mmap)
+            and matrix.filename and matrix.ndim == 2 and matrix.flags.c_contiguous):
+        return np.asarray(matrix[rows], dtype=np.float32)
+    out = np.empty((len(rows), matrix.shape[1]), dtype=matrix.dtype)
+    row_bytes = matrix.shape[1] * matrix.itemsize
+    fd = os.open(matrix.filename, os.O_RDONLY)
+    try:
+        for i, row in enumerate(rows):
+            os.preadv(fd, [out[i]], matrix.offset + int(row) * row_bytes)
+    finally:
+        os.close(fd)
+    return out.astype(np.float32, copy=False)
+
+
+class MatrixVectorStore:
+    """
+    基于连续float32矩阵的向量存储
+
+    所有分块向量经L2归一化后存放在一个 (n, dim) 矩阵中，一次查询只需一次矩阵-向量乘法
+    和一次 argpartition；批量查询通过一次矩阵乘法完成。返回的 Document 与 InMemoryVectorStore
+    保持相同的 page_content 和 metadata，下游的过滤与排序逻辑无需修改。
+
+    语料规模较大时可挂接近似最近邻索引（如 IVFFlatIndex），按向量检索改由该索引只扫描
+    部分向量；也可以改用压缩存储的向量（QuantizedMatrix）打分，常驻内存减半或降到1/4。
+    这两种情况下得分是近似的，可对多取出的候选用原float32向量精确重排，接口不变。
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        documents: Sequence[Document],
+        vectors: np.ndarray,
+        normalized: bool = False,
+        ann_index=None,
+        compressed: Optional[QuantizedMatrix] = None,
+        rescore_factor: int = 0
+    ):
+        """
+        Args:
+            embedding: 用于嵌入查询文本的模型
+            documents: 分块文档
+            vectors: 与documents一一对应的向量矩阵
+            normalized: 向量是否已经L2归一化；为True且为float32连续矩阵时直接使用，
+                不做拷贝，可保留快照的内存映射
+            ann_index: 近似最近邻索引，需提供 search(embedding, k, allowed) 且按同一行号返回结果；
+                为None时精确检索
+            compressed: 与vectors对应的压缩向量，不为None（且无近似索引）时用它代替float32矩阵打分，
+                float32矩阵只在重排时按行读取；以内存映射加载时其余页不会被读入
+            rescore_factor: 得分为近似值时先取 k * rescore_factor 个候选，再用float32向量精确重排；
+                为0时不重排
+        """
+        if len(documents) != len(vectors):
+            raise ValueError(f"文档数量 {len(documents)} 与向量数量 {len(vectors)} 不一致")
+        if ann_index is not None and len(ann_index) != len(documents):
+            raise ValueError(f"近似索引行数 {len(ann_index)} 与文档数量 {len(documents)} 不一致")
+        if compressed is not None and len(compressed) != len(documents):
+            raise ValueError(f"压缩向量数量 {len(compressed)} 与文档数量 {len(documents)} 不一致")
+        self.embedding = embedding
+        self.documents = list(documents)
+        if normalized and isinstance(vectors, np.ndarray) and vectors.dtype == np.float32 \
+                and vectors.flags['C_CONTIGUOUS']:
+            self.matrix = vectors
+        else:
+            self.matrix = normalize_rows(vectors)
+        self.ann_index = ann_index
+        self.compressed = compressed
+        self.rescore_factor = rescore_factor
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def _embed_query(self, query: str) -> np.ndarray:
+        return normalize_rows(self.embedding.embed_query(query))[0]
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: Sequence[float],
+        k: int = 4,
+        allowed: Optional[np.ndarray] = None
+    ) -> List[Tuple[Document, float]]:
+        """
+        按查询向量检索，返回 (文档, 余弦相似度)
+
+        Args:
+            allowed: 行掩码，为False的行在选取 top-k 之前即被排除
+        """
+        return [(self.documents[i], score) for i, score in self.search_rows_by_vector(embedding, k, allowed)]
+
+    def search_rows_by_vector(
+        self,
+        embedding: Sequence[float],
+        k: int = 4,
+        allowed: Optional[np.ndarray] = None
+    ) -> List[Tuple[int, float]]:
+        """按查询向量检索，返回 (行号, 余弦相似度)，便于与其他检索结果按行号融合"""
+        query = normalize_rows(embedding)[0]
+        shortlist = k * self.rescore_factor if self.approximate_scores and self.rescore_factor > 1 else k
+        if self.ann_index is not None:
+            results = self.ann_index.search(query, shortlist, allowed)
+        else:
+            scores = (self.compressed if self.compressed is not None else self.matrix) @ query
+            if allowed is not None:
+                scores[~allowed] = -np.inf
+            indices = top_k_indices(scores, shortlist)
+            results = [(int(i), float(scores[i])) for i in indices if scores[i] != -np.inf]
+        if shortlist > k:
+            results = self._rescore(query, [row for row, _ in results], k)
+        return results
+
+    @property
+    def approximate_scores(self) -> bool:
+        """打分是否使用压缩向量（得分为近似值）"""
+        return self.compressed is not None if self.ann_index is None \
+            else getattr(self.ann_index, 'quantized', False)
+
+    def _rescore(self, query: np.ndarray, rows: List[int], k: int) -> List[Tuple[int, float]]:
+        """用float32向量对候选行精确打分，返回前k个"""
+        if not rows:
+            return []
+        rows = np.sort(np.asarray(rows, dtype=np.int64))
+        scores = read_rows(self.matrix, rows) @ query
+        return [(int(rows[i]), float(scores[i])) for i in top_k_indices(scores, k)]
+
+    def search_rows(self, query: str, k: int = 4, allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """按查询文本检索，返回 (行号, 余弦相似度)"""
+        return self.search_rows_by_vector(self._embed_query(query), k, allowed)
+
+    def similarity_search_by_vector(
+        self,
+        embedding: Sequence[float],
+        k: int = 4,
+        allowed: Optional[np.ndarray] = None
+    ) -> List[Document]:
+        """按查询向量检索"""
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, allowed)]
+
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        allowed: Optional[np.ndarray] = None
+    ) -> List[Tuple[Document, float]]:
+        """按查询文本检索，返回 (文档, 余弦相似度)"""
+        return self.similarity_search_with_score_by_vector(self._embed_query(query), k, allowed)
+
+    def similarity_search(self, query: str, k: int = 4, allowed: Optional[np.ndarray] = None) -> List[Document]:
+        """按查询文本检索，接口与 InMemoryVectorStore.similarity_search 一致"""
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, allowed)]
+
+    def batch_similarity_search_by_vectors(
+        self,
+        embeddings: np.ndarray,
+        k: int = 4,
+        allowed: Optional[np.ndarray] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """批量按向量检索，所有查询通过一次矩阵乘法打分（挂接近似索引或使用压缩向量时逐条检索）"""
+        if self.ann_index is not None or self.compressed is not None:
+            return [
+                self.similarity_search_with_score_by_vector(query, k, allowed)
+                for query in np.asarray(embeddings, dtype=np.float32)
+            ]
+        queries = normalize_rows(embeddings)
+        scores = queries @ self.matrix.T
+        if allowed is not None:
+            scores[:, ~allowed] = -np.inf
+        indices = top_k_indices(scores, k)
+        return [
+            [(self.documents[i], float(row_scores[i])) for i in row_indices if row_scores[i] != -np.inf]
+            for row_scores, row_indices in zip(scores, indices)
+        ]
+
+    def batch_similarity_search(
+        self,
+        queries: List[str],
+        k: int = 4,
+        allowed: Optional[np.ndarray] = None
+    ) -> List[List[Document]]:
+        """批量按文本检索，查询文本在一次 embed_documents 调用中完成嵌入"""
+        if not queries:
+            return []
+        vectors = np.asarray(self.embedding.embed_documents(queries), dtype=np.float32)
+        return [
+            [doc for doc, _ in results]
+            for results in self.batch_similarity_search_by_vectors(vectors, k, allowed)
+        ]
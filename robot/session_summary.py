@@ -0,0 +1,287 @@
+"""
+按会话滚动更新的对话摘要
+
+长会话每轮都要重新发送 chat_records 中的原始历史。这里为每个会话维护一份摘要，存放在
+robot_session_summaries 表（与 robot_sessions 一一对应），记录已并入摘要的最后一条聊天记录ID。
+每次回复保存后在后台更新摘要（不在请求路径上）：超出最近 RECENT_TURNS 轮的原始对话被并入摘要。
+chat() 只发送摘要以及摘要之后的原始对话，提示长度和模型延迟不再随会话变长而增长。
+
+生成摘要的方式可以替换：默认用 ROBOT_SUMMARY_MODEL 指定的模型（默认本地的 qwen2.5-1.5b，
+设为空字符串时用当前对话模型），也可以通过 set_summarizer() 换成其他实现。
+摘要表由 backend/init_db.py 创建。
+"""
+import asyncio
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from robot import globals
+from robot.database.memory import get_pool
+from robot.retrieval import Histogram
+
+logger = logging.getLogger(__name__)
+
+# 是否启用会话摘要
+SUMMARY_ENABLED = os.getenv("ROBOT_SESSION_SUMMARY", "true").lower() == "true"
+
+# 摘要之外保留原文发送的最近对话轮数
+RECENT_TURNS = int(os.getenv("ROBOT_RECENT_TURNS", 3))
+
+# 单次并入摘要的最大轮数，积压较多时分批更新
+SUMMARY_BATCH_TURNS = int(os.getenv("ROBOT_SUMMARY_BATCH_TURNS", 10))
+
+# 摘要的最大长度（字符）
+SUMMARY_MAX_CHARS = int(os.getenv("ROBOT_SUMMARY_MAX_CHARS", 800))
+
+# 生成摘要使用的模型名称（get_llm 支持的名称），为空时使用当前对话模型。
+# 长会话中每次回复后都会调用一次，默认使用经 Ollama 运行的本地小模型，不产生API费用
+SUMMARY_MODEL = os.getenv("ROBOT_SUMMARY_MODEL", "qwen2.5-1.5b")
+
+# 单次生成摘要的超时（秒）
+SUMMARY_TIMEOUT = float(os.getenv("ROBOT_SUMMARY_TIMEOUT", 60))
+
+SUMMARY_PROMPT = """你负责维护一段食疗营养助手与用户对话的摘要。请把新的对话内容并入已有摘要，输出更新后的完整摘要。
+
+要求：
+1. 保留用户的健康状况、症状、过敏与饮食禁忌、口味偏好和目标
+2. 保留助手已经给出的主要建议、推荐的食物和食谱，以及用户的反馈
+3. 保留尚未解决的问题和用户提到要继续跟进的事项
+4. 省略寒暄和重复内容，不要编造对话中没有的信息
+5. 使用第三人称简洁陈述，不超过{max_chars}字，只输出摘要正文
+
+已有摘要：
+{summary}
+
+新的对话：
+{turns}
+"""
+
+
+class Summarizer(ABC):
+    """摘要生成器接口：把新的若干轮对话并入已有摘要"""
+
+    @abstractmethod
+    async def summarize(self, summary: str, turns: List[Tuple[str, str]]) -> str:
+        """
+        Args:
+            summary: 已有摘要，会话还没有摘要时为空字符串
+            turns: 新的 (用户消息, 回复)，按时间从旧到新
+
+        Returns:
+            更新后的摘要
+        """
+
+
+class LLMSummarizer(Summarizer):
+    """用对话模型生成摘要"""
+
+    def __init__(self, model_name: str = SUMMARY_MODEL, max_chars: int = SUMMARY_MAX_CHARS):
+        """
+        Args:
+            model_name: get_llm 支持的模型名称，为空时使用当前对话模型
+            max_chars: 摘要的最大长度（字符）
+        """
+        self.model_name = model_name
+        self.max_chars = max_chars
+        self._model = None
+
+    def get_model(self):
+        if not self.model_name:
+            return globals.current_model
+        if self._model is None:
+            from robot.llms import get_llm
+
+            self._model = get_llm(self.model_name, temperature=0.1)
+        return self._model
+
+    async def summarize(self, summary: str, turns: List[Tuple[str, str]]) -> str:
+        content = SUMMARY_PROMPT.format(
+            max_chars=self.max_chars,
+            summary=summary or "（无）",
+            turns="\n".join(f"用户：{user_msg}\n助手：{bot_msg}" for user_msg, bot_msg in turns)
+        )
+        response = await self.get_model().ainvoke([
+            SystemMessage(content="你是一个对话摘要助手。"),
+            HumanMessage(content=content)
+        ])
+        return response.content.strip()[:self.max_chars]
+
+
+_summarizer: Summarizer = LLMSummarizer()
+
+
+def get_summarizer() -> Summarizer:
+    return _summarizer
+
+
+def set_summarizer(summarizer: Summarizer):
+    """替换摘要生成器，之后的更新都使用新的实现"""
+    global _summarizer
+    _summarizer = summarizer
+
+
+class SummaryMetrics:
+    """摘要更新的次数、失败次数与耗时"""
+    def __init__(self):
+        self.updates = 0  # 成功写入的更新次数
+        self.failures = 0  # 生成或写入失败的次数
+        self.conflicts = 0  # 其他worker已先行更新而放弃写入的次数
+        self.summarized_turns = 0  # 并入摘要的对话轮数
+        self.latency = Histogram([0.5, 1, 2, 5, 10, 20, 30, 60])  # 单次更新耗时（秒）
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": SUMMARY_ENABLED,
+            "updates": self.updates,
+            "failures": self.failures,
+            "conflicts": self.conflicts,
+            "summarized_turns": self.summarized_turns,
+            "pending_sessions": len(_tasks),
+            "latency_s": self.latency.snapshot()
+        }
+
+summary_metrics = SummaryMetrics()
+
+# 正在更新摘要的会话及其任务；更新期间又有新回复的会话，在本次更新后再更新一次
+_tasks: Dict[Any, asyncio.Task] = {}
+_dirty: Set[Any] = set()
+
+
+async def load_summary(pool, session_id) -> Tuple[str, int]:
+    """
+    读取会话摘要
+    :return: (摘要, 已并入摘要的最后一条聊天记录ID)，没有摘要时为 ("", 0)
+    """
+    if not SUMMARY_ENABLED:
+        return "", 0
+    try:
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    "SELECT summary, last_record_id FROM robot_session_summaries WHERE session_id = %s",
+                    (session_id,)
+                )
+                result = await cur.fetchone()
+    except Exception as e:
+        logger.error(f"读取会话 {session_id} 的摘要失败，发送完整历史: {str(e)}")
+        return "", 0
+    if not result:
+        return "", 0
+    return result[0] or "", result[1] or 0
+
+
+async def update_summary(session_id, pool=None) -> int:
+    """
+    把摘要之后、最近 RECENT_TURNS 轮之前的原始对话并入摘要，积压较多时分批并入
+    :return: 本次并入的对话轮数
+    """
+    pool = pool or await get_pool()
+    folded = 0
+    while True:
+        summary, last_record_id = await load_summary(pool, session_id)
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    """
+                    SELECT record_id, user_message, bot_response
+                    FROM chat_records
+                    WHERE session_id = %s
+                    AND record_id > %s
+                    AND bot_response IS NOT NULL
+                    ORDER BY record_id ASC
+                    """,
+                    (session_id, last_record_id)
+                )
+                rows = await cur.fetchall()
+        # 最近的几轮保留原文发送，不并入摘要
+        rows = rows[:max(len(rows) - RECENT_TURNS, 0)][:SUMMARY_BATCH_TURNS]
+        if not rows:
+            return folded
+
+        started_at = time.monotonic()
+        new_summary = await asyncio.wait_for(
+            get_summarizer().summarize(summary, [(row[1] or "", row[2] or "") for row in rows]),
+            timeout=SUMMARY_TIMEOUT
+        )
+        if not new_summary:
+            raise ValueError("摘要生成结果为空")
+        new_last_record_id = rows[-1][0]
+
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                if last_record_id == 0:
+                    await cur.execute(
+                        """
+                        INSERT IGNORE INTO robot_session_summaries
+                            (session_id, summary, last_record_id, summarized_turns, updated_at)
+                        VALUES (%s, %s, %s, %s, NOW())
+                        """,
+                        (session_id, new_summary, new_last_record_id, len(rows))
+                    )
+                else:
+                    # 只在摘要未被其他worker更新过时写入
+                    await cur.execute(
+                        """
+                        UPDATE robot_session_summaries
+                        SET summary = %s, last_record_id = %s,
+                            summarized_turns = summarized_turns + %s, updated_at = NOW()
+                        WHERE session_id = %s AND last_record_id = %s
+                        """,
+                        (new_summary, new_last_record_id, len(rows), session_id, last_record_id)
+                    )
+                written = cur.rowcount > 0
+            await conn.commit()
+
+        summary_metrics.latency.observe(time.monotonic() - started_at)
+        if not written:
+            summary_metrics.conflicts += 1
+            logger.info(f"会话 {session_id} 的摘要已被其他worker更新，放弃本次结果")
+            return folded
+        summary_metrics.updates += 1
+        summary_metrics.summarized_turns += len(rows)
+        folded += len(rows)
+        logger.info(f"会话 {session_id} 的摘要已更新：并入 {len(rows)} 轮，截至记录 {new_last_record_id}")
+
+
+async def _run_updates(session_id):
+    try:
+        while True:
+            _dirty.discard(session_id)
+            try:
+                await update_summary(session_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                summary_metrics.failures += 1
+                logger.error(f"更新会话 {session_id} 的摘要失败: {str(e)}")
+            if session_id not in _dirty:
+                return
+    finally:
+        _tasks.pop(session_id, None)
+
+
+def schedule_summary_update(session_id):
+    """回复保存后调用：在后台更新会话摘要，同一会话同时只有一个更新任务"""
+    if not SUMMARY_ENABLED:
+        return
+    if session_id in _tasks:
+        _dirty.add(session_id)
+        return
+    _tasks[session_id] = asyncio.create_task(_run_updates(session_id))
+
+
+async def close():
+    """取消尚未完成的摘要更新，下次回复后会重新更新"""
+    tasks = list(_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def get_summary_stats() -> Dict[str, Any]:
+    """摘要更新的统计"""
+    return summary_metrics.snapshot()
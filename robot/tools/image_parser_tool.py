@@ -9,10 +9,14 @@ ROOT_DIR = Path(__file__).resolve().parent.parent
 if str(ROOT_DIR) not in sys.path:
     sys.path.append(str(ROOT_DIR))
 
-from ImageModel.food_predict import FoodPredictor
+from .resources import register_resource
 
-# 初始化食物预测器
-predictor = FoodPredictor(checkpoint_path=os.path.join(ROOT_DIR, 'ImageModel', 'checkpoint-3125'))
+def _load_predictor():
+    """初始化食物预测器，ViT模型在首次使用或预热时才加载"""
+    from ImageModel.food_predict import FoodPredictor
+    return FoodPredictor(checkpoint_path=os.path.join(ROOT_DIR, 'ImageModel', 'checkpoint-3125'))
+
+predictor_resource = register_resource("food_predictor", _load_predictor)
 
 @tool
 def image_parser(base_path: str):
@@ -51,7 +55,7 @@ def analyze_image(img_path: str):
     """使用本地ViT模型分析图片内容"""
     try:
         # 获取预测结果（返回top-5的预测及其概率）
-        predictions = predictor.predict(img_path)
+        predictions = predictor_resource.get().predict(img_path)
         
         # 获取最高置信度的预测结果
         food_name, confidence = predictions[0]
@@ -10,26 +10,33 @@ if str(ROOT_DIR) not in sys.path:
     sys.path.append(str(ROOT_DIR))
 
 from knowledge_graph.graph_query import GraphQuery
+from .resources import register_resource, READY
+from .tool_cache import cacheable
 import logging
 
 logger = logging.getLogger(__name__)
 
-# 创建一个GraphQuery实例
-graph_query = GraphQuery()
-_is_initialized = False
+# 知识图谱查询结果的跨轮次缓存存活时间（秒），图谱数据离线构建，很少变化
+KG_CACHE_TTL = float(os.getenv("KG_CACHE_TTL", 21600))
 
-async def ensure_initialized():
+async def _connect_graph() -> GraphQuery:
+    """创建GraphQuery实例并初始化Neo4j连接"""
+    try:
+        graph_query = GraphQuery()
+        await graph_query.initialize()
+        logger.info("Neo4j connection initialized successfully")
+        return graph_query
+    except Exception as e:
+        logger.error(f"Failed to initialize Neo4j connection: {e}")
+        raise
+
+graph_resource = register_resource("neo4j", _connect_graph)
+
+async def ensure_initialized() -> GraphQuery:
     """确保Neo4j连接已初始化"""
-    global _is_initialized
-    if not _is_initialized:
-        try:
-            await graph_query.initialize()
-            _is_initialized = True
-            logger.info("Neo4j connection initialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize Neo4j connection: {e}")
-            raise
+    return await graph_resource.aget()
 
+@cacheable(ttl=KG_CACHE_TTL)
 @tool
 async def query_food_relations(food_name: str) -> str:
     """查询食材的相生相克关系。
@@ -43,7 +50,7 @@ async def query_food_relations(food_name: str) -> str:
             相配食材：A, B, C
             相克食材：X, Y, Z
     """
-    await ensure_initialized()
+    graph_query = await ensure_initialized()
     compatible = await graph_query.get_compatible_foods(food_name)
     incompatible = await graph_query.get_incompatible_foods(food_name)
     
@@ -54,6 +61,7 @@ async def query_food_relations(food_name: str) -> str:
 相配食材：{', '.join(compatible_names)}
 相克食材：{', '.join(incompatible_names)}"""
 
+@cacheable(ttl=KG_CACHE_TTL)
 @tool
 async def query_seasonal_foods(season: str) -> str:
     """查询特定季节的时令食材。
@@ -65,11 +73,12 @@ async def query_seasonal_foods(season: str) -> str:
         str: 返回该季节的时令食材列表，格式为：
             XX季时令食材：A, B, C, D...
     """
-    await ensure_initialized()
+    graph_query = await ensure_initialized()
     foods = await graph_query.get_seasonal_foods(season)
     food_names = [food['name'] for food in foods]
     return f"{season}时令食材：{', '.join(food_names)}"
 
+@cacheable(ttl=KG_CACHE_TTL)
 @tool
 async def query_therapeutic_foods(symptom: str) -> str:
     """查询对特定症状有帮助的食材。
@@ -84,7 +93,7 @@ async def query_therapeutic_foods(symptom: str) -> str:
             B（功效：YY，置信度：0.90）
             ...
     """
-    await ensure_initialized()
+    graph_query = await ensure_initialized()
     foods = await graph_query.get_therapeutic_foods(symptom)
     result = []
     for food in foods:
@@ -96,9 +105,9 @@ import atexit
 
 def cleanup():
     """清理Neo4j连接"""
-    if _is_initialized:
+    if graph_resource.state == READY:
         try:
-            asyncio.run(graph_query.cleanup())
+            asyncio.run(graph_resource.get().cleanup())
             logger.info("Neo4j connection cleaned up successfully")
         except Exception as e:
             logger.error(f"Error cleaning up Neo4j connection: {e}")
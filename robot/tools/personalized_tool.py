@@ -3,11 +3,15 @@ import json
 from datetime import datetime, timedelta
 from collections import Counter
 from typing import Dict, List, Any
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
 import aiomysql
 import os
 from dotenv import load_dotenv
 from .. import globals
+from ..database.memory import get_pool
+from .tool_cache import cacheable, config_user_id
+from ..retrieval import TTLCache
 
 
 
@@ -194,9 +198,52 @@ class PersonalizedTool:
             
         return suggestions
 
+# 个性化建议的跨轮次缓存存活时间（秒）
+PERSONALIZED_CACHE_TTL = float(os.getenv("PERSONALIZED_CACHE_TTL", 600))
+
+# 用户数据版本的缓存时间（秒）：这段时间内的重复调用不再查询数据库，
+# 档案或饮食记录的写入最多延迟这么久才反映到个性化建议中；为0时每次都查询
+USER_DATA_VERSION_TTL = float(os.getenv("PERSONALIZED_VERSION_TTL", 5))
+
+_user_data_versions = TTLCache(maxsize=1024, ttl=USER_DATA_VERSION_TTL)
+
+async def user_data_version(user_id) -> tuple:
+    """
+    用户档案与饮食记录的数据版本，用作个性化建议缓存键的一部分
+
+    档案更新会改变 updated_at，饮食记录的新增、删除、修改会改变记录数、最大ID或最大更新时间；
+    分析按天数统计，日期也计入版本。查询结果缓存 USER_DATA_VERSION_TTL 秒。
+    """
+    if USER_DATA_VERSION_TTL > 0:
+        version = _user_data_versions.get(int(user_id))
+        if version is not None:
+            return version
+    version = await _query_user_data_version(user_id)
+    if USER_DATA_VERSION_TTL > 0:
+        _user_data_versions.set(int(user_id), version)
+    return version
+
+async def _query_user_data_version(user_id) -> tuple:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("""
+                SELECT
+                    (SELECT updated_at FROM user_profiles WHERE user_id = %s),
+                    COUNT(*),
+                    MAX(id),
+                    MAX(updated_at)
+                FROM dietary_records
+                WHERE user_id = %s
+            """, (int(user_id), int(user_id)))
+            row = await cur.fetchone()
+    return (datetime.now().date().isoformat(), *(str(value) for value in row))
+
+@cacheable(ttl=PERSONALIZED_CACHE_TTL, data_version=user_data_version, per_user=True)
 @tool
 async def generate_personalized_advice(
-    time_frame: int = 30
+    time_frame: int = 30,
+    config: RunnableConfig = None
 ) -> Dict[str, Any]:
     """
     生成个性化饮食建议的工具函数
@@ -208,8 +255,10 @@ async def generate_personalized_advice(
         Dict[str, Any]: 包含个性化建议的字典
     """
     try:
-        # 使用全局变量获取用户ID
-        user_id = globals.current_user_id
+        # 用户ID取自本轮对话的配置（与结果缓存的键一致），没有时使用全局变量
+        user_id = config_user_id(config)
+        if user_id is None:
+            user_id = globals.current_user_id
         # 从数据库获取用户档案和饮食记录
         print(f"当前用户ID: {user_id}")  # 添加调试信息
         user_profile = await get_user_profile(user_id)
@@ -1,11 +1,10 @@
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
-from typing import List, Dict, Any, Optional, Union
+from langchain_core.embeddings import Embeddings
+from typing import List, Dict, Any, Optional, Union, Tuple, Iterator
 import sys
 import os
 import pandas as pd
-from langchain_community.embeddings.huggingface import HuggingFaceEmbeddings
-import torch
 import logging
 from operator import itemgetter
 import asyncio
@@ -25,7 +24,17 @@ project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..
 sys.path.append(project_root)
 
 from robot.llms import model
-from langchain_core.vectorstores import InMemoryVectorStore
+from robot.retrieval import (
+    compute_snapshot_key, compute_config_id, save_snapshot, load_snapshot, MatrixVectorStore, normalize_rows,
+    TTLCache, CachedQueryEmbeddings, canonical_query, NutrientTable, parse_range_conditions,
+    AllergenIndex, CorpusIndex, IntentClassifier, QueryIntent, BM25Index, IVFFlatIndex, QuantizedMatrix, STORAGE_TYPES,
+    BatchingEmbeddings, OnnxEmbeddings,
+    FOOD_TEMPLATE, render_row, iter_document_batches, latest_snapshot,
+    embed_incrementally
+)
+from robot.tools.resources import register_resource, READY
+from robot.tools.tool_cache import cacheable
+import numpy as np
 from langchain_community.document_loaders import UnstructuredMarkdownLoader, CSVLoader
 from langchain_core.tools import tool
 
@@ -33,6 +42,57 @@ from langchain_core.tools import tool
 MODEL_NAME = "shibing624/text2vec-base-chinese"
 MODEL_CACHE_DIR = os.path.join(os.path.dirname(__file__), "..", "EmbeddingModel")
 
+# 嵌入后端：torch（HuggingFaceEmbeddings）、onnx（ONNX Runtime，需先导出模型）
+# 或 fake（确定性的哈希向量，无需模型，仅用于离线基准测试）
+EMBEDDING_BACKEND = os.getenv("RAG_EMBEDDING_BACKEND", "torch").lower()
+ONNX_MODEL_DIR = os.getenv("RAG_ONNX_MODEL_DIR", os.path.join(MODEL_CACHE_DIR, "onnx"))
+ONNX_QUANTIZED = os.getenv("RAG_ONNX_QUANTIZED", "false").lower() == "true"
+
+# 定义索引快照相关常量
+INDEX_DIR = os.getenv("RAG_INDEX_DIR", os.path.join(os.path.dirname(__file__), "..", "EmbeddingIndex"))
+# 是否启用BM25与向量的混合检索
+HYBRID_SEARCH = os.getenv("RAG_HYBRID_SEARCH", "true").lower() != "false"
+# 混合检索时每一路参与融合的候选数量以及RRF平滑常数
+HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", 50))
+RRF_K = int(os.getenv("RAG_RRF_K", 60))
+# 近似最近邻索引：flat（精确检索）或 ivf（IVF-Flat）。分块数不少于 RAG_ANN_MIN_ROWS 时才构建，
+# 聚类数为0时取约 sqrt(分块数)；每次查询扫描的聚类数越多召回越高、延迟越高
+ANN_INDEX = os.getenv("RAG_ANN_INDEX", "flat").lower()
+ANN_MIN_ROWS = int(os.getenv("RAG_ANN_MIN_ROWS", 20000))
+ANN_LISTS = int(os.getenv("RAG_ANN_LISTS", 0))
+ANN_PROBES = int(os.getenv("RAG_ANN_PROBES", 16))
+# 向量的存储类型：float32、float16 或 int8（标量量化）。压缩存储时打分为近似值，
+# 先取 k * RAG_RESCORE_FACTOR 个候选再用float32向量精确重排，为0时不重排
+VECTOR_STORAGE = os.getenv("RAG_VECTOR_STORAGE", "float32").lower()
+RESCORE_FACTOR = int(os.getenv("RAG_RESCORE_FACTOR", 4))
+# 向量/混合检索取出的候选数量，经过滤排序后保留前5个
+RETRIEVE_CANDIDATES = int(os.getenv("RAG_RETRIEVE_CANDIDATES", 15))
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+# 构建索引时每次读取的CSV行数，同时也是一批送入嵌入模型的文档数
+INGEST_CHUNK_SIZE = int(os.getenv("RAG_INGEST_CHUNK_SIZE", 5000))
+
+# 查询向量缓存，所有通过共享嵌入模型的 embed_query 调用共用
+query_embedding_cache = TTLCache(
+    maxsize=int(os.getenv("RAG_QUERY_CACHE_SIZE", 1024)),
+    ttl=float(os.getenv("RAG_QUERY_CACHE_TTL", 3600))
+)
+
+# retrieve 的结果缓存，键为 (规范化查询, 过敏原位掩码, 索引版本)
+retrieve_result_cache = TTLCache(
+    maxsize=int(os.getenv("RAG_RESULT_CACHE_SIZE", 2048)),
+    ttl=float(os.getenv("RAG_RESULT_CACHE_TTL", 600))
+)
+
+# retrieve 工具结果的跨轮次缓存存活时间（秒），索引版本变化后旧结果不再命中
+TOOL_CACHE_TTL = float(os.getenv("RAG_TOOL_CACHE_TTL", 3600))
+
+# 查询嵌入的跨请求批量合并：时间窗口（毫秒）与单批最大查询数
+EMBED_BATCHING = os.getenv("RAG_EMBED_BATCHING", "true").lower() != "false"
+EMBED_BATCH_WINDOW_MS = float(os.getenv("RAG_EMBED_BATCH_WINDOW_MS", 5))
+EMBED_MAX_BATCH_SIZE = int(os.getenv("RAG_EMBED_MAX_BATCH_SIZE", 32))
+embedding_batcher: Optional[BatchingEmbeddings] = None
+
 def ensure_model_downloaded(use_local_model: bool = False):  # 默认使用网上模型
     """
     确保模型已下载到本地
@@ -69,17 +129,94 @@ def ensure_model_downloaded(use_local_model: bool = False):  # 默认使用网
         logger.error(f"下载模型时出错: {str(e)}")
         raise
 
-# 初始化嵌入模型
-try:
+def _load_torch_embeddings() -> Embeddings:
+    """PyTorch后端，torch在此处才导入，避免拖慢模块导入"""
+    import torch
+    from langchain_community.embeddings.huggingface import HuggingFaceEmbeddings
+    
     model_path = ensure_model_downloaded(use_local_model=False)
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
     embeddings = HuggingFaceEmbeddings(
         model_name=model_path,
-        model_kwargs={'device': 'cuda' if torch.cuda.is_available() else 'cpu'}
+        model_kwargs={'device': device}
     )
-    logger.info(f"成功加载模型，使用设备: {'cuda' if torch.cuda.is_available() else 'cpu'}")
-except Exception as e:
-    logger.error(f"加载模型失败: {str(e)}")
-    raise
+    logger.info(f"成功加载模型，使用设备: {device}")
+    return embeddings
+
+def _load_onnx_embeddings() -> Embeddings:
+    """ONNX Runtime CPU后端，可选int8量化模型"""
+    return OnnxEmbeddings(ONNX_MODEL_DIR, quantized=ONNX_QUANTIZED)
+
+def _load_fake_embeddings() -> Embeddings:
+    """确定性的假嵌入（同一文本总得到同一向量），检索质量主要由BM25决定，用于无模型环境下的基准测试"""
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    return DeterministicFakeEmbedding(size=768)
+
+# 可选的嵌入后端，键为 RAG_EMBEDDING_BACKEND 的取值
+EMBEDDING_BACKENDS = {
+    'torch': _load_torch_embeddings,
+    'onnx': _load_onnx_embeddings,
+    'fake': _load_fake_embeddings,
+}
+
+def get_embedding_model_id(backend: Optional[str] = None) -> str:
+    """
+    嵌入模型标识，参与计算索引快照的键
+    
+    不同后端（尤其是量化模型）得到的向量不完全相同，切换后端后需要重新嵌入语料，
+    以保证查询向量与索引向量来自同一个模型。
+    """
+    backend = backend or EMBEDDING_BACKEND
+    if backend == 'torch':
+        return MODEL_NAME
+    if backend == 'onnx':
+        return f"{MODEL_NAME}@onnx{'-int8' if ONNX_QUANTIZED else ''}"
+    return f"{MODEL_NAME}@{backend}"
+
+def load_embedding_backend(backend: Optional[str] = None) -> Embeddings:
+    """按名称加载嵌入后端（不带缓存与批量合并）"""
+    backend = backend or EMBEDDING_BACKEND
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"不支持的嵌入后端: {backend}，可选: {', '.join(EMBEDDING_BACKENDS)}")
+    return EMBEDDING_BACKENDS[backend]()
+
+def _load_embeddings():
+    """初始化配置的嵌入后端，并加上查询向量缓存与批量合并"""
+    try:
+        embeddings = load_embedding_backend()
+        logger.info(f"嵌入后端: {EMBEDDING_BACKEND}")
+        if EMBED_BATCHING:
+            # 缓存未命中的查询排队合并嵌入
+            global embedding_batcher
+            embedding_batcher = BatchingEmbeddings(embeddings, EMBED_BATCH_WINDOW_MS, EMBED_MAX_BATCH_SIZE)
+            embeddings = embedding_batcher
+        return CachedQueryEmbeddings(embeddings, query_embedding_cache)
+    except Exception as e:
+        logger.error(f"加载模型失败: {str(e)}")
+        raise
+
+embeddings_resource = register_resource("embeddings", _load_embeddings)
+
+def get_embeddings() -> CachedQueryEmbeddings:
+    """获取共享的嵌入模型（带查询向量缓存），首次调用时加载"""
+    return embeddings_resource.get()
+
+def get_query_cache_stats() -> Dict[str, Any]:
+    """获取查询向量缓存的命中统计"""
+    return query_embedding_cache.stats()
+
+def get_result_cache_stats() -> Dict[str, Any]:
+    """获取 retrieve 结果缓存的命中统计"""
+    return retrieve_result_cache.stats()
+
+def get_embedding_batch_stats() -> Dict[str, Any]:
+    """获取查询嵌入批量合并的直方图统计，未启用或模型尚未加载时返回空字典"""
+    return embedding_batcher.stats() if embedding_batcher is not None else {}
+
+async def close_embedding_batcher():
+    """停止查询嵌入的批量合并任务"""
+    if embedding_batcher is not None:
+        await embedding_batcher.aclose()
 
 # 定义营养素关键词映射
 nutrient_keywords = {
@@ -130,164 +267,70 @@ tcm_keywords = {
     '安神': ['酸枣仁', '百合', '莲子', '龙眼肉']
 }
 
-def clean_numeric_value(value: Any) -> float:
-    """清理数值数据，处理特殊字符"""
-    if pd.isna(value):
-        return 0.0
-    
-    if isinstance(value, (int, float)):
-        return float(value)
-        
-    value = str(value).strip()
-    if value in ['—', '…', 'Tr', '', '-']:
-        return 0.0
-        
-    try:
-        return float(value)
-    except ValueError:
-        logger.warning(f"无法转换为数值: {value}")
-        return 0.0
-
-def process_food_data(row: pd.Series) -> Optional[Dict[str, Any]]:
-    """处理食物成分数据"""
-    try:
-        if pd.isna(row['食物名称']):
-            logger.warning("跳过缺失食物名称的数据")
-            return None
-            
-        return {
-            '食物名称': str(row['食物名称']),
-            '能量(kcal)': clean_numeric_value(row['能量(kcal)']),
-            '蛋白质(g)': clean_numeric_value(row['蛋白质(g)']),
-            '脂肪(g)': clean_numeric_value(row['脂肪(g)']),
-            '碳水化合物(g)': clean_numeric_value(row['碳水化合物(g)']),
-            '膳食纤维(g)': clean_numeric_value(row.get('膳食纤维(g)', 0.0)),
-            '食物类别': str(row.get('大类名称', '未分类')),
-            '子类名称': str(row.get('子类名称', '未分类')),
-            '数据类型': '食物成分'
-        }
-    except Exception as e:
-        logger.error(f"处理食物成分数据时出错: {str(e)}")
-        return None
-
-def process_recipe_data(row: pd.Series) -> Optional[Dict[str, Any]]:
-    """处理食谱数据"""
-    try:
-        if pd.isna(row['菜名']):
-            logger.warning("跳过缺失菜名的数据")
-            return None
-            
-        return {
-            '菜名': str(row['菜名']),
-            '烹饪方法': str(row.get('烹饪方法', '未知')),
-            '口味': str(row.get('口味', '未知')),
-            '难度等级': str(row.get('难度等级', '未知')),
-            '预估成本': str(row.get('预估成本', '未知')),
-            '烹饪时长': str(row.get('烹饪时长', '未知')),
-            '主料': str(row.get('主料', '')),
-            '辅料': str(row.get('辅料', '')),
-            '调料': str(row.get('调料', '')),
-            '步骤': str(row.get('步骤', '')),
-            '功效': str(row.get('功效', '')),
-            '注意事项': str(row.get('注意事项', '')),
-            '数据类型': '食谱'
-        }
-    except Exception as e:
-        logger.error(f"处理食谱数据时出错: {str(e)}")
-        return None
+def build_food_content(data: Dict[str, Any]) -> str:
+    """生成食物成分文档的文本内容"""
+    return render_row(FOOD_TEMPLATE, data)
 
 @lru_cache(maxsize=2)
 def load_documents(file_path: str, data_type: str = 'food') -> List[Document]:
     """加载并处理文档，使用缓存避免重复加载"""
     try:
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"找不到文件: {file_path}")
-            
-        if not file_path.endswith('.csv'):
-            raise ValueError(f"不支持的文件类型: {file_path}")
-            
-        df = pd.read_csv(file_path)
-        documents = []
-    
-        if data_type == 'food':
-            for _, row in df.iterrows():
-                data = process_food_data(row)
-                if data is None:
-                    continue
-                
-                content = (
-                    f"食物：{data['食物名称']}\n"
-                    f"类别：{data['食物类别']} - {data['子类名称']}\n"
-                    f"营养成分：\n"
-                    f"- 能量：{data['能量(kcal)']}千卡\n"
-                    f"- 蛋白质：{data['蛋白质(g)']}克\n"
-                    f"- 脂肪：{data['脂肪(g)']}克\n"
-                    f"- 碳水化合物：{data['碳水化合物(g)']}克\n"
-                    f"- 膳食纤维：{data['膳食纤维(g)']}克"
-                )
-                documents.append(Document(page_content=content, metadata=data))
-        
-        elif data_type == 'recipe':
-            for _, row in df.iterrows():
-                data = process_recipe_data(row)
-                if data is None:
-                    continue
-                
-                content = (
-                    f"菜品：{data['菜名']}\n"
-                    f"烹饪信息：\n"
-                    f"- 烹饪方法：{data['烹饪方法']}\n"
-                    f"- 口味：{data['口味']}\n"
-                    f"- 难度等级{data['难度等级']}\n"
-                    f"- 预估成本：{data['预估成本']}\n"
-                    f"- 烹饪时长{data['烹饪时长']}\n"
-                    f"食材配料：\n"
-                    f"- 主料：{data['主料']}\n"
-                    f"- 辅料：{data['辅料']}\n"
-                    f"- 调料：{data['调料']}\n"
-                    f"功效与注意事项：\n"
-                    f"- 功效：{data['功效']}\n"
-                    f"- 注意事项：{data['注意事项']}"
-                )
-                documents.append(Document(page_content=content, metadata=data))
-        
-        logger.info(f"成功加载 {len(documents)} 条{data_type}数据")
-        return documents
+        return [doc for batch in iter_document_batches(file_path, data_type, INGEST_CHUNK_SIZE) for doc in batch]
     except Exception as e:
         logger.error(f"加载文档时出错: {str(e)}")
         raise
 
-def filter_and_sort_results(docs: List[Document], query: str) -> List[Document]:
-    """根据查询类型过滤和排序结果"""
+# 标题判定用的营养素与食谱提及词
+nutrient_mention_words = ['蛋白质', '脂肪', '能量', '碳水', '纤维', '铁质', '钙质', '维生素']
+recipe_mention_words = ['简单', '快速', '家常', '养胃', '安神', '补血', '降火', '开胃']
+
+# 出现这些词时视为食谱类查询，走向量检索
+RECIPE_QUERY_WORDS = ['食谱', '菜谱', '菜', '做法', '汤', '粥', '餐']
+
+# 将各关键词表编译为一个多模式匹配自动机，一次扫描得到全部意图
+intent_classifier = IntentClassifier(
+    nutrient_keywords,
+    recipe_keywords,
+    tcm_keywords,
+    nutrient_mentions=nutrient_mention_words,
+    recipe_mentions=recipe_mention_words,
+    recipe_query_words=RECIPE_QUERY_WORDS
+)
+
+def filter_and_sort_results(docs: List[Document], query: str, intent: Optional[QueryIntent] = None) -> List[Document]:
+    """根据查询意图过滤和排序结果"""
     try:
         # 检查文档类型
         if not docs:
             return []
+        
+        if intent is None:
+            intent = intent_classifier.classify(query)
             
         if '数据类型' in docs[0].metadata:
             data_type = docs[0].metadata['数据类型']
             
             if data_type == '食物成分':
-                # 查找匹配的营养素关键词
-                for keyword, (field, reverse) in nutrient_keywords.items():
-                    if keyword in query:
-                        return sorted(docs, key=lambda x: x.metadata.get(field, 0), reverse=reverse)
+                # 按营养素范围过滤并排序
+                sort_spec = intent.sort_spec()
+                if sort_spec:
+                    field, reverse = sort_spec
+                    docs = [doc for doc in docs if _meets_conditions(doc.metadata, intent.conditions)]
+                    return sorted(docs, key=lambda x: x.metadata.get(field, 0), reverse=reverse)
                 
                 # 检查中医功效关键词
-                for effect, foods in tcm_keywords.items():
-                    if effect in query:
-                        return [doc for doc in docs if any(food in doc.metadata['食物名称'] for food in foods)]
+                if intent.tcm_foods:
+                    return [doc for doc in docs if any(food in doc.metadata['食物名称'] for food in intent.tcm_foods)]
             
             elif data_type == '食谱':
-                # 查找匹配的食谱关键词
-                for keyword, (field, values) in recipe_keywords.items():
-                    if keyword in query:
-                        return [doc for doc in docs if any(value in str(doc.metadata.get(field, '')) for value in values)]
+                # 按食谱关键词过滤
+                if intent.recipe_filter:
+                    field, values = intent.recipe_filter
+                    return [doc for doc in docs if any(value in str(doc.metadata.get(field, '')) for value in values)]
                 
                 # 检查食材关键词
-                for effect, foods in tcm_keywords.items():
-                    if effect in query:
-                        return [doc for doc in docs if any(food in doc.metadata.get('主料', '') or food in doc.metadata.get('辅料', '') for food in foods)]
+                if intent.tcm_foods:
+                    return [doc for doc in docs if any(food in doc.metadata.get('主料', '') or food in doc.metadata.get('辅料', '') for food in intent.tcm_foods)]
         
         # 如果没有特定的排序要求，返回原始顺序
         return docs
@@ -295,31 +338,350 @@ def filter_and_sort_results(docs: List[Document], query: str) -> List[Document]:
         logger.error(f"过滤和排序结果时出错: {str(e)}")
         return docs
 
+def _meets_conditions(metadata: Dict[str, Any], conditions: List[Tuple[str, str, float]]) -> bool:
+    """检查文档是否满足全部营养素范围条件"""
+    for field, op, value in conditions:
+        actual = metadata.get(field, 0)
+        if op == '>' and not actual > value:
+            return False
+        if op == '>=' and not actual >= value:
+            return False
+        if op == '<' and not actual < value:
+            return False
+        if op == '<=' and not actual <= value:
+            return False
+    return True
+
 # 加载食物成分数据
 food_file_path = os.path.join(project_root, "robot", "data", "中国食物成分数据表_CN.csv")
 recipe_file_path = os.path.join(project_root, "robot", "data", "中国食谱数据表.csv")
 # 加载过敏原数据
 allergens_file_path = os.path.join(project_root, "robot", "data", "allergens_data.json")
 
-try:
-    # 加载两类数据
-    food_docs = load_documents(food_file_path, 'food')
-    recipe_docs = load_documents(recipe_file_path, 'recipe')
+def get_splitter_settings() -> Dict[str, Any]:
+    """获取文本分割参数，参与快照键的计算"""
+    return {
+        'splitter': 'RecursiveCharacterTextSplitter',
+        'chunk_size': CHUNK_SIZE,
+        'chunk_overlap': CHUNK_OVERLAP
+    }
+
+def get_vector_index_settings() -> Dict[str, Any]:
+    """
+    获取近似最近邻索引与向量存储类型的构建参数，参与快照键的计算
+    
+    取默认值（精确检索、float32存储）的参数不写入，不改变已有快照的键。
+    """
+    if ANN_INDEX not in ('flat', 'ivf'):
+        raise ValueError(f"不支持的近似索引类型: {ANN_INDEX}，可选: flat, ivf")
+    if VECTOR_STORAGE not in STORAGE_TYPES:
+        raise ValueError(f"不支持的向量存储类型: {VECTOR_STORAGE}，可选: {', '.join(STORAGE_TYPES)}")
+    settings = {}
+    if ANN_INDEX != 'flat':
+        settings.update({'ann_index': ANN_INDEX, 'ann_min_rows': ANN_MIN_ROWS, 'ann_lists': ANN_LISTS})
+    if VECTOR_STORAGE != 'float32':
+        settings['vector_storage'] = VECTOR_STORAGE
+    return settings
+
+def get_snapshot_key() -> str:
+    """根据CSV及过敏原数据内容、模型名称、分割参数和近似索引参数计算当前索引快照的键"""
+    return compute_snapshot_key(
+        [food_file_path, recipe_file_path, allergens_file_path],
+        get_embedding_model_id(),
+        {**get_splitter_settings(), **get_vector_index_settings()}
+    )
+
+def get_snapshot_config_id() -> str:
+    """当前嵌入模型与构建参数的标识，只清理同一配置下的旧快照"""
+    return compute_config_id(
+        get_embedding_model_id(),
+        {**get_splitter_settings(), **get_vector_index_settings()}
+    )
+
+def get_text_splitter() -> RecursiveCharacterTextSplitter:
+    """按当前分割参数创建文本分割器"""
+    return RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+def iter_source_batches() -> Iterator[List[Document]]:
+    """逐块读取两类数据，每次产出一个CSV分块对应的（未分割的）文档"""
+    for file_path, data_type in ((food_file_path, 'food'), (recipe_file_path, 'recipe')):
+        yield from iter_document_batches(file_path, data_type, INGEST_CHUNK_SIZE)
+
+def iter_split_batches() -> Iterator[List[Document]]:
+    """逐块读取两类数据并进行文本分割，每次产出一个CSV分块对应的分块文档"""
+    text_splitter = get_text_splitter()
+    for documents in iter_source_batches():
+        yield text_splitter.split_documents(documents)
+
+def split_corpus() -> List[Document]:
+    """加载两类数据并进行文本分割"""
+    return [doc for batch in iter_split_batches() for doc in batch]
+
+def _load_reusable_snapshot() -> Optional[Tuple[List[Document], np.ndarray, Dict[int, Tuple[int, int]]]]:
+    """
+    加载最近一个可复用的快照，用于增量构建
     
-    # 合并所有文档
-    all_docs = food_docs + recipe_docs
+    只有嵌入模型和分割参数都相同、且记录了行哈希的快照才能复用。
     
-    # 文本分割
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    all_splits = text_splitter.split_documents(all_docs)
+    Returns:
+        (splits, vectors, rows) - rows 为行哈希到该行分块区间 [start, end) 的映射；没有可复用快照时返回None
+    """
+    latest = latest_snapshot(INDEX_DIR)
+    if latest is None:
+        return None
+    key, meta = latest
+    if meta.get('model_name') != get_embedding_model_id() \
+            or any(meta.get(name) != value for name, value in get_splitter_settings().items()):
+        logger.info(f"最近的索引快照 {key[:12]} 使用了不同的嵌入模型或分割参数，无法增量构建")
+        return None
+    snapshot = load_snapshot(INDEX_DIR, key)
+    if snapshot is None or 'row_hashes' not in snapshot[2] or 'row_ids' not in snapshot[2]:
+        return None
     
-    # 创建向量存储
-    vector_store = InMemoryVectorStore(embeddings)
-    vector_store.add_documents(documents=all_splits)
-    logger.info("成功初始化向量存储")
-except Exception as e:
-    logger.error(f"初始化向量存储时出错: {str(e)}")
-    raise
+    splits, vectors, arrays = snapshot
+    row_hashes, row_ids = arrays['row_hashes'], arrays['row_ids']
+    # 同一行分割出的分块在快照中连续存放
+    starts = np.flatnonzero(np.diff(row_ids, prepend=-1))
+    ends = np.append(starts[1:], len(row_ids))
+    rows = {}
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        rows.setdefault(int(row_hashes[start]), (start, end))
+    logger.info(f"以索引快照 {key[:12]} 为基础增量构建（{len(rows)} 行）")
+    return splits, vectors, rows
+
+def build_index(force: bool = False):
+    """
+    加载或构建索引快照
+    
+    当前数据对应的快照不存在时增量构建：每行按内容哈希与最近的快照比对，
+    未变化的行直接复用旧向量，只嵌入新增或修改的行，已删除的行不再写入新快照。
+    
+    Args:
+        force (bool): 是否忽略已有快照强制重新嵌入全部分块
+    
+    Returns:
+        (key, splits, vectors, arrays) - 快照键、分块文档、L2归一化后的向量矩阵，以及快照中的附加数组
+        （过敏原位掩码、行哈希、BM25倒排索引，启用时还有IVF近似索引和压缩向量），数组均为内存映射
+    """
+    key = get_snapshot_key()
+    if not force:
+        snapshot = load_snapshot(INDEX_DIR, key)
+        if snapshot is not None:
+            return (key, *snapshot)
+        logger.info("未找到匹配的索引快照，开始构建")
+    
+    previous = None if force else _load_reusable_snapshot()
+    previous_splits, previous_vectors, previous_rows = previous or ([], None, {})
+    text_splitter = get_text_splitter()
+    
+    # 边读取边嵌入，每批只有一个CSV分块的原始数据驻留内存；全部行都复用时不加载嵌入模型
+    build = embed_incrementally(
+        iter_source_batches(), text_splitter.split_documents, lambda texts: get_embeddings().embed_documents(texts),
+        previous_splits, previous_vectors, previous_rows
+    )
+    splits, vectors, row_hashes, row_ids = build.splits, build.vectors, build.row_hashes, build.row_ids
+    logger.info(
+        f"索引构建完成：复用 {build.reused_rows} 行，新嵌入 {build.embedded_rows} 行，删除 {build.deleted_rows} 行"
+    )
+    allergen_masks = allergen_index.compute_masks(splits)
+    lexical_index = BM25Index.build(doc.page_content for doc in splits)
+    extra_arrays = lexical_index.to_arrays()
+    if ANN_INDEX == 'ivf' and len(splits) >= ANN_MIN_ROWS:
+        # 近似索引自带按聚类排列的向量（按存储类型压缩），检索时不再使用平铺的压缩向量
+        ann_index = IVFFlatIndex.build(vectors, n_lists=ANN_LISTS or None, n_probe=ANN_PROBES, storage=VECTOR_STORAGE)
+        extra_arrays.update(ann_index.to_arrays())
+    elif VECTOR_STORAGE != 'float32':
+        extra_arrays.update(QuantizedMatrix.encode(vectors, VECTOR_STORAGE).to_arrays())
+    arrays = {
+        'allergen_masks': allergen_masks,
+        'row_hashes': np.array(row_hashes, dtype=np.uint64),
+        'row_ids': np.array(row_ids, dtype=np.int64)
+    }
+    save_snapshot(INDEX_DIR, key, splits, vectors, extra_meta={
+        'model_name': get_embedding_model_id(),
+        'normalized': True,
+        'allergens': list(allergen_index.bits),
+        **get_splitter_settings(),
+        **get_vector_index_settings()
+    }, arrays=arrays, extra_arrays=extra_arrays, config_id=get_snapshot_config_id())
+    # 重新加载以获得内存映射的数组，与其他进程共享页缓存
+    snapshot = load_snapshot(INDEX_DIR, key)
+    if snapshot is not None:
+        return (key, *snapshot)
+    return key, splits, vectors, {**arrays, **extra_arrays}
+
+def create_vector_store(
+    splits: List[Document],
+    vectors: np.ndarray,
+    arrays: Optional[Dict[str, np.ndarray]] = None
+) -> MatrixVectorStore:
+    """
+    使用快照中的向量创建矩阵向量存储，不再重复嵌入
+    
+    快照中有IVF近似索引或压缩向量时，按向量检索改由它们打分，并按 RAG_RESCORE_FACTOR 精确重排。
+    """
+    arrays = arrays or {}
+    ann_index = IVFFlatIndex.from_arrays(arrays, ANN_PROBES)
+    compressed = QuantizedMatrix.from_arrays(arrays) if ann_index is None else None
+    if ann_index is not None:
+        logger.info(f"使用IVF近似检索：{ann_index.n_lists} 个聚类，每次扫描 {ann_index.n_probe} 个")
+    if (ann_index is not None and ann_index.quantized) or compressed is not None:
+        storage = ann_index.list_vectors.storage if ann_index is not None else compressed.storage
+        logger.info(f"使用{storage}压缩向量打分，重排倍数: {RESCORE_FACTOR}")
+    return MatrixVectorStore(
+        get_embeddings(),
+        splits,
+        vectors,
+        normalized=True,
+        ann_index=ann_index,
+        compressed=compressed,
+        rescore_factor=RESCORE_FACTOR
+    )
+
+def _load_corpus_index() -> CorpusIndex:
+    """加载索引快照并创建语料索引"""
+    try:
+        key, all_splits, corpus_vectors, arrays = build_index()
+        
+        # 创建向量存储
+        vector_store = create_vector_store(all_splits, corpus_vectors, arrays)
+        logger.info("成功初始化向量存储")
+        return CorpusIndex(
+            key,
+            vector_store,
+            arrays['allergen_masks'],
+            lexical_index=BM25Index.from_arrays(arrays) if HYBRID_SEARCH else None,
+            candidates=HYBRID_CANDIDATES,
+            rrf_k=RRF_K
+        )
+    except Exception as e:
+        logger.error(f"初始化向量存储时出错: {str(e)}")
+        raise
+
+corpus_index_resource = register_resource("corpus_index", _load_corpus_index)
+
+def get_corpus_index() -> CorpusIndex:
+    """获取语料索引，首次调用时加载"""
+    return corpus_index_resource.get()
+
+def get_vector_store() -> MatrixVectorStore:
+    """获取向量存储，首次调用时加载"""
+    return get_corpus_index().vector_store
+
+nutrient_table_resource = register_resource(
+    "nutrient_table",
+    lambda: NutrientTable.from_csv(food_file_path, allergen_index=allergen_index)
+)
+
+def get_index_version() -> Optional[str]:
+    """当前服务中的索引版本（快照键），语料索引尚未加载时返回None"""
+    return get_corpus_index().key if corpus_index_resource.state == READY else None
+
+def get_corpus_files() -> List[str]:
+    """参与构建索引的数据文件"""
+    return [food_file_path, recipe_file_path, allergens_file_path]
+
+async def reload_corpus() -> Dict[str, Any]:
+    """
+    数据文件变化后重新加载语料索引和营养成分表
+    
+    索引增量构建完成后原子地替换，构建期间请求继续使用旧版本；
+    尚未加载的组件保持延迟加载，首次使用时自然读到新数据。
+    
+    Returns:
+        重新加载后的索引版本（快照键）
+    """
+    for resource in (corpus_index_resource, nutrient_table_resource):
+        if resource.state == READY:
+            await resource.areload()
+    # 索引版本已变化，旧版本的结果不会再被命中，这里直接释放
+    retrieve_result_cache.clear()
+    key = get_corpus_index().key if corpus_index_resource.state == READY else get_snapshot_key()
+    logger.info(f"语料索引已切换到版本 {key[:12]}")
+    return {"index_version": key}
+
+async def follow_snapshots(interval: float):
+    """
+    轮询快照目录，同一配置下出现新快照时切换过去
+
+    多worker部署时 /api/reindex 或文件监视只在一个worker中重建索引并写入新快照，
+    其他worker通过轮询发现它并重新加载（直接读取快照，不再嵌入），同时清空结果缓存。
+    """
+    config_id = get_snapshot_config_id()
+    seen = None
+    while True:
+        await asyncio.sleep(interval)
+        if corpus_index_resource.state != READY:
+            continue
+        try:
+            latest = await asyncio.to_thread(latest_snapshot, INDEX_DIR, config_id)
+        except Exception as e:
+            logger.warning(f"读取索引快照目录失败: {str(e)}")
+            continue
+        # 只在最新快照变化时处理一次，避免最新快照与当前数据不对应时反复重新加载
+        if latest is None or latest[0] == seen:
+            continue
+        seen = latest[0]
+        if seen == get_corpus_index().key:
+            continue
+        logger.info(f"发现新的索引快照 {seen[:12]}，重新加载语料索引")
+        try:
+            await reload_corpus()
+        except Exception as e:
+            logger.error(f"切换到新的索引快照失败，继续使用旧版本: {str(e)}")
+
+def _files_signature() -> Tuple[Tuple[int, int], ...]:
+    """数据文件的 (修改时间, 大小)，用于低成本地检测变化"""
+    signature = []
+    for path in get_corpus_files():
+        stat = os.stat(path)
+        signature.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+async def watch_corpus_files(interval: float):
+    """
+    轮询数据文件，变化后增量重建索引并切换
+    
+    检测到变化后再等待一个轮询周期，文件不再变化时才重建，避免读到写了一半的CSV。
+    """
+    signature = _files_signature()
+    changed = False
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            current = _files_signature()
+        except OSError as e:
+            logger.warning(f"读取数据文件状态失败: {str(e)}")
+            continue
+        if current != signature:
+            signature = current
+            changed = True
+            continue
+        if changed:
+            changed = False
+            logger.info("检测到语料数据变化，开始增量重建索引")
+            try:
+                await reload_corpus()
+            except Exception as e:
+                logger.error(f"增量重建索引失败，继续使用旧版本: {str(e)}")
+
+def match_nutrient_query(query: str, intent: Optional[QueryIntent] = None) -> Optional[Tuple[str, bool, List[Tuple[str, str, float]]]]:
+    """
+    判断查询能否直接由营养成分表回答
+    
+    Returns:
+        (排序字段, 是否降序, 范围条件)；食谱类查询或不是营养素排序/范围查询时返回None
+    """
+    if intent is None:
+        intent = intent_classifier.classify(query)
+    if intent.is_recipe_query:
+        return None
+    
+    sort_spec = intent.sort_spec()
+    if sort_spec is None:
+        return None
+    field, reverse = sort_spec
+    return field, reverse, intent.conditions
 
 # 加载过敏原数据
 try:
@@ -330,6 +692,74 @@ except Exception as e:
     logger.error(f"加载过敏原数据时出错: {str(e)}")
     raise
 
+# 过敏原多模式匹配索引，用于构建分块的过敏原位掩码
+allergen_index = AllergenIndex(allergens_data)
+
+def format_results(top_docs: List[Document], query_text: str, intent: Optional[QueryIntent] = None) -> str:
+    """格式化检索结果"""
+    if intent is None:
+        intent = intent_classifier.classify(query_text)
+    results = []
+
+    # 添加查询类型说明，与实际生效的过滤意图保持一致
+    results.append(intent.label(top_docs[0].metadata.get('数据类型')))
+
+    # 格式化每个文档的内容
+    for i, doc in enumerate(top_docs, 1):
+        results.append(f"\n{i}. {doc.page_content}")
+
+        # 添加额外的营养信息或功效说明
+        if doc.metadata.get('数据类型') == '食物成分':
+            results.append("\n   主要营养成分：")
+            for nutrient, (field, _) in nutrient_keywords.items():
+                if field in doc.metadata:
+                    value = doc.metadata[field]
+                    if isinstance(value, (int, float)) and value > 0:
+                        results.append(f"   - {nutrient}: {value}")
+        elif doc.metadata.get('数据类型') == '食谱':
+            if '功效' in doc.metadata and doc.metadata['功效']:
+                results.append(f"\n   功效：{doc.metadata['功效']}")
+            if '注意事项' in doc.metadata and doc.metadata['注意事项']:
+                results.append(f"\n   注意事项：{doc.metadata['注意事项']}")
+
+    return "\n".join(results)
+
+async def retrieve_documents(query_text: str, excluded_bits: int = 0, intent: Optional[QueryIntent] = None) -> List[Document]:
+    """
+    检索并返回最相关的5个文档（retrieve 工具的检索部分，不含格式化与结果缓存）
+    
+    Args:
+        query_text: 规范化后的查询文本
+        excluded_bits: 需要排除的过敏原位掩码
+        intent: 已识别的查询意图，为None时在此识别
+    """
+    if intent is None:
+        intent = intent_classifier.classify(query_text)
+    
+    nutrient_query = match_nutrient_query(query_text, intent)
+    if nutrient_query is not None:
+        # 营养素排序与范围查询直接在整张营养成分表上精确计算，无需嵌入
+        field, reverse, conditions = nutrient_query
+        nutrient_table = await nutrient_table_resource.aget()
+        records = nutrient_table.query(field, reverse, 5, conditions, excluded_bits)
+        return [Document(page_content=build_food_content(record), metadata=record) for record in records]
+    
+    # 混合检索相似文档（精确名称直接命中，否则融合BM25与向量结果，查询向量与其他
+    # 并发请求合并嵌入），含过敏原的分块在选取top-k之前即被排除
+    corpus_index = await corpus_index_resource.aget()
+    docs = await corpus_index.asearch(
+        query_text,
+        k=RETRIEVE_CANDIDATES,  # 检索更多文档以便后续筛选
+        exclude_bits=excluded_bits
+    )
+
+    # 根据查询类型过滤和排序结果
+    filtered_docs = filter_and_sort_results(docs, query_text, intent)
+    
+    # 只保留前5个最相关的结果
+    return filtered_docs[:5]
+
+@cacheable(ttl=TOOL_CACHE_TTL, data_version=get_index_version)
 @tool
 async def retrieve(query: Union[str, Dict[str, Any]], allergens: Optional[List[str]] = None) -> str:
     """
@@ -341,7 +771,8 @@ async def retrieve(query: Union[str, Dict[str, Any]], allergens: Optional[List[s
       
     检索流程：
     1. 过敏原反向检索（如果提供了allergens参数）：
-       - 首先根据用户提供的过敏原列表，排除所有包含这些过敏原的食物
+       - 首先根据用户提供的过敏原列表，排除所有包含这些过敏原的食物，
+         以及主料、辅料或调料中含有这些过敏原的食谱
        - 支持的过敏原类型：
          * milk（乳制品）
          * eggs（鸡蛋）
@@ -403,127 +834,91 @@ async def retrieve(query: Union[str, Dict[str, Any]], allergens: Optional[List[s
         else:
             query_text = str(query)
 
-        if not query_text.strip():
+        query_text = canonical_query(query_text)
+        if not query_text:
             return "抱歉，查询参数必须是非空字符串。"
 
-        # 反向检索：排除过敏原相关食物
-        excluded_food_names = []
-        if allergens:
-            for allergen in allergens:
-                if allergen in allergens_data['common_allergens']:
-                    excluded_food_names.extend(allergens_data['common_allergens'][allergen]['common_foods'])
-
-        # 检索相似文档
-        docs = await asyncio.to_thread(
-            vector_store.similarity_search,
-            query_text,
-            k=15  # 检索更多文档以便后续筛选
-        )
+        # 反向检索：排除含过敏原的食物和食谱
+        excluded_bits = allergen_index.bits_for(allergens)
 
-        # 过滤掉包含过敏原的食物
-        if excluded_food_names:
-            docs = [doc for doc in docs if doc.metadata.get('食物名称') not in excluded_food_names]
+        # 结果只取决于查询、过敏原和索引内容，命中时跳过嵌入、检索、过滤和格式化
+        cache_key = (query_text, excluded_bits, get_index_version())
+        cached = retrieve_result_cache.get(cache_key)
+        if cached is not None:
+            return cached
 
-        # 根据查询类型过滤和排序结果
-        filtered_docs = filter_and_sort_results(docs, query_text)
+        # 一次扫描得到查询意图，过滤、排序和标题共用
+        intent = intent_classifier.classify(query_text)
         
-        # 只保留前5个最相关的结果
-        top_docs = filtered_docs[:5]
+        top_docs = await retrieve_documents(query_text, excluded_bits, intent)
         
         if not top_docs:
-            return "抱歉，未找到相关的信息。"
-        
-        # 格式化输出结果
-        results = []
-        
-        # 添加查询类型说明
-        if any(keyword in query_text for keyword in ['蛋白质', '脂肪', '能量', '碳水', '纤维', '铁质', '钙质', '维生素']):
-            results.append("【营养成分检索结果】")
-        elif any(keyword in query_text for keyword in ['补气', '养血', '健脾', '养胃', '清热', '滋阴', '安神']):
-            results.append("【中医功效检索结果】")
-        elif any(keyword in query_text for keyword in ['简单', '快速', '家常', '养胃', '安神', '补血', '降火', '开胃']):
-            results.append("【食谱检索结果】")
+            result = "抱歉，未找到相关的信息。"
         else:
-            results.append("【综合检索结果】")
-        
-        # 格式化每个文档的内容
-        for i, doc in enumerate(top_docs, 1):
-            results.append(f"\n{i}. {doc.page_content}")
-            
-            # 添加额外的营养信息或功效说明
-            if doc.metadata.get('数据类型') == '食物成分':
-                results.append("\n   主要营养成分：")
-                for nutrient, (field, _) in nutrient_keywords.items():
-                    if field in doc.metadata:
-                        value = doc.metadata[field]
-                        if isinstance(value, (int, float)) and value > 0:
-                            results.append(f"   - {nutrient}: {value}")
-            elif doc.metadata.get('数据类型') == '食谱':
-                if '功效' in doc.metadata and doc.metadata['功效']:
-                    results.append(f"\n   功效：{doc.metadata['功效']}")
-                if '注意事项' in doc.metadata and doc.metadata['注意事项']:
-                    results.append(f"\n   注意事项：{doc.metadata['注意事项']}")
-        
-        return "\n".join(results)
+            result = format_results(top_docs, query_text, intent)
+        retrieve_result_cache.set(cache_key, result)
+        return result
     
     except Exception as e:
         logger.error(f"检索过程中出错: {str(e)}")
         return f"抱歉，检索过程中出现错误: {str(e)}"
 
-if __name__ == "__main__":
-    # 测试用例
-    test_cases = {
-        "食物营养查询": [
-            "高蛋白质的食物有哪些",
-            "低脂肪的食物推荐",
-            "富含维生素C的水果",
-            "高钙的食物",
-            "含铁丰富的食材"
-        ],
-        "食谱基础查询": [
-            "简单快速的家常菜",
-            "适合上班族的快手菜",
-            "新手也能做的菜谱",
-            "半小时能做好的菜",
-            "不用复杂调料的菜"
-        ],
-        "功效导向查询": [
-            "养胃的食谱",
-            "补气养血的食物",
-            "安神助眠的食材",
-            "清热降火的饮品",
-            "开胃促消化的菜"
-        ],
-        "场景化查询": [
-            "适合老年人的养生汤",
-            "孕妇补铁食谱",
-            "儿童补钙食谱",
-            "减肥期间的低卡餐",
-            "运动后补充能量的食物"
-        ],
-        "混合查询": [
-            "高蛋白低脂的减肥餐",
-            "补气养血的简单食谱",
-            "清淡易消化的养胃汤",
-            "快手营养的早餐",
-            "适合冬季的滋补汤"
-        ],
-        "新增列测试": [
-            "测试菜品",
-            "测试方法",
-            "测试口味",
-            "简单",
-            "短"
-        ],
-        "过敏原测试": [
-            {"query": "高蛋白的食物", "allergens": ["milk", "eggs"]},
-            {"query": "补气养血的食谱", "allergens": ["peanuts", "tree_nuts"]},
-            {"query": "适合儿童的早餐", "allergens": ["milk", "wheat"]},
-            {"query": "清淡易消化的食物", "allergens": ["soy", "fish"]},
-            {"query": "营养丰富的主食", "allergens": ["wheat", "eggs"]}
-        ]
-    }
+# 测试用例，也用于嵌入后端的一致性检查（robot/benchmark/bench_embedding_backends.py）
+TEST_CASES = {
+    "食物营养查询": [
+        "高蛋白质的食物有哪些",
+        "低脂肪的食物推荐",
+        "富含维生素C的水果",
+        "高钙的食物",
+        "含铁丰富的食材"
+    ],
+    "食谱基础查询": [
+        "简单快速的家常菜",
+        "适合上班族的快手菜",
+        "新手也能做的菜谱",
+        "半小时能做好的菜",
+        "不用复杂调料的菜"
+    ],
+    "功效导向查询": [
+        "养胃的食谱",
+        "补气养血的食物",
+        "安神助眠的食材",
+        "清热降火的饮品",
+        "开胃促消化的菜"
+    ],
+    "场景化查询": [
+        "适合老年人的养生汤",
+        "孕妇补铁食谱",
+        "儿童补钙食谱",
+        "减肥期间的低卡餐",
+        "运动后补充能量的食物"
+    ],
+    "混合查询": [
+        "高蛋白低脂的减肥餐",
+        "补气养血的简单食谱",
+        "清淡易消化的养胃汤",
+        "快手营养的早餐",
+        "适合冬季的滋补汤"
+    ],
+    "新增列测试": [
+        "测试菜品",
+        "测试方法",
+        "测试口味",
+        "简单",
+        "短"
+    ],
+    "过敏原测试": [
+        {"query": "高蛋白的食物", "allergens": ["milk", "eggs"]},
+        {"query": "补气养血的食谱", "allergens": ["peanuts", "tree_nuts"]},
+        {"query": "适合儿童的早餐", "allergens": ["milk", "wheat"]},
+        {"query": "清淡易消化的食物", "allergens": ["soy", "fish"]},
+        {"query": "营养丰富的主食", "allergens": ["wheat", "eggs"]}
+    ]
+}
 
+
+if __name__ == "__main__":
+    test_cases = TEST_CASES
     async def run_tests():
         try:
             print("开始测试RAG系统...\n")
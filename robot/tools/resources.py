@@ -0,0 +1,217 @@
+"""
+重量级资源的延迟加载与预热
+
+嵌入模型、向量存储、图片识别模型和Neo4j客户端不再在导入时创建，
+而是在首次使用或后台预热时加载；单个组件加载失败只影响依赖它的工具。
+"""
+import asyncio
+import inspect
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 组件状态
+PENDING = "pending"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+# 工具与其依赖组件的对应关系
+TOOL_COMPONENTS = {
+    "retrieve": ["embeddings", "corpus_index", "nutrient_table"],
+    "image_parser": ["food_predictor"],
+    "knowledge_graph": ["neo4j"],
+}
+
+# 就绪探针要求预热完成的工具
+REQUIRED_TOOLS = ["retrieve", "image_parser"]
+
+
+class LazyResource:
+    """首次使用时加载的资源，记录加载状态与耗时"""
+
+    def __init__(self, name: str, loader: Callable[[], Any]):
+        self.name = name
+        self._loader = loader
+        self._is_async = inspect.iscoroutinefunction(loader)
+        self._value = None
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._async_lock = None
+        self.state = PENDING
+        self.load_time: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def get(self) -> Any:
+        """同步获取资源，未加载时在当前线程加载"""
+        if self.state == READY:
+            return self._value
+        if self._is_async:
+            raise TypeError(f"资源 {self.name} 需要通过 aget() 异步加载")
+        with self._lock:
+            if self.state != READY:
+                self._load(self._loader)
+        return self._value
+
+    async def aget(self) -> Any:
+        """异步获取资源，同步加载器在线程池中执行，不阻塞事件循环"""
+        if self.state == READY:
+            return self._value
+        if not self._is_async:
+            return await asyncio.to_thread(self.get)
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        async with self._async_lock:
+            if self.state != READY:
+                self._begin()
+                try:
+                    value = await self._loader()
+                except Exception as e:
+                    self._fail(e)
+                    raise
+                self._finish(value)
+        return self._value
+
+    def reload(self) -> Any:
+        """
+        重新加载资源并原子地替换
+
+        加载期间旧值继续对外提供服务，已取得旧值的请求不受影响；
+        加载失败时保留旧值并抛出异常。尚未加载过的资源等同于 get()。
+        """
+        if self._is_async:
+            raise TypeError(f"资源 {self.name} 不支持重新加载")
+        if self.state != READY:
+            return self.get()
+        with self._reload_lock:
+            started_at = time.perf_counter()
+            logger.info(f"开始重新加载组件: {self.name}")
+            try:
+                value = self._loader()
+            except Exception as e:
+                logger.error(f"组件 {self.name} 重新加载失败，继续使用旧版本: {str(e)}")
+                raise
+            self._value = value
+            self.load_time = time.perf_counter() - started_at
+            logger.info(f"组件 {self.name} 重新加载完成，耗时 {self.load_time:.2f}s")
+        return value
+
+    async def areload(self) -> Any:
+        """异步重新加载，同步加载器在线程池中执行"""
+        if self._is_async:
+            raise TypeError(f"资源 {self.name} 不支持重新加载")
+        return await asyncio.to_thread(self.reload)
+
+    def _load(self, loader: Callable[[], Any]):
+        self._begin()
+        try:
+            value = loader()
+        except Exception as e:
+            self._fail(e)
+            raise
+        self._finish(value)
+
+    def _begin(self):
+        self.state = LOADING
+        self._started_at = time.perf_counter()
+        logger.info(f"开始加载组件: {self.name}")
+
+    def _finish(self, value: Any):
+        self._value = value
+        self.load_time = time.perf_counter() - self._started_at
+        self.error = None
+        self.state = READY
+        logger.info(f"组件 {self.name} 加载完成，耗时 {self.load_time:.2f}s")
+
+    def _fail(self, error: Exception):
+        self.load_time = time.perf_counter() - self._started_at
+        self.error = str(error)
+        self.state = FAILED
+        logger.error(f"组件 {self.name} 加载失败: {self.error}")
+
+    def status(self) -> Dict[str, Any]:
+        """返回组件状态"""
+        return {
+            "state": self.state,
+            "load_time": round(self.load_time, 3) if self.load_time is not None else None,
+            "error": self.error
+        }
+
+
+_resources: Dict[str, LazyResource] = {}
+
+
+def register_resource(name: str, loader: Callable[[], Any]) -> LazyResource:
+    """注册一个延迟加载的资源"""
+    resource = LazyResource(name, loader)
+    _resources[name] = resource
+    return resource
+
+
+def get_resource(name: str) -> LazyResource:
+    """按名称获取已注册的资源"""
+    return _resources[name]
+
+
+async def warm_up(names: Optional[Iterable[str]] = None):
+    """
+    预热资源
+
+    Args:
+        names: 需要预热的组件名称，默认预热全部已注册组件；
+            各组件并发加载，存在依赖的组件在加载器内部等待其依赖加载完成
+    """
+    targets: List[LazyResource] = [_resources[name] for name in (names or list(_resources))]
+    logger.info(f"开始预热组件: {[r.name for r in targets]}")
+    results = await asyncio.gather(*(r.aget() for r in targets), return_exceptions=True)
+    failed = [r.name for r, result in zip(targets, results) if isinstance(result, Exception)]
+    if failed:
+        logger.warning(f"以下组件预热失败，将在首次使用时重试: {failed}")
+    else:
+        logger.info("全部组件预热完成")
+
+
+def preload(names: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    在当前线程同步加载资源，供主进程在fork出worker之前加载只读资源
+
+    异步加载器创建的资源（如Neo4j连接）绑定在创建它的事件循环上，不能跨进程共享，
+    跳过，由各worker自行加载；加载失败的组件同样留给worker在首次使用时重试。
+
+    Args:
+        names: 需要加载的组件名称，默认全部已注册组件；未注册的名称被忽略
+
+    Returns:
+        成功加载的组件名称
+    """
+    loaded = []
+    for name in (names or list(_resources)):
+        resource = _resources.get(name)
+        if resource is None or resource._is_async:
+            continue
+        try:
+            resource.get()
+            loaded.append(name)
+        except Exception as e:
+            logger.warning(f"组件 {name} 预加载失败，将由worker在首次使用时加载: {str(e)}")
+    return loaded
+
+
+def readiness() -> Dict[str, Any]:
+    """汇总各组件及工具的就绪状态"""
+    components = {name: r.status() for name, r in _resources.items()}
+    tools = {
+        tool_name: all(
+            name in _resources and _resources[name].state == READY
+            for name in component_names
+        )
+        for tool_name, component_names in TOOL_COMPONENTS.items()
+    }
+    return {
+        "ready": all(tools[name] for name in REQUIRED_TOOLS),
+        "tools": tools,
+        "components": components
+    }
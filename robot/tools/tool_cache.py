@@ -0,0 +1,166 @@
+"""
+跨轮次的工具结果缓存
+
+时令食材、食材关系、功效食材和检索等工具对相同参数在数小时内返回相同结果。工具用
+cacheable 声明可缓存、存活时间以及数据版本，执行路径通过 ainvoke_cached 调用工具，
+缓存键为 (工具名, 规范化参数, 数据版本)；按用户区分的工具（如个性化建议）再加上用户ID，
+其数据版本由用户档案和饮食记录得出，档案或饮食记录写入后版本变化，旧结果不再命中。
+
+用户ID取自本轮对话图配置的 configurable["user_id"]，并随配置传给工具，缓存键与工具查询的
+始终是同一个用户；配置中没有用户ID时按用户区分的工具不缓存。
+数据版本为None（例如索引尚未加载）时不缓存；工具抛出异常或返回错误结果时不缓存。
+"""
+import inspect
+import json
+import logging
+import os
+from collections import Counter
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool
+
+from robot.retrieval import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# 是否启用工具结果缓存
+TOOL_CACHE_ENABLED = os.getenv("ROBOT_TOOL_CACHE", "true").lower() == "true"
+
+# 缓存的最大条目数
+TOOL_CACHE_SIZE = int(os.getenv("ROBOT_TOOL_CACHE_SIZE", 2048))
+
+# 工具 metadata 中保存缓存策略的键
+CACHE_POLICY_KEY = "cache_policy"
+
+# 工具结果缓存，存活时间由各工具的策略决定
+tool_result_cache = TTLCache(maxsize=TOOL_CACHE_SIZE, ttl=None)
+
+# 按工具统计的命中/未命中次数
+_tool_hits: Counter = Counter()
+_tool_misses: Counter = Counter()
+
+
+class ToolCachePolicy:
+    """工具的缓存策略"""
+
+    def __init__(
+        self,
+        ttl: float,
+        data_version: Optional[Callable[..., Any]] = None,
+        per_user: bool = False
+    ):
+        """
+        Args:
+            ttl: 结果的存活时间（秒）
+            data_version: 返回数据版本的函数（可以是协程函数），per_user 时以用户ID为参数；
+                为None时只按存活时间失效
+            per_user: 结果是否因用户而异，是则缓存键包含用户ID，没有用户ID时不缓存
+        """
+        self.ttl = ttl
+        self.data_version = data_version
+        self.per_user = per_user
+
+    async def resolve_version(self, user_id: Optional[Hashable]) -> Optional[Hashable]:
+        """取得当前数据版本，未声明版本函数时返回空字符串"""
+        if self.data_version is None:
+            return ""
+        version = self.data_version(user_id) if self.per_user else self.data_version()
+        if inspect.isawaitable(version):
+            version = await version
+        return version
+
+
+def cacheable(ttl: float, data_version: Optional[Callable[..., Any]] = None, per_user: bool = False):
+    """
+    声明工具结果可跨轮次缓存，用在 @tool 之上
+
+        @cacheable(ttl=3600)
+        @tool
+        async def query_seasonal_foods(season: str) -> str: ...
+    """
+    def decorator(tool: BaseTool) -> BaseTool:
+        tool.metadata = {**(tool.metadata or {}), CACHE_POLICY_KEY: ToolCachePolicy(ttl, data_version, per_user)}
+        return tool
+    return decorator
+
+
+def get_cache_policy(tool: BaseTool) -> Optional[ToolCachePolicy]:
+    """工具声明的缓存策略，未声明时返回None"""
+    return (tool.metadata or {}).get(CACHE_POLICY_KEY)
+
+
+def canonical_args(arguments: Any) -> str:
+    """规范化工具参数：字典按键排序，字符串去掉首尾空白并合并连续空白"""
+    def normalize(value):
+        if isinstance(value, str):
+            return " ".join(value.split())
+        if isinstance(value, dict):
+            return {str(k): normalize(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [normalize(v) for v in value]
+        return value
+    return json.dumps(normalize(arguments), sort_keys=True, ensure_ascii=False, default=str)
+
+
+def is_error_result(result: Any) -> bool:
+    """工具返回的错误结果（不缓存）"""
+    if result is None:
+        return True
+    if isinstance(result, dict):
+        return "error" in result or result.get("status") == "failed"
+    if isinstance(result, str):
+        return result.startswith("抱歉")
+    return False
+
+
+def config_user_id(config: Optional[RunnableConfig]) -> Optional[Hashable]:
+    """本轮对话配置中的用户ID，没有时返回None"""
+    return ((config or {}).get("configurable") or {}).get("user_id")
+
+
+async def ainvoke_cached(tool: BaseTool, arguments: Any, config: Optional[RunnableConfig] = None) -> Any:
+    """
+    执行工具，声明了缓存策略的工具先查缓存
+
+    Args:
+        tool: 工具
+        arguments: 工具参数
+        config: 本轮对话图的配置，随调用传给工具；按用户缓存的工具从 configurable["user_id"] 取用户ID
+    """
+    policy = get_cache_policy(tool)
+    user_id = config_user_id(config)
+    if not TOOL_CACHE_ENABLED or policy is None or (policy.per_user and user_id is None):
+        return await tool.ainvoke(arguments, config)
+
+    try:
+        version = await policy.resolve_version(user_id)
+    except Exception as e:
+        logger.warning(f"获取工具 {tool.name} 的数据版本失败，跳过缓存: {str(e)}")
+        version = None
+    if version is None:
+        return await tool.ainvoke(arguments, config)
+
+    key = (tool.name, canonical_args(arguments), version, user_id if policy.per_user else None)
+    cached = tool_result_cache.get(key)
+    if cached is not None:
+        _tool_hits[tool.name] += 1
+        logger.info(f"工具 {tool.name} 命中结果缓存")
+        return cached
+
+    _tool_misses[tool.name] += 1
+    result = await tool.ainvoke(arguments, config)
+    if not is_error_result(result):
+        tool_result_cache.set(key, result, ttl=policy.ttl)
+    return result
+
+
+def get_tool_cache_stats() -> Dict[str, Any]:
+    """工具结果缓存的整体统计以及按工具的命中/未命中次数"""
+    return {
+        **tool_result_cache.stats(),
+        "tools": {
+            name: {"hits": _tool_hits[name], "misses": _tool_misses[name]}
+            for name in sorted(set(_tool_hits) | set(_tool_misses))
+        }
+    }
@@ -45,6 +45,14 @@ def run_robot_server():
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("ROBOT_PORT", 8001))  # 使用不同的端口
     debug = os.getenv("DEBUG", "true").lower() == "true"
+    workers = int(os.getenv("ROBOT_WORKERS", 1))
+    preload = os.getenv("ROBOT_PRELOAD", "true").lower() == "true"
+
+    # 生产模式多worker：主进程预加载模型和索引后fork出worker，只读资源写时复制共享
+    if not debug and workers > 1 and preload and hasattr(os, "fork"):
+        from robot.prefork import serve
+        serve("robot.chat_routes:app", host, port, workers)
+        return
 
     # 启动服务器
     uvicorn.run(
@@ -52,7 +60,8 @@ def run_robot_server():
         host=host,
         port=port,
         reload=debug,
-        reload_dirs=[str(project_root), str(project_root / "robot")]
+        reload_dirs=[str(project_root), str(project_root / "robot")],
+        workers=None if debug else workers
     )
 
 def run_frontend():
@@ -0,0 +1,78 @@
+import importlib
+import importlib.util
+import os
+import sys
+import types
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 测试直接导入 robot 包
+sys.path.insert(0, ROOT)
+
+
+def load_module(monkeypatch, name):
+    """
+    按文件加载 robot 下的模块，不执行上级包的 __init__（robot.tools、robot.llms 的 __init__
+    会加载全部工具和模型客户端）；测试结束后由 monkeypatch 从 sys.modules 中移除
+    """
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, *name.split('.')) + '.py')
+    module = importlib.util.module_from_spec(spec)
+    monkeypatch.setitem(sys.modules, name, module)
+    spec.loader.exec_module(module)
+    return module
+
+
+def stub_module(monkeypatch, name, **attrs):
+    """以桩模块代替 name，尚未导入且无法导入的上级包同样以空模块代替"""
+    parts = name.split('.')
+    for i in range(1, len(parts)):
+        parent = '.'.join(parts[:i])
+        if parent not in sys.modules:
+            try:
+                importlib.import_module(parent)
+            except ImportError:
+                monkeypatch.setitem(sys.modules, parent, types.ModuleType(parent))
+    module = types.ModuleType(name)
+    module.__path__ = []
+    module.__dict__.update(attrs)
+    monkeypatch.setitem(sys.modules, name, module)
+    return module
+
+
+def stub_missing(monkeypatch, name, **attrs):
+    """依赖未安装时以桩模块代替"""
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return stub_module(monkeypatch, name, **attrs)
+
+
+@pytest.fixture(scope='module')
+def aagent():
+    """
+    不加载真实工具和模型客户端的 robot.aagent：工具列表为空，robot.llms 以桩模块代替，
+    未安装 langchain 时 langchain.tools 同样以桩模块代替
+    """
+    with pytest.MonkeyPatch.context() as mp:
+        stub_missing(mp, 'langchain.tools', Tool=object)
+        stub_module(mp, 'robot.llms', model=None, get_llm=None)
+        load_module(mp, 'robot.globals')
+        tools = stub_module(mp, 'robot.tools', tools=[])
+        tools.tool_cache = load_module(mp, 'robot.tools.tool_cache')
+        yield load_module(mp, 'robot.aagent')
+
+
+@pytest.fixture(scope='module')
+def prompt_assembler():
+    """不经 robot.llms 包（导入时创建模型客户端）加载的 robot.llms.prompt_assembler"""
+    with pytest.MonkeyPatch.context() as mp:
+        yield load_module(mp, 'robot.llms.prompt_assembler')
+
+
+@pytest.fixture(scope='module')
+def tool_cache():
+    """不经 robot.tools 包（导入时加载全部工具）加载的 robot.tools.tool_cache"""
+    with pytest.MonkeyPatch.context() as mp:
+        yield load_module(mp, 'robot.tools.tool_cache')
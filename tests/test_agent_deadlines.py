@@ -0,0 +1,103 @@
+import asyncio
+import time
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.tools import tool
+
+
+class FakeModel:
+    """记录调用输入的模型，delay 秒后返回固定回答"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.inputs = []
+
+    async def ainvoke(self, messages):
+        self.inputs.append(messages)
+        await asyncio.sleep(self.delay)
+        return AIMessage(content='最终回答')
+
+
+@tool
+async def slow_lookup(query: str) -> str:
+    """超时测试用的慢工具"""
+    await asyncio.sleep(1)
+    return '太慢了'
+
+
+def deadline_config(seconds):
+    return {'configurable': {'deadline': time.monotonic() + seconds}}
+
+
+def turn_messages():
+    return [
+        HumanMessage(content='高血压吃什么'),
+        AIMessage(content='', tool_calls=[{'name': 'retrieve', 'args': {'query': '高血压'}, 'id': '1'}]),
+        ToolMessage(content='芹菜、燕麦', tool_call_id='1', status='success')
+    ]
+
+
+@pytest.fixture
+def model(aagent, monkeypatch):
+    def install(delay=0.0):
+        fake = FakeModel(delay)
+        monkeypatch.setattr(aagent.globals, 'current_model', fake)
+        return fake
+    return install
+
+
+def test_tool_exceeding_timeout_returns_timeout_result(aagent, monkeypatch):
+    monkeypatch.setattr(aagent, 'tools', [slow_lookup])
+    monkeypatch.setitem(aagent.ToolTimeout.TIMEOUTS, 'slow_lookup', 0.05)
+    before = aagent.agent_metrics.tool_timeouts['slow_lookup']
+    events = []
+    state = {
+        'messages': [
+            HumanMessage(content='查一下'),
+            AIMessage(content='', tool_calls=[{'name': 'slow_lookup', 'args': {'query': 'x'}, 'id': '1'}])
+        ],
+        'completed_tools': set()
+    }
+    started_at = time.monotonic()
+    result = asyncio.run(aagent.tools_node(state, {'configurable': {}}, events.append))
+    assert time.monotonic() - started_at < 0.5
+    message = result['messages'][-1]
+    assert isinstance(message, ToolMessage)
+    assert message.status == 'error'
+    assert '超过' in message.content
+    assert events[-1]['type'] == 'tool_end' and events[-1]['status'] == 'timeout'
+    assert aagent.agent_metrics.tool_timeouts['slow_lookup'] == before + 1
+    assert 'slow_lookup' not in state['completed_tools']
+
+
+def test_near_deadline_forces_final_answer_with_trailing_instruction(aagent, model):
+    fake = model()
+    messages = turn_messages()
+    result = asyncio.run(aagent.chatbot_node({'messages': messages}, deadline_config(aagent.FINAL_ANSWER_RESERVE / 2)))
+    assert len(fake.inputs) == 1
+    sent = fake.inputs[0]
+    assert sent[:-1] == messages
+    assert isinstance(sent[-1], HumanMessage)
+    assert sent[-1].content == aagent.FORCE_FINAL_PROMPT
+    # 追加的指示只用于本次调用，不写入对话状态
+    assert [message.content for message in result['messages']] == ['最终回答']
+
+
+def test_expired_deadline_returns_fallback_without_model_call(aagent, model):
+    fake = model()
+    result = asyncio.run(aagent.chatbot_node({'messages': turn_messages()}, deadline_config(-1)))
+    assert fake.inputs == []
+    assert '芹菜、燕麦' in result['messages'][0].content
+
+
+def test_model_timeout_uses_fallback_answer(aagent, model):
+    model(delay=1)
+    before = aagent.agent_metrics.llm_timeouts
+    messages = turn_messages()
+    started_at = time.monotonic()
+    result = asyncio.run(aagent.chatbot_node({'messages': messages}, deadline_config(0.05)))
+    assert time.monotonic() - started_at < 0.5
+    assert result['messages'][0].content == aagent.fallback_answer(messages).content
+    assert '芹菜、燕麦' in result['messages'][0].content
+    assert aagent.agent_metrics.llm_timeouts == before + 1
@@ -0,0 +1,84 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from robot.retrieval import AllergenIndex, allowed_rows
+
+ALLERGENS_FILE = os.path.join(os.path.dirname(__file__), '..', 'robot', 'data', 'allergens_data.json')
+
+
+@pytest.fixture(scope='module')
+def index():
+    with open(ALLERGENS_FILE, 'r', encoding='utf-8') as f:
+        return AllergenIndex(json.load(f))
+
+
+def allergens_of(index, text):
+    mask = index.text_mask(text)
+    return {name for name, bit in index.bits.items() if mask & bit}
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('清蒸鲈鱼', {'fish'}),
+    ('鱼露', {'fish'}),
+    ('牛奶', {'milk'}),
+    ('芝士焗饭', {'milk'}),
+    ('皮蛋瘦肉粥', {'eggs'}),
+    ('花生酱', {'peanuts'}),
+    ('核桃仁', {'tree_nuts'}),
+    ('荞麦面粉与小麦面粉', {'wheat'}),
+    ('酱油', {'soy'}),
+    ('蒜蓉扇贝', {'shellfish'}),
+    ('蚝油生菜', {'shellfish'}),
+    ('芝麻酱', {'sesame'}),
+    ('芥末', {'mustard'}),
+])
+def test_true_positives(index, text, expected):
+    assert allergens_of(index, text) == expected
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('鱼腥草', set()),
+    ('凉拌鱼腥草', set()),
+    ('鱼香茄子', set()),
+    ('甲鱼汤', set()),
+    ('蛋白质粉', set()),
+    ('大豆蛋白', {'soy'}),
+    ('荞麦面条', set()),
+    ('杏仁豆腐', {'tree_nuts'}),
+    ('蟹味菇', set()),
+    ('奶油生菜', set()),
+    # common_foods 中的泛称不参与匹配
+    ('海鲜', set()),
+    ('中式菜肴', set()),
+    ('糕点', set()),
+    ('零食', set()),
+    ('调味品', set()),
+])
+def test_false_positives(index, text, expected):
+    assert allergens_of(index, text) == expected
+
+
+def test_molluscs_are_not_fish(index):
+    assert allergens_of(index, '红烧鲍鱼') == {'shellfish'}
+    assert 'fish' not in allergens_of(index, '爆炒鱿鱼')
+
+
+def test_exclusion_only_covers_inner_match(index):
+    # 同一文本中另有真正的鱼时仍然命中
+    assert allergens_of(index, '鱼腥草炖鲫鱼') == {'fish'}
+
+
+def test_recipe_mask_uses_ingredient_fields(index):
+    recipe = {'数据类型': '食谱', '菜名': '鱼香肉丝', '主料': '猪肉', '辅料': '木耳', '调料': '酱油'}
+    assert index.document_mask(recipe) == index.bits['soy']
+    food = {'数据类型': '食物', '食物名称': '带鱼'}
+    assert index.document_mask(food) == index.bits['fish']
+
+
+def test_allowed_rows(index):
+    masks = np.array([index.text_mask(t) for t in ['带鱼', '牛奶', '米饭']], dtype=np.uint64)
+    allowed = allowed_rows(masks, index.bits_for(['fish', 'unknown']))
+    assert allowed.tolist() == [False, True, True]
@@ -0,0 +1,53 @@
+import numpy as np
+
+from robot.retrieval import IVFFlatIndex, normalize_rows, top_k_indices
+
+
+def clustered_vectors(n=2000, dim=32, centers=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = rng.normal(size=(centers, dim))
+    labels = rng.integers(centers, size=n)
+    return normalize_rows(centroids[labels] + 0.3 * rng.normal(size=(n, dim)))
+
+
+def flat_top_k(vectors, query, k, allowed=None):
+    scores = vectors @ normalize_rows(query)[0]
+    if allowed is not None:
+        scores[~allowed] = -np.inf
+    return set(top_k_indices(scores, k).tolist())
+
+
+def test_recall_against_flat_search():
+    vectors = clustered_vectors()
+    index = IVFFlatIndex.build(vectors, n_lists=32, n_probe=8)
+    queries = clustered_vectors(n=50, seed=1)
+    k = 10
+    recall = np.mean([
+        len(flat_top_k(vectors, q, k) & {row for row, _ in index.search(q, k)}) / k for q in queries
+    ])
+    assert recall >= 0.9
+
+
+def test_probing_all_lists_is_exact():
+    vectors = clustered_vectors(n=500)
+    index = IVFFlatIndex.build(vectors, n_lists=16)
+    query = vectors[7]
+    rows = {row for row, _ in index.search(query, 10, n_probe=16)}
+    assert rows == flat_top_k(vectors, query, 10)
+
+
+def test_allowed_mask_widens_probe_until_k_rows():
+    vectors = clustered_vectors(n=500)
+    index = IVFFlatIndex.build(vectors, n_lists=16, n_probe=1)
+    allowed = np.zeros(len(vectors), dtype=bool)
+    allowed[::50] = True
+    results = index.search(vectors[3], 5, allowed)
+    assert len(results) == 5
+    assert all(allowed[row] for row, _ in results)
+
+
+def test_arrays_roundtrip():
+    vectors = clustered_vectors(n=300)
+    index = IVFFlatIndex.build(vectors, n_lists=8)
+    restored = IVFFlatIndex.from_arrays(index.to_arrays())
+    assert restored.search(vectors[0], 5) == index.search(vectors[0], 5)
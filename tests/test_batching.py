@@ -0,0 +1,47 @@
+import asyncio
+
+from langchain_core.embeddings import Embeddings
+
+from robot.retrieval import BatchingEmbeddings
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_concurrent_queries_share_one_batch():
+    base = CountingEmbeddings()
+    batcher = BatchingEmbeddings(base, window_ms=20, max_batch_size=8)
+
+    async def main():
+        vectors = await asyncio.gather(*(batcher.aembed_query('q' * i) for i in range(1, 5)))
+        await batcher.aclose()
+        return vectors
+
+    vectors = asyncio.run(main())
+    assert [v[0] for v in vectors] == [1.0, 2.0, 3.0, 4.0]
+    assert len(base.calls) == 1 and len(base.calls[0]) == 4
+
+
+def test_embed_after_close_restarts_worker():
+    base = CountingEmbeddings()
+    batcher = BatchingEmbeddings(base, window_ms=1)
+
+    async def main():
+        first = await batcher.aembed_query('ab')
+        await batcher.aclose()
+        second = await batcher.aembed_query('abc')
+        await batcher.aclose()
+        return first, second
+
+    # 两次 asyncio.run 模拟应用生命周期重启
+    assert asyncio.run(main()) == ([2.0, 1.0], [3.0, 1.0])
+    assert asyncio.run(main()) == ([2.0, 1.0], [3.0, 1.0])
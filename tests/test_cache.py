@@ -0,0 +1,44 @@
+from robot.retrieval import TTLCache
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl():
+    timer = FakeTimer()
+    cache = TTLCache(maxsize=10, ttl=5, timer=timer)
+    cache.set('a', 1)
+    cache.set('b', 2, ttl=20)
+    timer.now = 4.9
+    assert cache.get('a') == 1
+    timer.now = 5.0
+    assert cache.get('a') is None
+    assert cache.get('b') == 2
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['expirations']) == (2, 1, 1)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(maxsize=2, ttl=None)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+
+
+def test_pop_and_clear():
+    cache = TTLCache()
+    cache.set('a', 1)
+    assert cache.pop('a') == 1
+    assert cache.pop('a', 'missing') == 'missing'
+    cache.set('b', 2)
+    cache.clear()
+    assert len(cache) == 0
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from robot.retrieval import embed_incrementally, row_hash
+
+
+class CountingEmbedder:
+    def __init__(self):
+        self.texts = []
+
+    def __call__(self, texts):
+        self.texts.extend(texts)
+        return [[float(len(text)), 1.0, 0.0] for text in texts]
+
+
+def split(documents):
+    """每个文档按 '|' 分成多个分块，空文本没有分块"""
+    return [
+        Document(page_content=part, metadata=doc.metadata)
+        for doc in documents for part in doc.page_content.split('|') if part
+    ]
+
+
+def doc(content, name):
+    return Document(page_content=content, metadata={'name': name})
+
+
+def previous_rows(build):
+    """与 rag._load_reusable_snapshot 相同：行哈希 -> 该行分块区间"""
+    row_ids = np.array(build.row_ids)
+    starts = np.flatnonzero(np.diff(row_ids, prepend=-1))
+    ends = np.append(starts[1:], len(row_ids))
+    return {build.row_hashes[start]: (int(start), int(end)) for start, end in zip(starts, ends)}
+
+
+def test_unchanged_rows_reuse_previous_vectors():
+    embed = CountingEmbedder()
+    first = embed_incrementally([[doc('a|bb', '甲'), doc('ccc', '乙')], [doc('dddd', '丙')]], split, embed)
+    assert [d.page_content for d in first.splits] == ['a', 'bb', 'ccc', 'dddd']
+    assert first.row_ids == [0, 0, 1, 2]
+    assert first.row_hashes[:2] == [row_hash(doc('a|bb', '甲'))] * 2
+    assert (first.embedded_rows, first.reused_rows) == (3, 0)
+
+    # 乙被修改，丙被删除，新增丁；甲所在批次全部复用，不调用嵌入
+    embed = CountingEmbedder()
+    second = embed_incrementally(
+        [[doc('a|bb', '甲')], [doc('cc', '乙'), doc('eeeee', '丁')]],
+        split, embed, first.splits, first.vectors, previous_rows(first)
+    )
+    assert embed.texts == ['cc', 'eeeee']
+    assert (second.reused_rows, second.embedded_rows, second.deleted_rows) == (1, 2, 2)
+    assert [d.page_content for d in second.splits] == ['a', 'bb', 'cc', 'eeeee']
+    assert second.row_ids == [0, 0, 1, 2]
+    np.testing.assert_array_equal(second.vectors[:2], first.vectors[:2])
+    assert np.allclose(np.linalg.norm(second.vectors, axis=1), 1.0)
+
+
+def test_batches_without_splits_are_skipped():
+    embed = CountingEmbedder()
+    # 首次构建（没有旧快照）时出现没有分块的批次
+    build = embed_incrementally([[], [doc('', '乙')], [doc('a', '甲')]], split, embed)
+    assert [d.page_content for d in build.splits] == ['a']
+    assert build.vectors.shape == (1, 3)
+
+
+def test_no_splits_raises():
+    with pytest.raises(ValueError):
+        embed_incrementally([[], []], split, CountingEmbedder())
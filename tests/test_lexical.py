@@ -0,0 +1,35 @@
+import numpy as np
+
+from robot.retrieval import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize_chinese_unigrams_and_bigrams():
+    assert tokenize('红枣 Soup') == ['红', '枣', '红枣', 'soup']
+
+
+def test_bm25_ranks_exact_terms_first():
+    index = BM25Index.build(['红枣银耳汤', '银耳', '番茄炒蛋', '红枣粥'])
+    rows = [row for row, _ in index.search('红枣银耳', k=4)]
+    assert rows[0] == 0
+    assert 2 not in rows  # 不含任何查询词的行不返回
+
+
+def test_bm25_respects_allowed_mask():
+    index = BM25Index.build(['红枣银耳汤', '银耳', '番茄炒蛋', '红枣粥'])
+    allowed = np.array([False, True, True, True])
+    assert {row for row, _ in index.search('红枣银耳', k=4, allowed=allowed)} == {1, 3}
+
+
+def test_bm25_arrays_roundtrip():
+    index = BM25Index.build(['红枣银耳汤', '银耳', '番茄炒蛋'])
+    restored = BM25Index.from_arrays(index.to_arrays())
+    np.testing.assert_allclose(restored.get_scores('银耳汤'), index.get_scores('银耳汤'))
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1, 4]])
+    assert fused[0] == 1
+    assert set(fused) == {1, 2, 3, 4}
+    # 只在一路中排第一的行不如两路都靠前的行
+    assert fused.index(3) < fused.index(2)
+    assert reciprocal_rank_fusion([]) == []
@@ -0,0 +1,18 @@
+from robot.retrieval import MultiPatternMatcher
+
+
+def test_finds_all_overlapping_matches():
+    matcher = MultiPatternMatcher([('花生', 'p'), ('花生酱', 'ps'), ('生酱', 'x'), ('', 'empty')])
+    matches = list(matcher.iter_matches('抹花生酱'))
+    assert matches == [(1, '花生', 'p'), (1, '花生酱', 'ps'), (2, '生酱', 'x')]
+
+
+def test_payloads_of_shared_pattern():
+    matcher = MultiPatternMatcher([('面包', 'wheat'), ('面包', 'milk'), ('鸡蛋', 'eggs')])
+    assert sorted(matcher.payloads('鸡蛋面包')) == ['eggs', 'milk', 'wheat']
+    assert matcher.payloads('米饭') == []
+
+
+def test_failure_links_across_patterns():
+    matcher = MultiPatternMatcher([('abcd', 1), ('bce', 2), ('c', 3)])
+    assert [(start, pattern) for start, pattern, _ in matcher.iter_matches('abce')] == [(2, 'c'), (1, 'bce')]
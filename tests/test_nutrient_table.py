@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from robot.retrieval import NutrientTable, parse_range_conditions
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('蛋白质>20g且脂肪低于5克', [('蛋白质(g)', '>', 20.0), ('脂肪(g)', '<', 5.0)]),
+    ('热量不超过100的食物', [('能量(kcal)', '<=', 100.0)]),
+    ('维生素c含量≥30.5', [('维生素C(mg)', '>=', 30.5)]),
+    ('碳水化合物至少 10', [('碳水化合物(g)', '>=', 10.0)]),
+    ('高蛋白食物有哪些', []),
+])
+def test_parse_range_conditions(query, expected):
+    assert parse_range_conditions(query) == expected
+
+
+@pytest.fixture
+def table():
+    records = pd.DataFrame({'食物名称': ['鸡胸肉', '牛奶', '苹果', '花生']})
+    columns = {
+        '蛋白质(g)': np.array([24.6, 3.0, 0.2, 24.8]),
+        '脂肪(g)': np.array([1.9, 3.2, 0.2, 44.3]),
+    }
+    masks = np.array([0, 1, 0, 2], dtype=np.uint64)
+    return NutrientTable(records, columns, masks)
+
+
+def test_top_by_field(table):
+    assert [r['食物名称'] for r in table.query('蛋白质(g)', True, 2)] == ['花生', '鸡胸肉']
+    assert [r['食物名称'] for r in table.query('脂肪(g)', False, 2)] == ['苹果', '鸡胸肉']
+
+
+def test_range_conditions_and_allergen_bits(table):
+    conditions = parse_range_conditions('蛋白质>20且脂肪低于10')
+    assert [r['食物名称'] for r in table.query('蛋白质(g)', True, 5, conditions)] == ['鸡胸肉']
+    # 排除位1（牛奶）后按蛋白质降序
+    assert [r['食物名称'] for r in table.query('蛋白质(g)', True, 5, exclude_bits=1)] == ['花生', '鸡胸肉', '苹果']
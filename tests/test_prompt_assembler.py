@@ -0,0 +1,52 @@
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+
+def count_chars(text):
+    return len(text)
+
+
+def test_estimate_tokens(prompt_assembler):
+    estimate_tokens = prompt_assembler.estimate_tokens
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('你好') == 2
+    assert estimate_tokens('abcd') == 1
+    assert estimate_tokens('你好abcde') == 4
+
+
+def test_history_kept_newest_first_within_budget(prompt_assembler):
+    overhead = prompt_assembler.MESSAGE_OVERHEAD
+    history = [('q1' * 10, 'a1' * 10), ('q2', 'a2'), ('q3', 'a3')]
+    system = [SystemMessage(content='sys')]
+    # 固定部分 3+2 个字符，每轮 2+2 个字符，各加格式开销
+    fixed = 3 + 2 + 2 * overhead
+    per_turn = 4 + 2 * overhead
+    assembler = prompt_assembler.PromptAssembler(count_chars, budget=fixed + 2 * per_turn)
+    result = assembler.assemble(system, history, 'hi')
+    assert [m.content for m in result.messages] == ['sys', 'q2', 'a2', 'q3', 'a3', 'hi']
+    assert (result.history_turns, result.dropped_turns) == (2, 1)
+    assert result.prompt_tokens == fixed + 2 * per_turn
+
+
+def test_history_stays_contiguous(prompt_assembler):
+    # 最新一轮放不下时不再放入更早的短对话
+    history = [('q1', 'a1'), ('x' * 100, 'y' * 100)]
+    assembler = prompt_assembler.PromptAssembler(count_chars, budget=100)
+    result = assembler.assemble([SystemMessage(content='s')], history, 'hi')
+    assert result.history_turns == 0
+    assert isinstance(result.messages[-1], HumanMessage)
+
+
+def test_max_history_turns_and_extra_messages(prompt_assembler):
+    history = [(f'q{i}', f'a{i}') for i in range(5)]
+    extra = [SystemMessage(content='图片分析结果')]
+    assembler = prompt_assembler.PromptAssembler(count_chars, budget=10000, max_history_turns=2)
+    result = assembler.assemble([SystemMessage(content='s')], history, 'hi', extra)
+    assert [m.content for m in result.messages] == ['s', 'q3', 'a3', 'q4', 'a4', 'hi', '图片分析结果']
+    assert result.dropped_turns == 3
+
+
+def test_turn_without_reply_keeps_user_message_only(prompt_assembler):
+    assembler = prompt_assembler.PromptAssembler(count_chars, budget=10000)
+    result = assembler.assemble([], [('q1', None)], 'hi')
+    assert [type(m) for m in result.messages] == [HumanMessage, HumanMessage]
+    assert not any(isinstance(m, AIMessage) for m in result.messages)
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from robot.retrieval import MatrixVectorStore, QuantizedMatrix, normalize_rows, top_k_indices
+
+
+def random_vectors(n=1000, dim=64, seed=0):
+    return normalize_rows(np.random.default_rng(seed).normal(size=(n, dim)))
+
+
+@pytest.mark.parametrize('storage, tolerance', [('float16', 1e-3), ('int8', 0.05)])
+def test_scores_close_to_float32(storage, tolerance):
+    vectors = random_vectors()
+    quantized = QuantizedMatrix.encode(vectors, storage)
+    query = random_vectors(1, seed=1)[0]
+    np.testing.assert_allclose(quantized @ query, vectors @ query, atol=tolerance)
+    assert quantized.nbytes < vectors.nbytes
+
+
+def test_unsupported_storage():
+    with pytest.raises(ValueError):
+        QuantizedMatrix.encode(random_vectors(10), 'int4')
+
+
+def test_arrays_roundtrip():
+    vectors = random_vectors(50)
+    quantized = QuantizedMatrix.encode(vectors, 'int8')
+    restored = QuantizedMatrix.from_arrays(quantized.to_arrays())
+    np.testing.assert_array_equal(restored.decode(), quantized.decode())
+
+
+def test_rescoring_returns_exact_float32_scores():
+    vectors = random_vectors()
+    queries = random_vectors(20, seed=2)
+    docs = [Document(page_content=str(i)) for i in range(len(vectors))]
+    store = MatrixVectorStore(None, docs, vectors, normalized=True,
+                              compressed=QuantizedMatrix.encode(vectors, 'int8'), rescore_factor=4)
+    k = 5
+    for query in queries:
+        results = store.search_rows_by_vector(query, k)
+        exact = vectors @ query
+        assert [row for row, _ in results] == top_k_indices(exact, k).tolist()
+        np.testing.assert_allclose([score for _, score in results], exact[[row for row, _ in results]], rtol=1e-6)
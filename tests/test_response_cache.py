@@ -0,0 +1,114 @@
+import asyncio
+import sys
+import types
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from robot import response_cache
+from robot.retrieval import SemanticCache
+
+
+class FakeCursor:
+    def __init__(self, row):
+        self.row = row
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, sql, args):
+        pass
+
+    async def fetchone(self):
+        return self.row
+
+
+class FakePool:
+    """按会话返回 load_session_context 查询结果的连接池"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.session_id = None
+
+    def acquire(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def cursor(self):
+        return FakeCursor(self.rows.get(self.session_id))
+
+
+class FakeEmbeddings:
+    async def aembed_query(self, text):
+        return [1.0, 0.0]
+
+
+class FakeResource:
+    async def aget(self):
+        return FakeEmbeddings()
+
+
+@pytest.fixture(autouse=True)
+def enabled(monkeypatch):
+    monkeypatch.setattr(response_cache, 'RESPONSE_CACHE_ENABLED', True)
+    monkeypatch.setattr(response_cache, 'response_cache', SemanticCache(threshold=0.9))
+    # 查找时导入的 robot.tools.rag 以桩模块代替，不加载全部工具和嵌入模型
+    rag = types.ModuleType('robot.tools.rag')
+    rag.embeddings_resource = FakeResource()
+    monkeypatch.setitem(sys.modules, 'robot.tools', types.ModuleType('robot.tools'))
+    monkeypatch.setitem(sys.modules, 'robot.tools.rag', rag)
+
+
+def probe(pool, session_id, question, model_name='glm-4-plus'):
+    pool.session_id = session_id
+    return asyncio.run(response_cache.probe(pool, session_id, question, model_name))
+
+
+def turn(tool_name):
+    return [
+        HumanMessage(content='问题'),
+        AIMessage(content='', tool_calls=[{'name': tool_name, 'args': {}, 'id': '1'}]),
+        ToolMessage(content='结果', tool_call_id='1'),
+        AIMessage(content='回复')
+    ]
+
+
+def test_generic_reply_is_shared_by_same_context():
+    pool = FakePool({'a': (None, None, 0, 0), 'b': ('[]', '', 1, 0)})
+    first = probe(pool, 'a', '感冒吃什么好')
+    assert first.answer is None
+    assert response_cache.store(first, '多喝水', turn('search_food'))
+    # 规则启用但为空与未启用等价
+    assert probe(pool, 'b', '感冒吃什么好').answer == '多喝水'
+
+
+def test_personalized_reply_is_not_stored():
+    # 两个都没有档案和饮食记录的用户：个性化回复不能互相命中
+    pool = FakePool({'a': (None, None, 0, 0), 'b': (None, None, 0, 0)})
+    first = probe(pool, 'a', '给我一些饮食建议')
+    assert not response_cache.store(first, '根据你的记录……', turn('generate_personalized_advice'))
+    assert probe(pool, 'b', '给我一些饮食建议').answer is None
+
+
+def test_context_comes_from_session_rules_and_model():
+    pool = FakePool({
+        'a': ('["花生"]', None, 0, 0),
+        'b': ('["花生"]', '只推荐素食', 1, 0),
+        'c': ('["花生"]', None, 0, 0),
+        'd': ('["花生"]', None, 0, 1)
+    })
+    first = probe(pool, 'a', '早餐吃什么')
+    assert response_cache.store(first, '燕麦', turn('search_food'))
+    assert probe(pool, 'b', '早餐吃什么').answer is None
+    assert probe(pool, 'c', '早餐吃什么', model_name='qwen').answer is None
+    assert probe(pool, 'c', '早餐吃什么').answer == '燕麦'
+    # 已有对话的会话不查找
+    assert probe(pool, 'd', '早餐吃什么') is None
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from robot.retrieval import SemanticCache
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def vector(angle):
+    return np.array([np.cos(angle), np.sin(angle)])
+
+
+def test_hit_requires_threshold():
+    cache = SemanticCache(threshold=0.95)
+    cache.set('p', vector(0.0), 'answer')
+    value, similarity = cache.get('p', vector(0.1))
+    assert value == 'answer'
+    assert similarity == pytest.approx(np.cos(0.1))
+    value, similarity = cache.get('p', vector(0.5))
+    assert value is None
+    assert similarity < 0.95
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (1, 1)
+
+
+def test_partitions_are_isolated():
+    cache = SemanticCache(threshold=0.9)
+    cache.set('user-a', vector(0.0), 'a')
+    assert cache.get('user-b', vector(0.0)) == (None, 0.0)
+    assert cache.get('user-a', vector(0.0))[0] == 'a'
+
+
+def test_lookup_across_partitions_picks_best_and_counts_once():
+    cache = SemanticCache(threshold=0.9)
+    cache.set('generic', vector(0.2), 'generic')
+    cache.set('personal', vector(0.0), 'personal')
+    value, similarity, partition = cache.lookup(['generic', 'personal'], vector(0.01))
+    assert (value, partition) == ('personal', 'personal')
+    assert cache.stats()['hits'] == 1
+    assert cache.lookup(['other'], vector(0.0)) == (None, 0.0, None)
+    assert cache.stats()['misses'] == 1
+
+
+def test_near_duplicate_replaces_entry():
+    cache = SemanticCache(threshold=0.9)
+    cache.set('p', vector(0.0), 'old')
+    cache.set('p', vector(0.01), 'new')
+    assert len(cache) == 1
+    assert cache.get('p', vector(0.0))[0] == 'new'
+
+
+def test_ttl_and_lru_eviction():
+    timer = FakeTimer()
+    cache = SemanticCache(threshold=0.9, maxsize=2, ttl=10, timer=timer)
+    cache.set('p', vector(0.0), 'a')
+    cache.set('p', vector(1.5), 'b')
+    cache.get('p', vector(0.0))
+    cache.set('p', vector(3.0), 'c')  # 淘汰最久未使用的 b
+    assert cache.get('p', vector(1.5))[0] is None
+    assert cache.stats()['evictions'] == 1
+    timer.now = 10
+    assert cache.get('p', vector(0.0))[0] is None
+    assert cache.stats()['expirations'] == 2
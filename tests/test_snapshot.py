@@ -0,0 +1,62 @@
+import os
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+
+from robot.retrieval import compute_config_id, compute_snapshot_key, latest_snapshot, load_snapshot, save_snapshot, snapshot_exists
+
+
+def save(snapshot_dir, key, config_id):
+    save_snapshot(snapshot_dir, key, [Document(page_content=key)], np.ones((1, 4), dtype=np.float32),
+                  config_id=config_id)
+    # 保证 meta.json 的修改时间有先后
+    time.sleep(0.02)
+
+
+def test_save_and_load_roundtrip(tmp_path):
+    vectors = np.arange(8, dtype=np.float32).reshape(2, 4)
+    docs = [Document(page_content='a', metadata={'食物名称': '苹果'}), Document(page_content='b')]
+    save_snapshot(str(tmp_path), 'k1', docs, vectors, arrays={'masks': np.array([1, 0], dtype=np.uint64)})
+    loaded_docs, loaded_vectors, arrays = load_snapshot(str(tmp_path), 'k1')
+    assert [d.page_content for d in loaded_docs] == ['a', 'b']
+    assert loaded_docs[0].metadata == {'食物名称': '苹果'}
+    np.testing.assert_array_equal(loaded_vectors, vectors)
+    assert arrays['masks'].tolist() == [1, 0]
+    assert snapshot_exists(str(tmp_path), 'k1') and not snapshot_exists(str(tmp_path), 'k2')
+
+
+def test_key_depends_on_content_model_and_splitter(tmp_path):
+    data = tmp_path / 'data.csv'
+    data.write_text('a,b\n1,2\n', encoding='utf-8')
+    key = compute_snapshot_key([str(data)], 'model', {'chunk_size': 500})
+    assert key == compute_snapshot_key([str(data)], 'model', {'chunk_size': 500})
+    assert key != compute_snapshot_key([str(data)], 'other', {'chunk_size': 500})
+    assert key != compute_snapshot_key([str(data)], 'model', {'chunk_size': 400})
+    data.write_text('a,b\n1,3\n', encoding='utf-8')
+    assert key != compute_snapshot_key([str(data)], 'model', {'chunk_size': 500})
+
+
+def test_prune_keeps_previous_generation_of_same_config(tmp_path):
+    config = compute_config_id('model', {'chunk_size': 500})
+    for key in ('k1', 'k2', 'k3'):
+        save(str(tmp_path), key, config)
+    assert sorted(os.listdir(tmp_path)) == ['k2', 'k3']
+
+
+def test_prune_ignores_other_configs(tmp_path):
+    flat = compute_config_id('model', {'chunk_size': 500})
+    ivf = compute_config_id('model', {'chunk_size': 500, 'ann_index': 'ivf'})
+    assert flat != ivf
+    save(str(tmp_path), 'ivf1', ivf)
+    for key in ('k1', 'k2', 'k3'):
+        save(str(tmp_path), key, flat)
+    assert sorted(os.listdir(tmp_path)) == ['ivf1', 'k2', 'k3']
+    assert latest_snapshot(str(tmp_path), ivf)[0] == 'ivf1'
+    assert latest_snapshot(str(tmp_path))[0] == 'k3'
+
+
+def test_no_prune_without_config_id(tmp_path):
+    for key in ('k1', 'k2', 'k3'):
+        save(str(tmp_path), key, None)
+    assert sorted(os.listdir(tmp_path)) == ['k1', 'k2', 'k3']
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import tool
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(tool_cache):
+    tool_cache.tool_result_cache.clear()
+
+
+def make_tool(tool_cache, calls, per_user=True, data_version=lambda *args: 'v1'):
+    @tool_cache.cacheable(ttl=60, data_version=data_version, per_user=per_user)
+    @tool
+    async def advice(days: int = 30, config: RunnableConfig = None) -> str:
+        """按用户生成建议"""
+        user_id = tool_cache.config_user_id(config)
+        calls.append(user_id)
+        return f"用户 {user_id} 最近{days}天的建议"
+    return advice
+
+
+def invoke(tool_cache, advice, arguments, user_id=None):
+    config = None if user_id is None else {"configurable": {"user_id": user_id}}
+    return asyncio.run(tool_cache.ainvoke_cached(advice, arguments, config))
+
+
+def test_users_with_same_args_do_not_share_entries(tool_cache):
+    # 两个用户的数据版本相同（例如都没有档案和饮食记录），缓存键仍按用户区分
+    calls = []
+    advice = make_tool(tool_cache, calls)
+    assert invoke(tool_cache, advice, {"days": 7}, user_id=1) == "用户 1 最近7天的建议"
+    assert invoke(tool_cache, advice, {"days": 7}, user_id=2) == "用户 2 最近7天的建议"
+    assert invoke(tool_cache, advice, {"days": 7}, user_id=1) == "用户 1 最近7天的建议"
+    assert calls == [1, 2]
+
+
+def test_per_user_tool_without_user_id_is_not_cached(tool_cache):
+    calls = []
+    advice = make_tool(tool_cache, calls)
+    invoke(tool_cache, advice, {"days": 7})
+    invoke(tool_cache, advice, {"days": 7})
+    assert calls == [None, None]
+    assert len(tool_cache.tool_result_cache) == 0
+
+
+def test_shared_tool_hits_with_canonical_args(tool_cache):
+    calls = []
+    seasonal = make_tool(tool_cache, calls, per_user=False, data_version=None)
+    invoke(tool_cache, seasonal, {"days": 7}, user_id=1)
+    invoke(tool_cache, seasonal, {"days": 7}, user_id=2)
+    assert calls == [1]
+    assert tool_cache.canonical_args({"q": " 春季  时令 "}) == tool_cache.canonical_args({"q": "春季 时令"})
+
+
+def test_data_version_change_and_missing_version(tool_cache):
+    calls, versions = [], ['v1']
+    advice = make_tool(tool_cache, calls, data_version=lambda user_id: versions[0])
+    invoke(tool_cache, advice, {"days": 7}, user_id=1)
+    versions[0] = 'v2'
+    invoke(tool_cache, advice, {"days": 7}, user_id=1)
+    versions[0] = None
+    invoke(tool_cache, advice, {"days": 7}, user_id=1)
+    invoke(tool_cache, advice, {"days": 7}, user_id=1)
+    assert calls == [1, 1, 1, 1]
+    assert len(tool_cache.tool_result_cache) == 2
+
+
+def test_error_results_are_not_cached(tool_cache):
+    assert tool_cache.is_error_result({"error": "数据库不可用"})
+    assert tool_cache.is_error_result("抱歉，查询失败")
+    assert not tool_cache.is_error_result({"建议": []})
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def scheduler(aagent):
+    def make(dependencies, concurrency=4):
+        return aagent.ToolScheduler(concurrency, lambda name: dependencies.get(name, []))
+    return make
+
+
+def test_independent_calls_share_a_wave_ordered_by_priority(scheduler):
+    names = ["save_health_advice", "unknown_tool", "chat_history", "generate_personalized_advice"]
+    waves, skipped = scheduler({}).plan(names, set())
+    assert skipped == {}
+    assert waves == [[2, 3, 0, 1]]
+
+
+def test_dependent_calls_run_in_later_waves(scheduler):
+    names = ["c", "b", "a"]
+    waves, skipped = scheduler({"b": ["a"], "c": ["a", "b"]}).plan(names, set())
+    assert (waves, skipped) == ([[2], [1], [0]], {})
+
+
+def test_missing_dependency_skips_call_and_dependents(scheduler):
+    names = ["a", "b", "c"]
+    dependencies = {"a": ["x"], "b": ["a"]}
+    waves, skipped = scheduler(dependencies).plan(names, set())
+    assert waves == [[2]]
+    assert set(skipped) == {0, 1}
+    # 依赖的工具之前已执行过时不跳过
+    waves, skipped = scheduler(dependencies).plan(names, {"x"})
+    assert skipped == {}
+    assert waves == [[0, 2], [1]]
+
+
+def test_cycle_is_skipped(scheduler):
+    waves, skipped = scheduler({"a": ["b"], "b": ["a"]}).plan(["a", "b", "c"], set())
+    assert waves == [[2]]
+    assert set(skipped) == {0, 1}
+
+
+def test_run_returns_results_in_call_order(aagent, scheduler):
+    names = ["b", "a", "fail", "orphan"]
+    order = []
+
+    async def invoke(i):
+        await asyncio.sleep(0.01 * (len(names) - i))
+        order.append(names[i])
+        if names[i] == "fail":
+            raise RuntimeError("boom")
+        return names[i].upper()
+
+    completed = set()
+    results = asyncio.run(
+        scheduler({"b": ["a"], "orphan": ["missing"]}).run(names, invoke, completed)
+    )
+    assert results[:2] == ["B", "A"]
+    assert isinstance(results[2], RuntimeError)
+    assert isinstance(results[3], aagent.ToolSkipped)
+    assert order.index("a") < order.index("b")
+    assert completed == {"a", "b"}
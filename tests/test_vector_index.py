@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from robot.retrieval import MatrixVectorStore, normalize_rows, top_k_indices
+
+
+class FixedEmbeddings:
+    def __init__(self, vector):
+        self.vector = vector
+
+    def embed_query(self, text):
+        return self.vector
+
+
+def test_top_k_indices_sorted_descending():
+    scores = np.array([0.1, 0.9, 0.5, 0.7, 0.3])
+    assert top_k_indices(scores, 3).tolist() == [1, 3, 2]
+    assert top_k_indices(scores, 10).tolist() == [1, 3, 2, 4, 0]
+    assert top_k_indices(scores, 0).tolist() == []
+
+
+def test_top_k_indices_batched():
+    scores = np.array([[0.1, 0.9, 0.5], [0.8, 0.2, 0.4]])
+    assert top_k_indices(scores, 2).tolist() == [[1, 2], [0, 2]]
+
+
+def test_normalize_rows_handles_zero_rows():
+    matrix = normalize_rows(np.array([[3.0, 4.0], [0.0, 0.0]]))
+    np.testing.assert_allclose(matrix, [[0.6, 0.8], [0.0, 0.0]])
+    assert matrix.dtype == np.float32
+
+
+@pytest.fixture
+def store():
+    vectors = np.array([[1, 0], [0.9, 0.1], [0, 1], [0.7, 0.7]], dtype=np.float32)
+    docs = [Document(page_content=str(i)) for i in range(len(vectors))]
+    return MatrixVectorStore(FixedEmbeddings([1.0, 0.0]), docs, vectors)
+
+
+def test_search_returns_cosine_scores(store):
+    results = store.similarity_search_with_score('q', k=2)
+    assert [doc.page_content for doc, _ in results] == ['0', '1']
+    assert results[0][1] == pytest.approx(1.0)
+
+
+def test_masked_rows_are_excluded_before_top_k(store):
+    allowed = np.array([False, True, True, False])
+    results = store.similarity_search_with_score('q', k=2, allowed=allowed)
+    assert [doc.page_content for doc, _ in results] == ['1', '2']
+    batched = store.batch_similarity_search_by_vectors(np.array([[1.0, 0.0], [0.0, 1.0]]), k=1, allowed=allowed)
+    assert [[doc.page_content for doc, _ in row] for row in batched] == [['1'], ['2']]
+
+
+def test_search_rows_respects_mask(store):
+    allowed = np.array([False, True, True, False])
+    rows = store.search_rows('q', k=2, allowed=allowed)
+    assert [row for row, _ in rows] == [1, 2]
+    # 可用行少于k时只返回可用行
+    only_one = np.array([False, False, True, False])
+    assert [row for row, _ in store.search_rows('q', k=3, allowed=only_one)] == [2]
+
+
+def test_normalized_float32_matrix_is_not_copied():
+    vectors = normalize_rows(np.random.default_rng(0).normal(size=(5, 3)))
+    store = MatrixVectorStore(FixedEmbeddings([1.0, 0.0, 0.0]), [Document(page_content='')] * 5, vectors,
+                              normalized=True)
+    assert store.matrix is vectors
+
+
+def test_length_mismatch_raises():
+    with pytest.raises(ValueError):
+        MatrixVectorStore(FixedEmbeddings([1.0]), [Document(page_content='')], np.ones((2, 1)))